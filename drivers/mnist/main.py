@@ -219,11 +219,11 @@ def train(rank, args, model, train_loader, optimizer, epoch, compose, device):
     total_time += stop_time - start_time
     if batch_idx % args.log_interval == 0:
       root_print(rank, 'Train Epoch: {} [{}/{} ({:.0f}%)]\tLoss: {:.6f}\tTime Per Batch {:.6f}'.format(
-        epoch, batch_idx * len(data), len(train_loader.dataset),
+        epoch, batch_idx * len(target), len(train_loader.dataset),
                100. * batch_idx / len(train_loader), loss.item(), total_time / (batch_idx + 1.0)))
 
   root_print(rank, 'Train Epoch: {} [{}/{} ({:.0f}%)]\tLoss: {:.6f}\tTime Per Batch {:.6f}'.format(
-    epoch, (batch_idx + 1) * len(data), len(train_loader.dataset),
+    epoch, (batch_idx + 1) * len(target), len(train_loader.dataset),
            100. * (batch_idx + 1) / len(train_loader), loss.item(), total_time / (batch_idx + 1.0)))
 
 
@@ -419,8 +419,9 @@ def main():
   test_size = int(10000 * args.percent_data)
   train_set = torch.utils.data.Subset(dataset, range(train_size))
   test_set = torch.utils.data.Subset(dataset, range(train_size, train_size + test_size))
-  train_loader = torch.utils.data.DataLoader(train_set, batch_size=args.batch_size, shuffle=False)
-  test_loader = torch.utils.data.DataLoader(test_set, batch_size=args.batch_size, shuffle=False)
+  # only rank 0 loads the images, the other ranks get the batch size and targets
+  train_loader = torchbraid.utils.lp_data_loader(train_set, comm, batch_size=args.batch_size, shuffle=False)
+  test_loader = torchbraid.utils.lp_data_loader(test_set, comm, batch_size=args.batch_size, shuffle=False)
 
   root_print(rank, '')
 
@@ -0,0 +1,121 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+# Compare the default (rank based) and the topology aware data x layer parallel
+# layouts. For each layout the estimated intra/inter node message volume is
+# reported, and the time for the layer-parallel neighbor exchange (done every 
+# MGRIT iteration) and the data-parallel gradient allreduce (done every batch)
+# is measured.
+#
+# Example:
+#   mpirun -n 8 python topology_scaling.py --splitting 2
+
+import argparse
+import time
+
+import torch
+
+from mpi4py import MPI
+
+from torchbraid.utils.data_parallel import split_communicator, split_communicator_topology, message_volume, node_ids
+
+# only print on rank==0
+def root_print(rank,s):
+  if rank==0:
+    print(s)
+
+def time_lp_exchange(comm_lp,numel,iters):
+  rank = comm_lp.Get_rank()
+  size = comm_lp.Get_size()
+
+  send = torch.rand(numel)
+  recv = [torch.zeros(numel),torch.zeros(numel)]
+
+  comm_lp.Barrier()
+  start = time.perf_counter()
+  for i in range(iters):
+    requests = []
+    for k,neighbor in enumerate([rank-1,rank+1]):
+      if 0<=neighbor<size:
+        requests += [comm_lp.Irecv(recv[k],source=neighbor,tag=11)]
+        requests += [comm_lp.Isend(send,dest=neighbor,tag=11)]
+    MPI.Request.Waitall(requests)
+  return (time.perf_counter()-start)/iters
+
+def time_dp_allreduce(comm_dp,numel,iters):
+  buf = torch.rand(numel)
+
+  comm_dp.Barrier()
+  start = time.perf_counter()
+  for i in range(iters):
+    comm_dp.Allreduce(MPI.IN_PLACE,buf,op=MPI.SUM)
+  return (time.perf_counter()-start)/iters
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--splitting", type=int, default=2,       help="number of data parallel processes")
+  parser.add_argument("--lp-numel",  type=int, default=2**18,   help="number of floats in a layer parallel message (a C-point state)")
+  parser.add_argument("--dp-numel",  type=int, default=2**20,   help="number of floats in the data parallel allreduce (the gradient)")
+  parser.add_argument("--lp-iters",  type=int, default=100,     help="number of layer parallel exchanges timed")
+  parser.add_argument("--dp-iters",  type=int, default=10,      help="number of data parallel allreduces timed")
+  args = parser.parse_args()
+
+  comm = MPI.COMM_WORLD
+  rank = comm.Get_rank()
+
+  if comm.Get_size() % args.splitting!=0:
+    root_print(rank,'error: the processor count must be a multiple of --splitting')
+    return
+
+  nodes = node_ids(comm)
+  root_print(rank,'processors = {}, nodes = {}, splitting = {}'.format(comm.Get_size(),len(set(nodes)),args.splitting))
+
+  layouts = [('rank',split_communicator),('topology',split_communicator_topology)]
+  for name,splitter in layouts:
+    comm_dp,comm_lp = splitter(comm,args.splitting)
+
+    volume = message_volume(comm,comm_dp,comm_lp,4*args.lp_numel,4*args.dp_numel)
+
+    lp_time = comm.allreduce(time_lp_exchange(comm_lp,args.lp_numel,args.lp_iters),op=MPI.MAX)
+    dp_time = comm.allreduce(time_dp_allreduce(comm_dp,args.dp_numel,args.dp_iters),op=MPI.MAX)
+
+    root_print(rank,'\nlayout: {}'.format(name))
+    for kind in ['lp','dp']:
+      intra = volume[kind]['intra_node']/2**20
+      inter = volume[kind]['inter_node']/2**20
+      root_print(rank,'  {} volume (MiB): intra-node = {:.2f}, inter-node = {:.2f}'.format(kind,intra,inter))
+    root_print(rank,'  lp exchange time = {:.4e} s, dp allreduce time = {:.4e} s'.format(lp_time,dp_time))
+
+    comm_dp.Free()
+    comm_lp.Free()
+
+if __name__ == '__main__':
+  main()
@@ -67,7 +67,7 @@ import cProfile
 from torchvision import datasets, transforms
 from timeit import default_timer as timer
 
-from torchbraid.utils import MeanInitialGuessStorage
+from torchbraid.utils import MeanInitialGuessStorage, lp_data_loader
 from utils import parse_args, buildNet, ParallelNet, SerialNet, getComm, git_rev, getDevice, get_lr_scheduler, MPI
 
 
@@ -110,8 +110,7 @@ def train(rank, args, model, train_loader, optimizer, epoch, compose, device, mi
 
     if mig_storage is not None and isinstance(model, ParallelNet):
       times, states = model.parallel_nn.getFineTimePoints()
-      for t, state in zip(times, states):
-        mig_storage.addState(t, state.tensors(), target)     
+      mig_storage.addStates(times, [state.tensors() for state in states], target)
     
 
     # compute loss
@@ -222,63 +221,16 @@ def test(rank, args, model, test_loader, epoch, compose, device, prefix=''):
   return 100. * correct / len(test_loader.dataset)
 
 
-class FakeIter:
-  def __init__(self, cnt, elmt, last_elmt):
-    self.cnt = cnt
-    self.elmt = elmt
-    self.last_elmt = last_elmt
-
-  def __iter__(self):
-    return self
-
-  def __next__(self):
-    if self.cnt > 1:
-      self.cnt -= 1
-      return self.elmt
-    elif self.cnt == 1:
-      self.cnt -= 1
-      return self.last_elmt
-    else:
-      raise StopIteration
-
 def batch_size(ten):
   """
-  This convenience function is used in conjunction with the data loader (and FakeLoader used
-  in parallel) to extract a batch size. This is then used internally within torchbraid to optimize
+  This convenience function is used in conjunction with the data loader (and the placeholder
+  batches of lp_data_loader) to extract a batch size. This is then used internally within torchbraid to optimize
   the computation of shapes.
   """
   if ten.dim()==0:
     return int(ten.item())
   return ten.shape[0]
 
-class FakeLoader:
-  def __init__(self, batches, items,batch_size, device):
-    self.batches = batches
-
-    elmt = torch.tensor((batch_size), device=device)
-    self.elmt = (elmt, elmt)
-
-    # the last batch size can be the actual batchsize,
-    # or some smaller fraction 
-    if items % batch_size==0:
-      last_batch = batch_size
-    else:
-      last_batch = items % batch_size
-
-    last_elmt = torch.tensor((last_batch), device=device)
-    self.last_elmt = (last_elmt, last_elmt)
-
-    self.dataset = batches * [None]
-
-  def __iter__(self):
-    return FakeIter(self.batches, self.elmt,self.last_elmt)
-
-def parallel_loader(rank, loader, device):
-  if rank == 0:
-    return loader
-  batches = len(loader)
-  return FakeLoader(batches, len(loader.dataset), loader.batch_size, device)
-
 
 def main():
   ##
@@ -333,22 +285,17 @@ def main():
   train_dataset = torch.utils.data.Subset(train_dataset, range(train_size))
   test_dataset = torch.utils.data.Subset(test_dataset, range(test_size))
 
-  # this is to ensure the seeds are consistent
-  gen_train = torch.Generator()
-  gen_train.manual_seed(args.seed)
-
-  # Create data loaders
-  train_loader = torch.utils.data.DataLoader(train_dataset,
-                                             batch_size=args.batch_size,
-                                             shuffle=True,
-                                             pin_memory=True,
-                                             generator=gen_train)
-  train_loader = parallel_loader(rank, train_loader, my_device)
-  test_loader = torch.utils.data.DataLoader(test_dataset,
-                                            batch_size=args.batch_size,
-                                            shuffle=False,
-                                            pin_memory=True)
-  test_loader = parallel_loader(rank, test_loader, my_device)
+  # Create data loaders, only rank 0 loads the images, the other ranks get the batch size and targets.
+  # The shuffle is seeded with args.seed+epoch, so it is consistent over the ranks
+  train_loader = lp_data_loader(train_dataset, comm,
+                                batch_size=args.batch_size,
+                                shuffle=True,
+                                seed=args.seed,
+                                pin_memory=True)
+  test_loader = lp_data_loader(test_dataset, comm,
+                               batch_size=args.batch_size,
+                               shuffle=False,
+                               pin_memory=True)
   if rank == 0:
     print("\nTraining setup:  Batch size:  " + str(args.batch_size) + "  Sample ratio:  " + str(
       args.samp_ratio) + "  Epochs:  " + str(args.epochs))
@@ -417,7 +364,7 @@ def main():
   mig_storage = None
 
   if args.mig_storage is not None:
-    mig_storage = MeanInitialGuessStorage(class_count=200, average_weight=args.mig_storage)
+    mig_storage = MeanInitialGuessStorage(class_count=200, average_weight=args.mig_storage, dt=args.tf/args.steps)
 
   scheduler = None
 
@@ -482,6 +429,7 @@ def main():
   np.random.seed(args.seed)
 
   for epoch in range(1, args.epochs + 1):
+    train_loader.sampler.set_epoch(epoch)
     start_time = timer()
     train(rank, args, model, train_loader, optimizer, epoch, compose, my_device, mig_storage)
     end_time = timer()
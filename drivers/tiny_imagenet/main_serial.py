@@ -256,7 +256,7 @@ def main():
   epoch_times = []
   test_times = []
 
-  mig_storage = MeanInitialGuessStorage(class_count=200,average_weight=0.9)
+  mig_storage = MeanInitialGuessStorage(class_count=200,average_weight=0.9,dt=args.tf/args.steps)
 
   for epoch in range(1, args.epochs + 1):
     start_time = timer()
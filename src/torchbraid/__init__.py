@@ -1,5 +1,32 @@
+import importlib
+
 from .layer_parallel import LayerParallel
 from .utils import getDevice
-from .gru_layer_parallel import GRU_Parallel, GRU_Serial
-from .test_fixtures import test_cbs
 from .braid_vector import BraidVector
+
+# These attributes are loaded on first access (PEP 562). Every rank pays the
+# cost of "import torchbraid" at launch, so the GRU modules, MG/Opt and the
+# compiled test fixtures are only imported by the codes that need them.
+_lazy_attributes = {
+  'GRU_Parallel' : ('.gru_layer_parallel','GRU_Parallel'),
+  'GRU_Serial'   : ('.gru_layer_parallel','GRU_Serial'),
+  'test_cbs'     : ('.test_fixtures.test_cbs',None),
+  'mgopt'        : ('.mgopt',None),
+}
+
+__all__ = ['LayerParallel','getDevice','BraidVector'] + list(_lazy_attributes.keys())
+
+def __getattr__(name):
+  if name not in _lazy_attributes:
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+  module_name,attr = _lazy_attributes[name]
+  module = importlib.import_module(module_name,__name__)
+  value = module if attr is None else getattr(module,attr)
+
+  # cache the result so __getattr__ is not called again
+  globals()[name] = value
+  return value
+
+def __dir__():
+  return sorted(list(globals().keys()) + list(_lazy_attributes.keys()))
@@ -0,0 +1,361 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import os
+import json
+import hashlib
+import itertools
+
+import torch
+
+from timeit import default_timer as timer
+from mpi4py import MPI
+
+from torchbraid.utils import compute_levels, root_print
+
+__all__ = ['MGRITAutoTuner']
+
+class MGRITAutoTuner:
+  """
+  Choose the MGRIT parameters of a layer parallel module by timing calibration batches.
+
+  Each configuration in the search space is applied to the module, and a few
+  calibration batches are run forward and backward. The wall time, and the relative
+  deviation of the output and the parameter gradients from a reference solution are
+  measured. The reference is computed using a single level (a sequential time step
+  sweep, exact in one iteration). The fastest configuration whose deviation is below
+  the tolerance is applied to the module.
+
+  The decision can be persisted to a JSON cache file keyed by the model signature,
+  the number of ranks and the batch size. Later runs with the same key apply the 
+  cached configuration without calibration.
+
+  A configuration is a dictionary with the keys:
+    levels          : maximum number of MGRIT levels (forward and backward)
+    cfactor         : coarsening factor
+    max_iters       : maximum number of MGRIT iterations (forward and backward)
+    nrelax          : number of FC relaxation sweeps on the coarse levels
+    skip_downcycle  : skip the work on the first down cycle
+  """
+
+  def __init__(self,lp_module,search_space=None,tolerance=1e-3,num_trials=2,cache_file=None,min_coarse=2,print_level=0):
+    """
+    Constructor.
+
+      Parameters:
+        lp_module (LPModule): The layer parallel module to be tuned
+        search_space (dict): Dictionary mapping configuration keys to a list of
+                             values to try. Missing keys use the default search space.
+        tolerance (float): Maximum relative deviation of the output and gradient
+        num_trials (int): Number of timed passes over the calibration batches
+        cache_file (str): Name of the JSON file to persist decisions (None disables caching)
+        min_coarse (int): Minimum number of time steps on the coarsest level
+        print_level (int): 0 = no output, 1 = decision, 2 = every configuration
+    """
+    self.lp_module = lp_module
+    self.tolerance = tolerance
+    self.num_trials = num_trials
+    self.cache_file = cache_file
+    self.min_coarse = min_coarse
+    self.print_level = print_level
+
+    self.comm = lp_module.getMPIComm()
+
+    self.search_space = self.defaultSearchSpace()
+    if search_space is not None:
+      self.search_space.update(search_space)
+
+    self.results = []
+
+  def defaultSearchSpace(self):
+    num_steps = self.lp_module.fwd_app.getNumSteps()
+    max_levels = max(compute_levels(num_steps,self.min_coarse,2),1)
+    return {'levels'         : list(range(2,max_levels+1)),
+            'cfactor'        : [2,4],
+            'max_iters'      : [1,2,3],
+            'nrelax'         : [0,1],
+            'skip_downcycle' : [True]}
+
+  def candidates(self):
+    """
+    Build the list of configurations from the search space, removing those
+    that coarsen below the minimum coarse size.
+    """
+    num_steps = self.lp_module.fwd_app.getNumSteps()
+    keys = sorted(self.search_space.keys())
+
+    result = []
+    for values in itertools.product(*[self.search_space[k] for k in keys]):
+      config = dict(zip(keys,values))
+      if config['levels']>compute_levels(num_steps,self.min_coarse,config['cfactor']):
+        continue
+      result += [config]
+    return result
+
+  def getConfig(self):
+    """
+    Get the current configuration of the layer parallel module.
+    """
+    fwd_app = self.lp_module.fwd_app
+    bwd_app = self.lp_module.bwd_app
+    return {'fwd_levels'     : fwd_app.getMaxLevels(),
+            'bwd_levels'     : bwd_app.getMaxLevels(),
+            'fwd_cfactor'    : fwd_app.getCFactor(),
+            'bwd_cfactor'    : bwd_app.getCFactor(),
+            'fwd_max_iters'  : fwd_app.getMaxIters(),
+            'bwd_max_iters'  : bwd_app.getMaxIters(),
+            'fwd_nrelax'     : fwd_app.getNumRelax(),
+            'bwd_nrelax'     : bwd_app.getNumRelax(),
+            'fwd_nrelax_levels' : dict(fwd_app.nrelax_levels),
+            'bwd_nrelax_levels' : dict(bwd_app.nrelax_levels),
+            'fwd_skip'       : fwd_app.getSkipDowncycle(),
+            'bwd_skip'       : bwd_app.getSkipDowncycle()}
+
+  def restoreConfig(self,saved):
+    """
+    Restore a configuration saved with getConfig.
+    """
+    for prefix,app in [('fwd',self.lp_module.fwd_app),('bwd',self.lp_module.bwd_app)]:
+      app.setMaxLevels(saved[prefix+'_levels'])
+      app.setCFactor(saved[prefix+'_cfactor'])
+      app.setMaxIters(saved[prefix+'_max_iters'])
+      app.setSkipDowncycle(saved[prefix+'_skip'])
+
+      # reset the levels of the hierarchy to their saved value, the fine
+      # level defaults to F-relaxation (see BraidApp.initCore)
+      nrelax = saved[prefix+'_nrelax']
+      nrelax_levels = saved[prefix+'_nrelax_levels']
+      for level in range(app.getMaxLevels()):
+        app.setNumRelax(nrelax_levels.get(level,0 if level==0 else nrelax),level=level)
+      app.nrelax = nrelax
+      app.nrelax_levels = dict(nrelax_levels)
+
+  def applyConfig(self,config):
+    """
+    Apply a configuration to the layer parallel module.
+    """
+    m = self.lp_module
+    m.setMaxLevels(config['levels'])
+    m.setCFactor(config['cfactor'])
+    m.setMaxIters(config['max_iters'])
+    m.setSkipDowncycle(config['skip_downcycle'])
+
+    # the fine level keeps its relaxation
+    for app in [m.fwd_app,m.bwd_app]:
+      for level in range(1,config['levels']):
+        app.setNumRelax(config['nrelax'],level=level)
+
+  def signature(self,batch_size):
+    """
+    Build the cache key, from the model signature, the number of ranks and the batch size.
+    """
+    fwd_app = self.lp_module.fwd_app
+
+    param_count = sum(p.numel() for p in self.lp_module.parameters())
+    param_count = self.comm.allreduce(param_count,op=MPI.SUM)
+
+    model_sig = {'class'     : type(self.lp_module).__name__,
+                 'num_steps' : fwd_app.getNumSteps(),
+                 'Tf'        : fwd_app.Tf,
+                 'counts'    : list(fwd_app.layers_data_structure.counts),
+                 'shapes'    : [list(s) for s in fwd_app.getShape()],
+                 'params'    : param_count}
+    digest = hashlib.sha1(json.dumps(model_sig,sort_keys=True).encode('utf-8')).hexdigest()
+
+    return '{}-np{}-bs{}'.format(digest,self.comm.Get_size(),batch_size)
+
+  def readCache(self):
+    cache = None
+    if self.comm.Get_rank()==0:
+      cache = dict()
+      if self.cache_file is not None and os.path.exists(self.cache_file):
+        with open(self.cache_file,'r') as f:
+          cache = json.load(f)
+    return self.comm.bcast(cache,root=0)
+
+  def writeCache(self,key,config):
+    if self.cache_file is None or self.comm.Get_rank()!=0:
+      return
+
+    cache = dict()
+    if os.path.exists(self.cache_file):
+      with open(self.cache_file,'r') as f:
+        cache = json.load(f)
+    cache[key] = config
+
+    # write to a temporary so readers never see a partial file
+    tmp_file = self.cache_file+'.tmp'
+    with open(tmp_file,'w') as f:
+      json.dump(cache,f,indent=2,sort_keys=True)
+    os.replace(tmp_file,self.cache_file)
+
+  def run(self,batches,force=False):
+    """
+    Tune the layer parallel module.
+
+      Parameters:
+        batches (list): Calibration inputs to the layer parallel module. On ranks
+                        other than zero, these can be 0-d tensors holding the batch size.
+        force (bool): If True ignore the cache and recalibrate
+
+      Returns:
+        The chosen configuration (a dictionary), this has already been applied.
+    """
+    m = self.lp_module
+    rank = self.comm.Get_rank()
+
+    # make sure the shapes are available for the signature
+    with torch.no_grad():
+      m(batches[0])
+
+    batch_size = m.fwd_app.batchSize(batches[0])
+    key = self.signature(batch_size)
+
+    cache = self.readCache()
+    if not force and key in cache:
+      config = cache[key]
+      self.applyConfig(config)
+      root_print(rank,self.print_level,1,'AutoTune: using cached configuration {}'.format(config))
+      return config
+
+    # store the state that calibration will change
+    saved_config = self.getConfig()
+    saved_training = m.training
+    saved_buffers = [b.detach().clone() for b in m.buffers()]
+
+    m.train()
+
+    # the reference is a single level, sequential sweep
+    self.applyConfig({'levels' : 1, 'cfactor' : 2, 'max_iters' : 1, 'nrelax' : 0, 'skip_downcycle' : False})
+    grad_outputs = self.buildGradOutputs(batches)
+    ref_outputs,ref_grads = self.evaluate(batches,grad_outputs)
+
+    self.results = []
+    best = None
+    for config in self.candidates():
+      self.applyConfig(config)
+
+      # run once to allocate, then time
+      self.evaluate(batches,grad_outputs)
+
+      self.comm.Barrier()
+      start = timer()
+      for i in range(self.num_trials):
+        outputs,grads = self.evaluate(batches,grad_outputs)
+      elapsed = self.comm.allreduce((timer()-start)/self.num_trials,op=MPI.MAX)
+
+      out_err  = self.outputError(outputs,ref_outputs)
+      grad_err = self.gradError(grads,ref_grads)
+
+      result = dict(config)
+      result.update({'time' : elapsed, 'output_error' : out_err, 'grad_error' : grad_err})
+      self.results += [result]
+
+      root_print(rank,self.print_level,2,'AutoTune: {} time = {:.4e} output err = {:.4e} grad err = {:.4e}'.format(config,elapsed,out_err,grad_err))
+
+      if max(out_err,grad_err)<=self.tolerance and (best is None or elapsed<best[0]):
+        best = (elapsed,config)
+
+    # restore the state changed in calibration
+    with torch.no_grad():
+      for b,s in zip(m.buffers(),saved_buffers):
+        b.copy_(s)
+    m.zero_grad()
+    m.train(saved_training)
+
+    if best is None:
+      root_print(rank,self.print_level,1,'AutoTune: no configuration satisfied tolerance {:.2e}, keeping current'.format(self.tolerance))
+      self.restoreConfig(saved_config)
+      return None
+
+    config = best[1]
+    self.applyConfig(config)
+    self.writeCache(key,config)
+
+    root_print(rank,self.print_level,1,'AutoTune: chose {} time = {:.4e}'.format(config,best[0]))
+
+    return config
+
+  def buildGradOutputs(self,batches):
+    """
+    Build a fixed (seeded) adjoint for each batch, used to run the backward pass.
+    """
+    generator = torch.Generator()
+    generator.manual_seed(2718281)
+
+    grad_outputs = []
+    with torch.no_grad():
+      for x in batches:
+        y = self.lp_module(x)
+        w = torch.rand(y.shape,generator=generator).to(y.device)
+        grad_outputs += [w]
+    return grad_outputs
+
+  def evaluate(self,batches,grad_outputs):
+    """
+    Run the calibration batches forward and backward, returning the outputs 
+    and the local parameter gradients.
+    """
+    m = self.lp_module
+    outputs = []
+    grads = []
+    for x,w in zip(batches,grad_outputs):
+      m.zero_grad()
+      y = m(x)
+      y.backward(w)
+
+      outputs += [y.detach().clone()]
+      grads += [[p.grad.detach().clone() for p in m.parameters() if p.grad is not None]]
+    return outputs,grads
+
+  def outputError(self,outputs,ref_outputs):
+    """
+    Relative error of the output, this is computed on rank 0 and broadcast.
+    """
+    err = 0.0
+    if self.comm.Get_rank()==0:
+      for y,r in zip(outputs,ref_outputs):
+        err = max(err,(torch.norm(y-r)/max(torch.norm(r).item(),1e-300)).item())
+    return self.comm.bcast(err,root=0)
+
+  def gradError(self,grads,ref_grads):
+    """
+    Relative error of the parameter gradient over all ranks.
+    """
+    err = 0.0
+    for g,r in zip(grads,ref_grads):
+      diff = sum([torch.sum((gg-rr)**2).item() for gg,rr in zip(g,r)])
+      norm = sum([torch.sum(rr**2).item() for rr in r])
+      diff = self.comm.allreduce(diff,op=MPI.SUM)
+      norm = self.comm.allreduce(norm,op=MPI.SUM)
+      err = max(err,(diff/max(norm,1e-300))**0.5)
+    return err
+# end MGRITAutoTuner
@@ -97,11 +97,11 @@ class BraidFunction(torch.autograd.Function):
     # broadcast the output of the last layer
     if num_ranks>1:
       if my_rank==num_ranks-1:
-        req = comm.Isend(result,dest=0)
-        req.Wait()
+        req = fwd_app.getTensorComm().isend(result,dest=0)
+        req.wait()
       elif my_rank==0:
-        req = comm.Irecv(result,source=num_ranks-1)
-        req.Wait()
+        req = fwd_app.getTensorComm().irecv(result,source=num_ranks-1)
+        req.wait()
 
     if adjusting:
       return result[0:temp_batch,:]
@@ -119,11 +119,11 @@ class BraidFunction(torch.autograd.Function):
       if my_rank==0:
         if ctx.fwd_app.use_cuda:
           torch.cuda.synchronize()
-        req = comm.Isend(grad_output,dest=num_ranks-1)
-        req.Wait()
+        req = ctx.bwd_app.getTensorComm().isend(grad_output,dest=num_ranks-1)
+        req.wait()
       elif my_rank==num_ranks-1: 
-        req = comm.Irecv(grad_output,source=0)
-        req.Wait()
+        req = ctx.bwd_app.getTensorComm().irecv(grad_output,source=0)
+        req.wait()
 
     if my_rank==num_ranks-1:
       if ctx.adjusting:
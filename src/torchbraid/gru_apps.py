@@ -73,6 +73,9 @@ class ForwardBraidApp(BraidApp):
     self.backpropped = dict()
     self.seq_x_reduced = dict()
 
+    # compiles the calls to the GRU model, see setStepCompiler
+    self.compiler = None
+
     self.has_fastforward = hasattr(self.GRU_models,'fastForward')
     self.fastforward_time  = 0.0
     self.fastforward_calls = 0
@@ -112,9 +115,38 @@ class ForwardBraidApp(BraidApp):
       else:
         seq_x_reduce = self.seq_x_reduced[tstart]
 
-      return self.GRU_models.fastForward(level,tstart,tstop,seq_x_reduce,u)
+      return self.callModel('fastForward',level,tstart,tstop,seq_x_reduce,u)
     else:
-      return self.GRU_models(level,tstart,tstop,seq_x,u)
+      return self.callModel('forward',level,tstart,tstop,seq_x,u)
+
+  def setStepCompiler(self,compiler):
+    """
+    Compile the calls to the GRU model with a StepCompiler, None evaluates them eagerly.
+
+    The compiled steps are specialized on the level and the step size, and are
+    called with tstart=0 and tstop=tstop-tstart. So the model must depend on
+    the time only through the step size (as the GRU cells here do).
+    """
+    self.compiler = compiler
+
+  def callModel(self,name,level,tstart,tstop,x,u):
+    """
+    Call the method "name" (forward or fastForward) of the GRU model, compiled if a 
+    compiler is set.
+    """
+    method = getattr(self.GRU_models,name)
+    if self.compiler is None or not self.compiler.available:
+      return method(level,tstart,tstop,x,u)
+
+    dt = tstop-tstart
+    key = (name,level,dt,self.GRU_models.training,self.compiler.featureKey(x))
+
+    def build():
+      def step(x,u):
+        return method(level,0.0,dt,x,u)
+      return step
+
+    return self.compiler(key,build,x,u)
 
   def timer(self,name):
     return self.timer_manager.timer("ForWD::"+name)
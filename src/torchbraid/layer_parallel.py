@@ -31,6 +31,7 @@
 
 import inspect
 
+import torch
 import torch.nn as nn
 
 from mpi4py import MPI
@@ -77,6 +78,12 @@ class LayerParallel(LPModule):
     blocks with global_steps greater than 1, the layer is treated as a NODE. Note that the time
     step used doesn't really care about this, and if you sum the global steps (say equal to N_total),
     then dt=Tf/N_total.
+
+    spatial_ref_pair is a pair of callables (coarsen,refine), or a SpatialRefPair, used to
+    coarsen the features on the coarse levels. coarsen(x,level) maps the features on level to
+    level+1, and refine(x,level) maps the features on level+1 back to level. Note that refine
+    used to be passed XBraid's refinement count (NRefine) instead, so user defined refine 
+    callables that depend on the level must be updated.
     """
     super().__init__(comm)
 
@@ -97,6 +104,9 @@ class LayerParallel(LPModule):
 
     self.dt = self.fwd_app.dt
 
+    # per sample initial guesses, see enableWarmStart
+    self.warm_start = None
+
   # end __init__
 
   def makeList(self,data):
@@ -131,6 +141,111 @@ class LayerParallel(LPModule):
     """
     self.fwd_app.stateInitialGuess(intitial_guess)
 
+  def enableWarmStart(self,num_samples,max_samples=None,half_precision=False,filename=None):
+    """
+    Use the states from the previous visit to each sample as the initial
+    guess of the forward solve.
+
+    After each forward solve in training mode the states at the local time points
+    are stored for the samples in the batch, keyed by their dataset indices. The
+    indices for each batch must be passed to setWarmStartIndices before calling
+    forward, they are cleared after the forward. A forward without indices (e.g.
+    an evaluation batch) uses the default initial guess. This replaces any initial
+    guess set with setFwdInitialGuess.
+
+    num_samples: Number of samples in the dataset
+    max_samples: Bound on the number of samples stored, the least recently used is evicted
+    half_precision: Store the states in float16
+    filename: If not None, memory map the states to files "<filename>.<rank>.<i>"
+
+    Returns the WarmStartStorage object.
+    """
+    from torchbraid.utils import WarmStartStorage
+
+    if filename is not None:
+      filename = '{}.{}'.format(filename,self.getMPIComm().Get_rank())
+
+    dtype = torch.float16 if half_precision else torch.float32
+    self.warm_start = WarmStartStorage(num_samples,self.fwd_app.local_num_steps+1,self.dt,
+                                       max_samples=max_samples,dtype=dtype,filename=filename)
+    self.fwd_app.stateInitialGuess(self.warm_start)
+
+    return self.warm_start
+
+  def disableWarmStart(self):
+    if self.warm_start is not None:
+      self.fwd_app.stateInitialGuess(None)
+    self.warm_start = None
+
+  def setWarmStartIndices(self,indices):
+    """
+    Set the dataset indices of the samples in the next batch, see enableWarmStart.
+    """
+    assert self.warm_start is not None, 'Warm start not enabled, call "enableWarmStart"'
+    self.warm_start.setIndices(indices)
+
+  def storeWarmStart(self):
+    """
+    Store the local states of the last forward solve.
+    """
+    app = self.fwd_app
+
+    # the local time points are indexed by integers, the times are only used for lookups
+    first_index = app.getGlobalTimeIndex(app.t0_local)
+
+    times = []
+    states = []
+    for i in range(app.local_num_steps+1):
+      index = first_index+i
+      # the initial condition is never replaced
+      if index==0:
+        continue
+      t = index*app.dt
+      u = app.getUVector(0,t)
+      if u is not None:
+        times += [t]
+        states += [u.tensors()]
+
+    self.warm_start.addStates(times,states)
+
+  def setNativeSolver(self,enable=True,num_threads=1,batched_steps=False):
+    """
+    Use the in process PyTorch MGRIT solver (NativeMGRIT) instead of XBraid for 
+    the forward and backward solves. This is only available on a single processor,
+    and uses the same options (levels, coarsening factor, iterations, tolerance
+    and relaxation) as XBraid.
+
+    enable: Use the native solver if True, XBraid otherwise
+    num_threads: Number of threads evaluating independent C-intervals (the layer evaluations are serialized, see NativeMGRIT)
+    batched_steps: Evaluate the independent forward steps of a sweep together (see BatchedStepEngine)
+    """
+    if not enable:
+      self.fwd_app.setNativeSolver(None)
+      self.bwd_app.setNativeSolver(None)
+      self.fwd_app.setBatchedSteps(False)
+      return
+
+    from torchbraid.native_mgrit import NativeMGRIT
+
+    self.fwd_app.setBatchedSteps(batched_steps)
+    self.fwd_app.setNativeSolver(NativeMGRIT(self.fwd_app,num_threads))
+    self.bwd_app.setNativeSolver(NativeMGRIT(self.bwd_app,num_threads))
+
+  def setLevelPolicy(self,policy):
+    """
+    Evaluate the forward steps on the coarse levels with a LevelExecutionPolicy, 
+    for instance in bfloat16 autocast or with a cheaper surrogate layer. The fine
+    level and the back propagation are unchanged. When telemetry is enabled the 
+    forward records are tagged with the policy, so the iterations, residuals and 
+    step time per level can be compared.
+
+    policy: The LevelExecutionPolicy, or None to evaluate every level with the original layers
+    """
+    self.fwd_app.setLevelPolicy(policy)
+
+  def getLevelPolicy(self):
+    return self.fwd_app.getLevelPolicy()
+
   def setFwdStorage(self, storage):
     self.fwd_app.setStorage(storage)
 
@@ -189,14 +304,50 @@ class LayerParallel(LPModule):
       self.fwd_app.evalNetwork()
       self.bwd_app.evalNetwork()
 
-    return BraidFunction.apply(self.fwd_app,self.bwd_app,extra_args,extra_kwargs,x,*params) 
+    y = BraidFunction.apply(self.fwd_app,self.bwd_app,extra_args,extra_kwargs,x,*params) 
+
+    if self.warm_start is not None:
+      if self.training:
+        self.storeWarmStart()
+
+      # the indices belong to this batch only
+      self.warm_start.clearIndices()
+
+    return y
   # end forward
 
   def to(self, *args, **kwargs):
     result = super().to(*args,**kwargs)
     self.fwd_app.to(*args,**kwargs)
+
+    # the surrogates are rebuilt on the new device
+    if self.fwd_app.level_policy is not None:
+      self.fwd_app.level_policy.clear()
     return result
 
+  def autotune(self,batches,search_space=None,tolerance=1e-3,num_trials=2,cache_file=None,force=False,print_level=0):
+    """
+    Choose and apply the fastest MGRIT configuration (levels, coarsening factor,
+    iterations, relaxation and skipping the down cycle) that reproduces the output
+    and gradient of a sequential solve to within a relative tolerance. 
+
+    batches: List of calibration inputs
+    search_space: Dictionary mapping configuration keys to lists of values, see MGRITAutoTuner
+    tolerance: Maximum relative deviation in the output and gradient
+    num_trials: Number of timed passes over the calibration batches
+    cache_file: JSON file used to persist the decision, keyed by model signature, 
+                number of ranks and batch size
+    force: Ignore the cache and recalibrate
+    print_level: 0 = no output, 1 = decision, 2 = every configuration
+
+    Returns the chosen configuration, or None if no configuration satisfied the tolerance.
+    """
+    from torchbraid.autotune import MGRITAutoTuner
+
+    tuner = MGRITAutoTuner(self,search_space=search_space,tolerance=tolerance,num_trials=num_trials,
+                           cache_file=cache_file,print_level=print_level)
+    return tuner.run(batches,force=force)
+
   def getFineTimePoints(self):
     return self.fwd_app.getTimePoints()
 
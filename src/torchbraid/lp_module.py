@@ -36,7 +36,7 @@ import torch.nn as nn
 
 from mpi4py import MPI
 
-from torchbraid.utils import ContextTimerManager
+from torchbraid.utils import ContextTimerManager, BraidTelemetry, AdaptiveIterationController
 
 import numpy as np
 
@@ -104,6 +104,7 @@ class LPModule(nn.Module):
     self.timer_manager = ContextTimerManager()
 
     self.enable_diagnostics = False
+    self.telemetry_stream = None
 
   def comp_op(self):
     """Short for compose operator, returns a functor that allows contstruction of composite neural 
@@ -175,6 +176,22 @@ class LPModule(nn.Module):
   def getBwdMaxIters(self):
     return self.bwd_app.getMaxIters()
 
+  def setMaxLevels(self,max_levels):
+    self.fwd_app.setMaxLevels(max_levels)
+    self.bwd_app.setMaxLevels(max_levels)
+
+  def setFwdMaxLevels(self,max_levels):
+    self.fwd_app.setMaxLevels(max_levels)
+
+  def setBwdMaxLevels(self,max_levels):
+    self.bwd_app.setMaxLevels(max_levels)
+
+  def getFwdMaxLevels(self):
+    return self.fwd_app.getMaxLevels()
+
+  def getBwdMaxLevels(self):
+    return self.bwd_app.getMaxLevels()
+
   def setCFactor(self,cfactor):
     self.fwd_app.setCFactor(cfactor)
     self.bwd_app.setCFactor(cfactor)
@@ -198,6 +215,19 @@ class LPModule(nn.Module):
   def getMPIComm(self):
     return self.fwd_app.getMPIComm()
 
+  def setTensorComm(self,tensor_comm):
+    """
+    Set the communicator for torchbraid's tensor traffic outside of XBraid: the
+    layer weights, and the boundary states and gradients. For instance a
+    TorchDistributedComm sends these through a torch.distributed process group, 
+    XBraid's own messages still use MPI. If None the MPI communicator is used.
+    """
+    self.fwd_app.setTensorComm(tensor_comm)
+    self.bwd_app.setTensorComm(tensor_comm)
+
+  def getTensorComm(self):
+    return self.fwd_app.getTensorComm()
+
   def getFwdStats(self):
     itr, res = self.fwd_app.getBraidStats()
     return itr,res
@@ -206,6 +236,139 @@ class LPModule(nn.Module):
     itr, res = self.bwd_app.getBraidStats()
     return itr,res
 
+  def enableTelemetry(self,enable=True,filename=None,max_records=1000):
+    """
+    Record convergence and cost telemetry for each forward and backward solve.
+
+    Each solve records the residual history, the number of steps and time spent
+    on each level, the messages and bytes sent, and the time spent in braid_Drive
+    versus the python callbacks. See getTelemetry.
+
+    enable: Turn telemetry on or off
+    filename: If not None, stream the records to the file "<filename>.<rank>.jsonl"
+              with one JSON object per line
+    max_records: Number of records kept in memory for each solve type
+    """
+
+    if self.telemetry_stream is not None:
+      self.telemetry_stream.close()
+      self.telemetry_stream = None
+
+    if not enable:
+      self.fwd_app.setTelemetry(None)
+      self.bwd_app.setTelemetry(None)
+      return
+
+    rank = self.getMPIComm().Get_rank()
+    if filename is not None:
+      self.telemetry_stream = open('{}.{}.jsonl'.format(filename,rank),'w')
+
+    self.fwd_app.setTelemetry(BraidTelemetry('forward',rank,self.telemetry_stream,max_records))
+    self.bwd_app.setTelemetry(BraidTelemetry('backward',rank,self.telemetry_stream,max_records))
+
+    # tag the records with the level policy, so runs can be compared
+    policy = getattr(self.fwd_app,'level_policy',None)
+    if policy is not None:
+      self.fwd_app.getTelemetry().setTag('level_policy',repr(policy))
+
+  def getTelemetry(self):
+    """
+    Get the telemetry records on this processor.
+
+    Returns a dictionary with the keys 'forward' and 'backward', each a list
+    of records (dictionaries) ordered from oldest to newest. The
+    method enableTelemetry must be called prior to this.
+    """
+    fwd = self.fwd_app.getTelemetry()
+    bwd = self.bwd_app.getTelemetry()
+    assert fwd is not None and bwd is not None, 'Telemetry not enabled, call "enableTelemetry"'
+
+    return {'forward' : fwd.getRecords(), 'backward' : bwd.getRecords()}
+
+  def clearTelemetry(self):
+    """
+    Remove the stored telemetry records.
+    """
+    for app in [self.fwd_app,self.bwd_app]:
+      if app.getTelemetry() is not None:
+        app.getTelemetry().clear()
+
+  def enableCompiledSteps(self,enable=True,backend='inductor',mode=None,print_level=0):
+    """
+    Compile the forward step functions with torch.compile (see StepCompiler). 
+
+    A graph is compiled for each step functor, level and feature shape, separately for 
+    the steps evaluated with and without gradients. The batch size may change without
+    recompiling. Steps that fail to compile are evaluated eagerly.
+
+    torch.compile requires PyTorch 2.0 or later. With older versions (including
+    the pinned torch 1.13) this does nothing, the steps are evaluated eagerly.
+
+    enable: Turn compilation on or off
+    backend: The torch.compile backend, the default inductor backend runs on the CPU
+    mode: The torch.compile mode, None for the default
+    print_level: 0 = no output, 1 = report failures, 2 = report every compilation
+
+    Returns the StepCompiler, or None if disabled.
+    """
+    if not enable:
+      self.fwd_app.setStepCompiler(None)
+      return None
+
+    from torchbraid.utils import StepCompiler
+
+    compiler = StepCompiler(backend=backend,mode=mode,print_level=print_level)
+    self.fwd_app.setStepCompiler(compiler)
+    return compiler
+
+  def enableAdaptiveIterations(self,enable=True,fwd_tol=1e-6,bwd_tol=1e-6,fwd_rel_tol=None,bwd_rel_tol=None,
+                               min_iters=1,max_iters=None,hysteresis=2,print_level=0):
+    """
+    Adjust the forward and backward iteration caps and tolerances batch by batch.
+
+    After each solve the residual history is compared to the target. The cap is raised 
+    by one if the target was missed, and lowered by one after "hysteresis" consecutive 
+    solves that reached the target early. The forward and backward solves are controlled
+    independently. See getAdaptiveIterationLog for the decisions made.
+
+    enable: Turn the adaptive control on or off, if off the current caps are kept
+    fwd_tol, bwd_tol: Residual targets for the forward and backward solves
+    fwd_rel_tol, bwd_rel_tol: Optional targets relative to the initial residual, the
+                              tolerance used is the larger of the absolute and relative target
+    min_iters: Smallest iteration cap
+    max_iters: Largest iteration cap, defaults to the larger of the current caps
+    hysteresis: Number of early converging solves before the cap is lowered
+    print_level: If larger than zero, rank 0 prints each change of the cap
+    """
+    if not enable:
+      self.fwd_app.setIterationController(None)
+      self.bwd_app.setIterationController(None)
+      return
+
+    if max_iters is None:
+      max_iters = max(self.fwd_app.getMaxIters(),self.bwd_app.getMaxIters(),min_iters)
+
+    rank = self.getMPIComm().Get_rank()
+    self.fwd_app.setIterationController(AdaptiveIterationController('forward',fwd_tol,fwd_rel_tol,min_iters,max_iters,
+                                                                    hysteresis,rank,print_level))
+    self.bwd_app.setIterationController(AdaptiveIterationController('backward',bwd_tol,bwd_rel_tol,min_iters,max_iters,
+                                                                    hysteresis,rank,print_level))
+
+  def getAdaptiveIterationLog(self):
+    """
+    Get the decisions of the adaptive iteration controllers.
+
+    Returns a dictionary with the keys 'forward' and 'backward', each a list of 
+    records (dictionaries) with the final residual, the iterations needed to
+    reach the tolerance, and the old and new iteration caps and tolerances. The
+    method enableAdaptiveIterations must be called prior to this.
+    """
+    fwd = self.fwd_app.getIterationController()
+    bwd = self.bwd_app.getIterationController()
+    assert fwd is not None and bwd is not None, 'Adaptive iterations not enabled, call "enableAdaptiveIterations"'
+
+    return {'forward' : fwd.getRecords(), 'backward' : bwd.getRecords()}
+
   def getFinalOnRoot(self,vec):
     build_seq_tag = 99        # this
     comm          = self.getMPIComm()
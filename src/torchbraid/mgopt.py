@@ -11,6 +11,7 @@ from __future__ import print_function
 
 import numpy as np
 
+import os
 import sys
 import statistics as stats
 import argparse
@@ -23,6 +24,9 @@ import torch.optim as optim
 import torchbraid
 import torchbraid.utils
 
+# shared with the lighter modules (e.g. autotune), defined in torchbraid.utils
+from torchbraid.utils import compute_levels, root_print
+
 from timeit import default_timer as timer
 
 from mpi4py import MPI
@@ -36,9 +40,47 @@ __all__ = [ 'mgopt_solver','compute_levels','root_print' ]
 
 ##
 # Basic Linear algebra functions
+def storage_ptr(t):
+  ''' Address of the storage backing the tensor t (untyped_storage is only available from PyTorch 2.0) '''
+  if hasattr(t,'untyped_storage'):
+    return t.untyped_storage().data_ptr()
+  return t.storage().data_ptr()
+
+def flat_view(v):
+  ''' 
+  If the tensors in the list v are contiguous and stored back-to-back in one
+  storage (e.g., parameters backed by FlatParameters), return a single 1D tensor
+  viewing all of them.  Otherwise return None. 
+
+  The view is detached, so None is also returned if autograd is tracking v.
+  '''
+  if len(v) == 0 or any((vv is None) or (not vv.is_contiguous()) for vv in v):
+    return None
+  if torch.is_grad_enabled() and any(vv.requires_grad for vv in v):
+    return None
+
+  ptr = storage_ptr(v[0])
+  offset = v[0].storage_offset()
+  for vv in v:
+    if storage_ptr(vv) != ptr or vv.storage_offset() != offset or vv.dtype != v[0].dtype:
+      return None
+    offset += vv.numel()
+
+  start = v[0].storage_offset()
+  return torch.as_strided(v[0].detach(), (offset-start,), (1,), start)
+
+def unflatten_like(flat, w):
+  ''' Split the 1D tensor flat into views shaped like the tensors in the list w '''
+  return [ vv.view_as(ww) for (vv,ww) in zip(torch.split(flat, [ww.numel() for ww in w]), w) ]
+
 def tensor_list_dot(v, w, comm):
   ''' Compute dot product of two vectors, v and w, where each vector is a list of tensors '''
-  my_sum = sum([ torch.dot(vv.flatten(), ww.flatten()) for (vv,ww) in zip(v, w) ])
+  flat_v, flat_w = flat_view(v), flat_view(w)
+  if (flat_v is not None) and (flat_w is not None) and flat_v.shape == flat_w.shape:
+    # one BLAS call instead of a loop over the parameters 
+    my_sum = torch.dot(flat_v, flat_w)
+  else:
+    my_sum = sum([ torch.dot(vv.flatten(), ww.flatten()) for (vv,ww) in zip(v, w) ])
   # For parallel, we just fill my_sum with the global inner-product value (without updating the autograd tape)
   # We assume that this dot-product operation is only ever used for "linear" operations, like the <x_h, v_h> 
   # term inside of MG/Opt, so that this little trick will work.
@@ -55,8 +97,13 @@ def tensor_list_AXPY(alpha, v, beta, w, inplace=False):
   if inplace is True, then w = alpha*v + beta*w
   else, return a new vector equal to alpha*v + beta*w 
   '''
-
-  if inplace:
+  flat_v, flat_w = flat_view(v), flat_view(w)
+  if (flat_v is not None) and (flat_w is not None) and flat_v.shape == flat_w.shape:
+    if inplace:
+      flat_w.mul_(beta).add_(flat_v, alpha=alpha)
+    else:
+      return unflatten_like(alpha*flat_v + beta*flat_w, w)
+  elif inplace:
     for (vv, ww) in zip(v, w):
       ww[:] = alpha*vv + beta*ww
   else:
@@ -64,21 +111,90 @@ def tensor_list_AXPY(alpha, v, beta, w, inplace=False):
 
 def tensor_list_deep_copy(w):
   ''' return a deep copy of the tensor list w '''
+  flat_w = flat_view(w)
+  if flat_w is not None:
+    # a single copy, the result stays flat so later operations are fused
+    return unflatten_like(torch.clone(flat_w), w)
   return [ torch.clone(ww) for ww in w ]
 
+class FlatParameters:
+  '''
+  Back the parameters (and gradients) of a model by single contiguous
+  buffers.  The parameters become views into the buffer, so the tensor_list_*
+  functions above act on the whole model with one BLAS call.
+
+  Gradients can be reallocated by PyTorch (e.g., zero_grad(set_to_none=True)),
+  sync_grads() copies them back into the flat buffer before they are used.
+  '''
+
+  def __init__(self, model):
+    self.params = list(model.parameters())
+    if len(set((p.dtype, p.device) for p in self.params)) > 1:
+      raise ValueError('FlatParameters requires all parameters to have the same dtype and device')
+
+    with torch.no_grad():
+      self.data = torch.cat([p.detach().reshape(-1) for p in self.params])
+      self.grad = torch.zeros_like(self.data)
+      self.param_views = unflatten_like(self.data, self.params)
+      self.grad_views = unflatten_like(self.grad, self.params)
+      for (p, view) in zip(self.params, self.param_views):
+        p.data = view
+
+    # preallocated by save()
+    self.saved = None
+    self.sync_grads()
+
+  def sync_grads(self):
+    ''' Make the parameter gradients views into the flat gradient buffer '''
+    with torch.no_grad():
+      for (p, view) in zip(self.params, self.grad_views):
+        if p.grad is None:
+          view.zero_()
+        elif p.grad.data_ptr() != view.data_ptr():
+          view.copy_(p.grad)
+        else:
+          continue
+        p.grad = view
+    return self.grad
+
+  def save(self):
+    ''' Snapshot the parameters with one copy into a preallocated buffer '''
+    if self.saved is None:
+      self.saved = torch.empty_like(self.data)
+    self.saved.copy_(self.data)
+
+  def restore(self):
+    ''' Write the snapshot from save() back to the parameters '''
+    with torch.no_grad():
+      self.data.copy_(self.saved)
+
+def flatten_params(model):
+  '''
+  Back the parameters of model by a FlatParameters object, stored as
+  model.mgopt_flat_params.  Call this before an optimizer is built for the model.
+  '''
+  model.mgopt_flat_params = FlatParameters(model)
+  return model.mgopt_flat_params
+
 
 ##
 # PyTorch train and test network functions
-def train_epoch(rank, model, train_loader, optimizer, epoch, criterion, criterion_kwargs, compose, log_interval, device, mgopt_printlevel):
+def train_epoch(rank, model, train_loader, optimizer, epoch, criterion, criterion_kwargs, compose, log_interval, device, mgopt_printlevel, prefetch=0,
+                start_batch=0, checkpoint=None):
   '''
   Carry out one complete training epoch
   If "optimizer" is a tuple, use it to create a new optimizer object each batch (i.e., reset the optimizer state each batch)
   Else, just use optimizer to take steps (assume it is a PyTorch optimizer object)
+  If prefetch > 0, that many batches are loaded and moved to device in the background (see BatchStager)
+  If start_batch > 0, the first start_batch batches are skipped (used when restarting from a checkpoint)
+  If checkpoint is not None, checkpoint(batch_idx) is called after each optimizer step
   '''
   model.train()
   
   total_time = 0.0
-  for batch_idx, (data, target) in enumerate(train_loader):
+  for batch_idx, (data, target) in enumerate(staged(train_loader, device, prefetch)):
+    if batch_idx < start_batch:
+      continue
     data = data.to(device)
     target = target.to(device)
 
@@ -100,8 +216,13 @@ def train_epoch(rank, model, train_loader, optimizer, epoch, criterion, criterio
 
     total_time += stop_time-start_time
 
+    if checkpoint is not None:
+      checkpoint(batch_idx)
+
     
-    root_print(rank, mgopt_printlevel, 2, "Batch:  " + str(batch_idx) + "    Loss = " + str(loss.item()) )
+    # loss.item() synchronizes with the device, only do it when printing
+    if mgopt_printlevel >= 2:
+      root_print(rank, mgopt_printlevel, 2, "Batch:  " + str(batch_idx) + "    Loss = " + str(loss.item()) )
     if batch_idx % log_interval == 0:
       root_print(rank, mgopt_printlevel, 2, "\n------------------------------------------------------------------------------")
       root_print(rank, mgopt_printlevel, 1, '  Train Epoch: {} [{}/{} ({:.0f}%)]     \tLoss: {:.9f}\tTime Per Batch {:.6f}'.format(
@@ -117,14 +238,21 @@ def train_epoch(rank, model, train_loader, optimizer, epoch, criterion, criterio
   root_print(rank, mgopt_printlevel, 2, "------------------------------------------------------------------------------\n")
 
 
-def test(rank, model, test_loader, criterion, criterion_kwargs, compose, device, mgopt_printlevel, indent=''):
-  ''' Compute loss and accuracy '''
+def test(rank, model, test_loader, criterion, criterion_kwargs, compose, device, mgopt_printlevel, indent='', max_batches=None, prefetch=0):
+  ''' 
+  Compute loss and accuracy 
+  If max_batches is not None, only the first max_batches batches are evaluated
+  If prefetch > 0, that many batches are loaded and moved to device in the background (see BatchStager)
+  '''
   comm = model.parallel_nn.fwd_app.mpi_comm
   model.eval()
   test_loss = 0
   correct = 0
+  num_samples = 0
   with torch.no_grad():
-    for data, target in test_loader:
+    for batch_idx, (data, target) in enumerate(staged(test_loader, device, prefetch)):
+      if (max_batches is not None) and (batch_idx >= max_batches):
+        break
       data, target = data.to(device), target.to(device)
       output = model(data)
       test_loss += compose(criterion, output, target, **criterion_kwargs).item()
@@ -132,12 +260,83 @@ def test(rank, model, test_loader, criterion, criterion_kwargs, compose, device,
       output = comm.bcast(output,root=0)
       pred = output.argmax(dim=1, keepdim=True)  # get the index of the max log-probability
       correct += pred.eq(target.view_as(pred)).sum().item()
+      num_samples += len(target)
 
-  test_loss /= len(test_loader.dataset)
+  test_loss /= num_samples
 
   root_print(rank, mgopt_printlevel, 1, indent + 'Test set: Average loss: {:.4f}, Accuracy: {}/{} ({:2.2f}%)\n'.format(
-      test_loss, correct, len(test_loader.dataset),
-      100. * correct / len(test_loader.dataset)))
+      test_loss, correct, num_samples,
+      100. * correct / num_samples))
+
+
+def staged(loader, device, prefetch):
+  ''' Wrap loader in a BatchStager staging prefetch batches ahead, if prefetch > 0 '''
+  if prefetch > 0:
+    return torchbraid.utils.BatchStager(loader, device, depth=prefetch)
+  return loader
+
+
+class LazyLoss:
+  '''
+  A loss value computed on rank 0 and broadcast to all ranks only when it is
+  needed.  The loss is kept as a (detached) device tensor, so no device
+  synchronization or communication happens until item() is called, or until
+  start() posts a non-blocking broadcast.  
+
+  All ranks must call item() (or start()) on the same losses, in the same order.
+  Use float(loss) where a decision needs the value, and resolve_losses to
+  reduce a batch of losses together (e.g., per log interval).
+  '''
+  def __init__(self, loss, comm):
+    self.tensor = loss.detach()
+    self.comm = comm
+    self.value = None
+    self.request = None
+    self.buffer = None
+
+  def start(self):
+    ''' Post a non-blocking broadcast of the value from rank 0 '''
+    if self.value is not None or self.request is not None:
+      return
+    if self.comm.Get_size() == 1:
+      self.value = self.tensor.item()
+      return
+
+    self.buffer = np.zeros(1, dtype=np.float64)
+    if self.comm.Get_rank() == 0:
+      self.buffer[0] = self.tensor.item()
+    self.request = self.comm.Ibcast(self.buffer, root=0)
+
+  def item(self):
+    ''' The loss value, identical on all ranks '''
+    if self.value is None:
+      self.start()
+    if self.value is None:
+      self.request.Wait()
+      self.value = float(self.buffer[0])
+      self.request = None
+      self.buffer = None
+    return self.value
+
+  def __float__(self):
+    return self.item()
+
+  def __str__(self):
+    return str(self.item())
+
+  def __format__(self, spec):
+    return format(self.item(), spec)
+
+
+def resolve_losses(losses):
+  ''' 
+  Return the values of a list of losses (LazyLoss or float), posting all
+  the broadcasts before waiting on any of them
+  '''
+  for loss in losses:
+    if isinstance(loss, LazyLoss):
+      loss.start()
+  return [ float(loss) for loss in losses ]
 
 
 def compute_fwd_bwd_pass(lvl, optimizer, model, data, target, criterion, criterion_kwargs, compose, v_h):
@@ -146,7 +345,8 @@ def compute_fwd_bwd_pass(lvl, optimizer, model, data, target, criterion, criteri
   if lvl is 0, no MGOPT term is used
   if lvl > 0, incorporate MGOpt term
 
-  returns the loss as a scalar (i.e., with no tape attached)
+  returns the loss as a LazyLoss (i.e., with no tape attached), the value 
+  is only broadcast from rank 0 when it is used
   '''
   model.train()
 
@@ -164,18 +364,16 @@ def compute_fwd_bwd_pass(lvl, optimizer, model, data, target, criterion, criteri
 
   # Loss is only available on rank 0
   comm = model.parallel_nn.fwd_app.mpi_comm
-  loss_scalar = comm.bcast(loss.item(), root=0)
-
-  return loss_scalar
+  return LazyLoss(loss, comm)
 
 
-def compute_fwd_pass(lvl, model, data, target, criterion, criterion_kwargs, compose, v_h):
+def compute_fwd_loss(lvl, model, data, target, criterion, criterion_kwargs, compose, v_h):
   '''
   Compute a forward pass only to obtain a loss for the model.
   if lvl is 0, no MGOPT term is used
   if lvl > 0, incorporate MGOpt term
 
-  returns the loss as a scalar (i.e., with no tape attached)
+  returns the loss tensor, the value is only correct on rank 0
   '''
   model.eval()
   output = model(data)
@@ -188,11 +386,23 @@ def compute_fwd_pass(lvl, model, data, target, criterion, criterion_kwargs, comp
     loss = compose(criterion, output, target, mgopt_term=mgopt_term, **criterion_kwargs)
   ##
 
+  return loss
+
+
+def compute_fwd_pass(lvl, model, data, target, criterion, criterion_kwargs, compose, v_h):
+  '''
+  Compute a forward pass only to obtain a loss for the model.
+  if lvl is 0, no MGOPT term is used
+  if lvl > 0, incorporate MGOpt term
+
+  returns the loss as a LazyLoss (i.e., with no tape attached), the value 
+  is only broadcast from rank 0 when it is used
+  '''
+  loss = compute_fwd_loss(lvl, model, data, target, criterion, criterion_kwargs, compose, v_h)
+
   # Loss is only available on rank 0
   comm = model.parallel_nn.fwd_app.mpi_comm
-  loss_scalar = comm.bcast(loss.item(), root=0)
-
-  return loss_scalar
+  return LazyLoss(loss, comm)
 
 
 
@@ -204,24 +414,31 @@ def write_params_inplace(model, new_params, grad=False):
   '''
   
   with torch.no_grad():
-    old_params = list(model.parameters())
+    old_params = get_params(model, deep_copy=False, grad=grad)
     
     assert(len(old_params) == len(new_params)) 
+
+    flat_old, flat_new = flat_view(old_params), flat_view(new_params)
+    if (flat_old is not None) and (flat_new is not None) and flat_old.shape == flat_new.shape:
+      flat_old.copy_(flat_new)
+      return
     
     for (op, np) in zip(old_params, new_params):
-      if grad: op.grad[:] = np[:]
-      else:    op[:] = np[:]
+      op[:] = np[:]
 
 def get_params(model, deep_copy=False, grad=False):
   '''
   Get the network parameters
   '''
+  flat = getattr(model, 'mgopt_flat_params', None)
+  if grad and (flat is not None):
+    flat.sync_grads()
+
+  if grad: pp = [params.grad for params in model.parameters() ]
+  else:    pp = [params      for params in model.parameters() ]
+
   if deep_copy:
-    if grad: pp = [torch.clone(params.grad) for params in model.parameters() ]
-    else:    pp = [torch.clone(params)      for params in model.parameters() ]
-  else:
-    if grad: pp = [params.grad for params in model.parameters() ]
-    else:    pp = [params      for params in model.parameters() ]
+    pp = tensor_list_deep_copy(pp)
   ##
 
   return pp
@@ -401,6 +618,7 @@ def tb_parallel_get_injection_restrict_params(model_fine, model_coarse, cf=2, de
   
   Return a list of the restricted model parameters.
   If grad is True, return the network gradient instead
+  If grad is 'both', return a tuple of the parameters and gradient
   '''
  
   if deep_copy == False:
@@ -570,119 +788,139 @@ def tb_injection_interp_network_state(model_fine, model_coarse, cf=2):
   model_fine.parallel_nn.fwd_app.interp_network_state(  model_coarse.parallel_nn.fwd_app, cf )  
   model_fine.parallel_nn.bwd_app.interp_network_state(  model_coarse.parallel_nn.bwd_app, cf )  
 
-def tb_injection_restrict_adam_state(model_fine, model_coarse, opt_fine, opt_coarse, cf=2):
+def release_level(model):
   '''
-  Restrict the Adam optimizer state from fine-grid optimizer (opt_fine) to
-  coarse-grid optimizer (opt_coarse)
+  Release the XBraid state vectors and MPI buffers of the forward and backward
+  apps of model, they are rebuilt by the next solve (see BraidApp.releaseStorage)
   '''
-  
-  ##
-  # The parameters themselves serve as the "dictionary" keys into the Adam
-  # optimizer state.  Thus, we need structured lists of these parameters "indices"
-  #
-  # Opening layer lists for model_fine and model_coarse
-  ol_fine = []
-  ol_coarse = []
-  # Closing layer
-  cl_fine = []
-  cl_coarse = []
-  # Layer parallel
-  lp_fine = []
-  lp_coarse = []
-  
+  model.parallel_nn.fwd_app.releaseStorage()
+  model.parallel_nn.bwd_app.releaseStorage()
+
+def optim_state_keys(optimizer):
+  '''
+  The per-parameter state tensors of the optimizers supported by the
+  optimizer state transfers (Adam, AdamW and SGD)
+  '''
+  if isinstance(optimizer, (optim.Adam, optim.AdamW)):
+    keys = ['exp_avg', 'exp_avg_sq']
+    if any(group.get('amsgrad', False) for group in optimizer.param_groups):
+      keys.append('max_exp_avg_sq')
+    return keys
+  elif isinstance(optimizer, optim.SGD):
+    if all(group.get('momentum', 0) == 0 for group in optimizer.param_groups):
+      return []
+    return ['momentum_buffer']
   ##
-  # Loop over all coarse layers
-  with torch.no_grad():
-    for child in model_coarse.children():
-      
-      # Store as opening, closing, or LP layer
-      name = str(type(child))
-      name = name[ name.rfind('.')+1 : name.rfind('\'') ]
-      if name == 'LayerParallel':
-
-        for layer in child.layer_models: 
-          # Grab this layer's parameters
-          this_layer = [] 
-          for param in layer.parameters():
-            this_layer.append(param)
-          ##
-          lp_coarse.append(this_layer)
+  raise ValueError('Optimizer state transfer supports Adam, AdamW and SGD, not ' + type(optimizer).__name__)
 
-      else:
 
-        # Grab this layer's parameters
-        this_layer = [] 
-        for param in child.parameters():
-          this_layer.append(param)
+def optim_state_supported(opt_fine, opt_coarse):
+  '''
+  True if the optimizer state can be transferred between the two optimizers, see optim_state_keys
+  '''
+  try:
+    return optim_state_keys(opt_fine) == optim_state_keys(opt_coarse)
+  except ValueError:
+    return False
 
-        if name == 'CloseLayer':
-          cl_coarse = this_layer
-        elif name == 'OpenLayer':
-          ol_coarse = this_layer
-        else:
-          output_exception('Layer type needs to be OpenLayer, CloseLayer, or LayerParallel')
 
-  ##
-  # Loop over all fine layers
-  with torch.no_grad():
-    for child in model_fine.children():
-      
-      # Store as opening, closing, or LP layer
-      name = str(type(child))
-      name = name[ name.rfind('.')+1 : name.rfind('\'') ]
-      if name == 'LayerParallel':
-
-        for layer in child.layer_models: 
-          # Grab this layer's parameters
-          this_layer = [] 
-          for param in layer.parameters():
-            this_layer.append(param)
-          ##
-          lp_fine.append(this_layer)
+def tb_parallel_injection_optim_state(model_fine, model_coarse, opt_fine, opt_coarse, cf=2, restrict=True):
+  '''
+  Restrict (restrict is True) the optimizer state from the fine-grid optimizer
+  (opt_fine) to the coarse-grid optimizer (opt_coarse), or interpolate it
+  (restrict is False) from opt_coarse to opt_fine.  
+
+  The layer-parallel state travels with the same parallel layer distribution
+  (and cached TransferPlan) as parallel_injection_restrict_params and
+  parallel_injection_interp_params, with all state tensors packed in one message
+  per processor pair.  The opening and closing layers are copied locally.  The
+  copies into the existing state are a batched _foreach_copy_.
+
+  Supports Adam and AdamW (exp_avg, exp_avg_sq, max_exp_avg_sq and step), and
+  SGD (momentum_buffer).  The step count is the largest over all processors.
+  '''
+  if restrict: 
+    src_model, dst_model, opt_src, opt_dst = model_fine, model_coarse, opt_fine, opt_coarse
+  else:        
+    src_model, dst_model, opt_src, opt_dst = model_coarse, model_fine, opt_coarse, opt_fine
 
-      else:
+  keys = optim_state_keys(opt_src)
+  if keys != optim_state_keys(opt_dst):
+    raise ValueError('Optimizer state transfer requires the same optimizer type and options on both levels')
 
-        # Grab this layer's parameters
-        this_layer = [] 
-        for param in child.parameters():
-          this_layer.append(param)
+  def getter(key):
+    return lambda p: opt_src.state[p].get(key, None) if p in opt_src.state else None
+
+  fwd_app = model_fine.parallel_nn.fwd_app
+  comm = fwd_app.mpi_comm
+  plan = fwd_app.getTransferPlan(model_fine, model_coarse, cf, restrict)
+
+  # layer-parallel state, all keys in one exchange
+  received = plan.exchange([getter(key) for key in keys]) if len(keys) > 0 else []
+  dst_params = plan.receiving_params()
+
+  # opening and closing layers
+  src_other = [p for child in src_model.children() if child is not src_model.parallel_nn for p in child.parameters()]
+  dst_other = [p for child in dst_model.children() if child is not dst_model.parallel_nn for p in child.parameters()]
+  if [p.shape for p in src_other] != [p.shape for p in dst_other]:
+    raise ValueError('Fine and coarse opening and closing layers not compatible in size')
+  for i, key in enumerate(keys):
+    received[i] = received[i] + [getter(key)(p) for p in src_other]
+  dst_params = dst_params + dst_other
+
+  with torch.no_grad():
+    for i, key in enumerate(keys):
+      dst_tensors = []
+      src_tensors = []
+      for p, t in zip(dst_params, received[i]):
+        if t is None:
+          t = torch.zeros_like(p)
+        state = opt_dst.state[p]
+        if state.get(key, None) is None:
+          state[key] = t.clone(memory_format=torch.preserve_format)
+        else:
+          dst_tensors.append(state[key])
+          src_tensors.append(t)
+      ##
+      if hasattr(torch, '_foreach_copy_'):
+        torch._foreach_copy_(dst_tensors, src_tensors)
+      else:
+        for d, s in zip(dst_tensors, src_tensors):
+          d.copy_(s)
 
-        if name == 'CloseLayer':
-          cl_fine = this_layer
-        elif name == 'OpenLayer':
-          ol_fine = this_layer
+    ##
+    # Adam step count
+    if isinstance(opt_src, (optim.Adam, optim.AdamW)):
+      local_step = max([float(state['step']) for state in opt_src.state.values() if 'step' in state], default=0.0)
+      step = comm.allreduce(local_step, op=MPI.MAX)
+      for p in dst_params:
+        state = opt_dst.state[p]
+        if torch.is_tensor(state.get('step', None)):
+          state['step'].fill_(step)
         else:
-          output_exception('Layer type needs to be OpenLayer, CloseLayer, or LayerParallel')
+          state['step'] = torch.tensor(step)
+
+
+def tb_parallel_injection_restrict_optim_state(model_fine, model_coarse, opt_fine, opt_coarse, cf=2):
+  '''
+  Restrict the optimizer state from opt_fine to opt_coarse, see tb_parallel_injection_optim_state
+  '''
+  tb_parallel_injection_optim_state(model_fine, model_coarse, opt_fine, opt_coarse, cf=cf, restrict=True)
 
-  ##
-  # Sanity check on network sizes
-  if( len(cl_fine) != len(cl_coarse)):
-      raise ValueError('Fine and coarse closing layer not compatible in size')
-  if( len(ol_fine) != len(ol_coarse)):
-      raise ValueError('Fine and coarse opening layer not compatible in size')
-  if( len(lp_fine)/cf != len(lp_coarse)):
-      raise ValueError('Fine and coarse ODE layer parallel not compatible in size')
-  
-  ##       
-  # Copy opening and closing layers
-  for pfine, pcoarse in zip(cl_fine, cl_coarse):
-    (opt_coarse.state[pcoarse])['exp_avg'][:] = (opt_fine.state[pfine])['exp_avg'][:]
-    (opt_coarse.state[pcoarse])['exp_avg_sq'][:] = (opt_fine.state[pfine])['exp_avg_sq'][:]
-    (opt_coarse.state[pcoarse])['step'] = (opt_fine.state[pfine])['step']
-  
-  for pfine, pcoarse in zip(ol_fine, ol_coarse):
-    (opt_coarse.state[pcoarse])['exp_avg'][:] = (opt_fine.state[pfine])['exp_avg'][:]
-    (opt_coarse.state[pcoarse])['exp_avg_sq'][:] = (opt_fine.state[pfine])['exp_avg_sq'][:]
-    (opt_coarse.state[pcoarse])['step'] = (opt_fine.state[pfine])['step']
-  
-  ##
-  # Copy over the coarsened ODE layer parallel
-  for layer_fine, layer_coarse in zip(lp_fine[::cf], lp_coarse):
-    for pfine, pcoarse in zip(layer_fine, layer_coarse):
-      (opt_coarse.state[pcoarse])['exp_avg'][:] = (opt_fine.state[pfine])['exp_avg'][:]
-      (opt_coarse.state[pcoarse])['exp_avg_sq'][:] = (opt_fine.state[pfine])['exp_avg_sq'][:]
-      (opt_coarse.state[pcoarse])['step'] = (opt_fine.state[pfine])['step']
 
+def tb_parallel_injection_interp_optim_state(model_fine, model_coarse, opt_fine, opt_coarse, cf=2):
+  '''
+  Interpolate the optimizer state from opt_coarse to opt_fine, see tb_parallel_injection_optim_state
+  '''
+  tb_parallel_injection_optim_state(model_fine, model_coarse, opt_fine, opt_coarse, cf=cf, restrict=False)
+
+
+def tb_injection_restrict_adam_state(model_fine, model_coarse, opt_fine, opt_coarse, cf=2):
+  '''
+  Restrict the Adam optimizer state from fine-grid optimizer (opt_fine) to
+  coarse-grid optimizer (opt_coarse), see tb_parallel_injection_optim_state
+  '''
+  tb_parallel_injection_optim_state(model_fine, model_coarse, opt_fine, opt_coarse, cf=cf, restrict=True)
 
 
 
@@ -847,10 +1085,86 @@ def tb_simple_weighting(lvl, e_h, x_h, v_h, model, data, target, optimizer, crit
   return alpha
 
 
+class ls_trial_setup:
+  '''
+  Context manager for evaluating line-search trial points with forward-only
+  MGRIT solves.  Each trial solve starts from the states left in the
+  ForwardODENetApp core by the previous solve (the initial guess object is
+  disabled while inside), and optionally uses a looser iteration count.
+
+  model      : model with a layer-parallel parallel_nn
+  max_iters  : forward MGRIT iterations for trial points, None keeps the current value
+  warm_start : if False, the initial guess object stays active
+  '''
+  def __init__(self, model, max_iters=None, warm_start=True):
+    self.parallel_nn = model.parallel_nn
+    self.max_iters = max_iters
+    self.warm_start = warm_start
+
+  def __enter__(self):
+    self.old_max_iters = self.parallel_nn.getFwdMaxIters()
+    if self.max_iters is not None:
+      self.parallel_nn.setFwdMaxIters(self.max_iters)
+
+    fwd_app = self.parallel_nn.fwd_app
+    self.old_initial_guess = getattr(fwd_app, 'initial_guess', None)
+    if self.warm_start and self.old_initial_guess is not None:
+      fwd_app.initial_guess = None
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.parallel_nn.setFwdMaxIters(self.old_max_iters)
+    if self.old_initial_guess is not None:
+      self.parallel_nn.fwd_app.initial_guess = self.old_initial_guess
+    return False
+
+
+def compute_ls_losses(lvl, e_h, x_h, v_h, model, data, target, criterion, criterion_kwargs, compose, alphas, max_iters=None, warm_start=True):
+  '''
+  Evaluate the loss at x_h + alpha*e_h for every alpha in alphas, using
+  forward-only, warm-started solves (see ls_trial_setup).  The parameters are
+  returned to x_h afterwards.  The losses are reduced with a single broadcast.
+
+  returns the list of losses, one for each alpha
+  '''
+  comm = model.parallel_nn.fwd_app.mpi_comm
+  flat = getattr(model, 'mgopt_flat_params', None)
+  if flat is not None:
+    flat.save()
+
+  losses = []
+  applied = 0.0
+  with torch.no_grad(), ls_trial_setup(model, max_iters, warm_start):
+    for alpha in alphas:
+      # move from the last trial point to x_h + alpha*e_h 
+      if flat is not None:
+        flat.restore()
+        tensor_list_AXPY(alpha, e_h, 1.0, x_h, inplace=True)
+      else:
+        tensor_list_AXPY(alpha-applied, e_h, 1.0, x_h, inplace=True)
+      applied = alpha
+
+      loss = compute_fwd_loss(lvl, model, data, target, criterion, criterion_kwargs, compose, v_h)
+      losses.append(loss.item())
+
+    # return to x_h
+    if flat is not None:
+      flat.restore()
+    else:
+      tensor_list_AXPY(-applied, e_h, 1.0, x_h, inplace=True)
+
+  # Losses are only available on rank 0
+  return comm.bcast(losses, root=0)
+
+
 def tb_simple_ls(lvl, e_h, x_h, v_h, model, data, target, optimizer, criterion, criterion_kwargs, compose, old_loss, e_dot_gradf, mgopt_printlevel, ls_params):
   '''
   Simple line-search: Add e_h to fine parameters.  Test five different alpha
   values.  Choose one that best minimizes loss.
+
+  The trial points are evaluated by compute_ls_losses.  Optional ls_params
+  entries are 'max_iters' (forward MGRIT iterations for trial points) and
+  'warm_start' (default True, see ls_trial_setup).
   '''
   rank = model.parallel_nn.fwd_app.mpi_comm.Get_rank()
   try:
@@ -858,27 +1172,20 @@ def tb_simple_ls(lvl, e_h, x_h, v_h, model, data, target, optimizer, criterion,
   except:
     raise ValueError('tb_simple_ls requires a ls_params dictionary alphas defined (i.e., the alphas to test during the line search')
 
+  losses = compute_ls_losses(lvl, e_h, x_h, v_h, model, data, target, criterion, criterion_kwargs, compose, alphas,
+                             max_iters=ls_params.get('max_iters', None), 
+                             warm_start=ls_params.get('warm_start', True))
 
   best_loss = 10**10
   winner = -1
 
-  for aa, alpha in enumerate(alphas):
-    # Add error update to x_h:  alpha*e_h + x_h --> x_h
-    tensor_list_AXPY(alpha, e_h, 1.0, x_h, inplace=True)
-
-    with torch.enable_grad():
-      new_loss = compute_fwd_pass(lvl, model, data, target, criterion, criterion_kwargs, compose, v_h)
-
+  for aa, (alpha, new_loss) in enumerate(zip(alphas, losses)):
     root_print(rank, mgopt_printlevel, 2, "  LS Alpha Test:        " + str(alpha) + "  Loss = " + str(new_loss))
 
     # Is this a better loss?
     if new_loss < best_loss:
       best_loss = new_loss
       winner = aa
-
-    # Undo error update to x_h:  -alpha*e_h + x_h --> x_h
-    tensor_list_AXPY( -alpha, e_h, 1.0, x_h, inplace=True)
-
   ##
   # end for-loop
 
@@ -896,6 +1203,9 @@ def tb_simple_backtrack_ls(lvl, e_h, x_h, v_h, model, data, target, optimizer, c
   Simple line-search: Add e_h to fine parameters.  If loss has
   diminished, stop.  Else subtract 1/2 of e_h from fine parameters, and
   continue until loss is reduced.
+
+  The trial points use forward-only, warm-started solves.  Optional ls_params
+  entries are 'max_iters' and 'warm_start', see ls_trial_setup.
   '''
   rank = model.parallel_nn.fwd_app.mpi_comm.Get_rank()
   try:
@@ -904,6 +1214,7 @@ def tb_simple_backtrack_ls(lvl, e_h, x_h, v_h, model, data, target, optimizer, c
     c1 = ls_params['c1']
   except:
     raise ValueError('tb_simple_backtrack_ls requires a ls_params dictionary with n_line_search, alpha, and c1 (Armijo condition) as dictionary keys.')
+  old_loss = float(old_loss)
 
   # must be a descent direction
   if e_dot_gradf>=0.0:
@@ -917,22 +1228,23 @@ def tb_simple_backtrack_ls(lvl, e_h, x_h, v_h, model, data, target, optimizer, c
 
   # Start Line search
   satisfied = False
-  for m in range(n_line_search):
-    #print("line-search, alpha=", alpha)
-    with torch.enable_grad():
-      new_loss = compute_fwd_pass(lvl, model, data, target, criterion, criterion_kwargs, compose, v_h)
-    
-    # Check Wolfe condition (i), also called the Armijo rule
-    #  f(x + alpha p) <=  f(x) + c alpha <p, grad f(x) >
-    if new_loss < old_loss + c1*alpha*e_dot_gradf:
-      satisfied = True
-      break
-    elif m < (n_line_search-1): 
-      # loss is NOT reduced enough, continue line search
-      alpha = alpha/2.0
-      tensor_list_AXPY(-alpha, e_h, 1.0, x_h, inplace=True)
-  ##
-  # end for-loop
+  with torch.no_grad(), ls_trial_setup(model, ls_params.get('max_iters', None), ls_params.get('warm_start', True)):
+    for m in range(n_line_search):
+      #print("line-search, alpha=", alpha)
+      # the Armijo test needs the value on all ranks
+      new_loss = float(compute_fwd_pass(lvl, model, data, target, criterion, criterion_kwargs, compose, v_h))
+      
+      # Check Wolfe condition (i), also called the Armijo rule
+      #  f(x + alpha p) <=  f(x) + c alpha <p, grad f(x) >
+      if new_loss < old_loss + c1*alpha*e_dot_gradf:
+        satisfied = True
+        break
+      elif m < (n_line_search-1): 
+        # loss is NOT reduced enough, continue line search
+        alpha = alpha/2.0
+        tensor_list_AXPY(-alpha, e_h, 1.0, x_h, inplace=True)
+    ##
+    # end for-loop
 
   # If Wolfe condition (i) never satisfied, subtract off the rest of e_h from x_h, 
   # i.e., change x_h back to what you started with
@@ -951,29 +1263,11 @@ def tb_simple_backtrack_ls(lvl, e_h, x_h, v_h, model, data, target, optimizer, c
 ####################################################################################
 ####################################################################################
             
-def compute_levels(num_steps,min_coarse_size,cfactor): 
-  from math import log, floor 
-  # we want to find $L$ such that ( max_L min_coarse_size*cfactor**L <= num_steps)
-  levels =  floor(log(num_steps/min_coarse_size,cfactor))+1 
-
-  if levels<1:
-    levels = 1
-  return levels
-# end compute_levels
 
 ####################################################################################
 ####################################################################################
 # Small Helper Functions 
 
-def root_print(rank, printlevel_cutoff, importance, s):
-  ''' 
-  Parallel print routine 
-  Only print if rank == 0 and the message is "important"
-  '''
-  if rank==0:
-    if importance <= printlevel_cutoff:
-      print(s, flush=True)
-
 def unpack_arg(v):
   ''' Helper function for unpacking arguments '''
   if isinstance(v, tuple):
@@ -987,6 +1281,37 @@ def check_has_args(arg_dict, list_to_check, method):
     if not (to_check in arg_dict):
       raise ValueError('Missing arguement for ' + method + ':  ' + to_check)
 
+##
+# Checkpoint helper functions 
+
+def checkpoint_filename(path, rank):
+  ''' Name of the checkpoint file written by rank, each rank writes its own file '''
+  return '%s.%d.mdl' % (path, rank)
+
+def get_rng_state():
+  ''' Capture the torch random number generator states (CPU and CUDA) '''
+  rng_state = { 'cpu' : torch.get_rng_state() }
+  if torch.cuda.is_available():
+    rng_state['cuda'] = torch.cuda.get_rng_state_all()
+  return rng_state
+
+def set_rng_state(rng_state):
+  ''' Restore the torch random number generator states from get_rng_state() '''
+  torch.set_rng_state(rng_state['cpu'].cpu())
+  if 'cuda' in rng_state and torch.cuda.is_available():
+    torch.cuda.set_rng_state_all([ s.cpu() for s in rng_state['cuda'] ])
+
+def model_optim_state(model, optimizer):
+  ''' The rank-local state of a model and its optimizer (None if there is no optimizer) '''
+  return { 'model'     : model.state_dict(),
+           'optimizer' : None if optimizer is None else optimizer.state_dict() }
+
+def load_model_optim_state(state, model, optimizer):
+  ''' Copy the state from model_optim_state(...) into model and optimizer, in place '''
+  model.load_state_dict(state['model'])
+  if (optimizer is not None) and (state['optimizer'] is not None):
+    optimizer.load_state_dict(state['optimizer'])
+
 
 ####################################################################################
 ####################################################################################
@@ -1016,10 +1341,16 @@ class mgopt_solver:
     A measure of the size of the multigrid hierarchy.
   options_used()
     Print out the options used to generate the MG/Opt hierarchy
+  resource_report()
+    Memory held by each level, and time per MG/Opt cycle on each level
   initialize_with_nested_iteration()
     Create a hiearchy of neural network models for MG/Opt to use
   mgopt_solve()
     Iteratively solves the optimization problem 
+  save_checkpoint()
+    Write the hierarchy, optimizers and training cursor, one file per rank
+  load_checkpoint()
+    Read a checkpoint, pass it as restart to the above methods to resume training
 
   """
 
@@ -1139,6 +1470,61 @@ class mgopt_solver:
       return (-1, -1, -1, -1)
 
 
+  def resource_report(self, mgopt_printlevel=1):
+    """Memory and time used by each level of this multigrid hierarchy.
+
+    The memory is summed over the ranks and counts the bytes held by the
+    parameters, the gradients, the optimizer state, the XBraid state vectors
+    and MPI buffers of the forward and backward apps (see
+    BraidApp.getResourceUsage), and the MG/Opt transfer plans.  The time is
+    the mean time per MG/Opt cycle spent on the level itself (excluding the
+    coarser levels) during the last mgopt_solve, max over the ranks.
+
+    Printed on rank 0 for mgopt_printlevel >= 1.  
+
+    Returns a list with a dictionary for each level, with level 0 the finest
+    Result only accurate on rank 0 (reduce is used, not all-reduce)
+    """
+    comm = self.levels[0].model.parallel_nn.fwd_app.mpi_comm
+    my_rank = comm.Get_rank()
+    
+    def nbytes(tensors):
+      return sum(t.numel()*t.element_size() for t in tensors if torch.is_tensor(t))
+
+    keys = ['params', 'grads', 'optimizer', 'states', 'buffers', 'transfer_plans']
+    report = []
+    for level in self.levels:
+      model = level.model
+      usage = dict.fromkeys(keys, 0)
+      usage['params'] = nbytes(model.parameters())
+      usage['grads']  = nbytes(p.grad for p in model.parameters())
+      if hasattr(level, 'optimizer'):
+        usage['optimizer'] = nbytes(t for state in level.optimizer.state.values() for t in state.values())
+      for app in [model.parallel_nn.fwd_app, model.parallel_nn.bwd_app]:
+        for key, value in app.getResourceUsage().items():
+          usage[key] += value
+
+      my_usage = np.array([ usage[k] for k in keys ], dtype=np.float64)
+      total_usage = np.zeros_like(my_usage)
+      comm.Reduce( [my_usage, MPI.DOUBLE], [total_usage, MPI.DOUBLE], op=MPI.SUM, root=0)
+
+      cycle_times = getattr(level, 'cycle_times', [])
+      my_time = np.array( [ stats.mean(cycle_times) if len(cycle_times) > 0 else 0.0 ], dtype=np.float64)
+      max_time = np.zeros_like(my_time)
+      comm.Reduce( [my_time, MPI.DOUBLE], [max_time, MPI.DOUBLE], op=MPI.MAX, root=0)
+
+      report.append( dict(zip(keys, total_usage), time_per_cycle=max_time[0]) )
+
+    if my_rank == 0:
+      mb = 1024.0**2
+      output  = '\nMG/Opt Resources (MB, summed over ranks)\n'
+      output += '  level    params     grads     optim    states   buffers  transfer   time/cycle \n'
+      for n, usage in enumerate(report):
+        output += '   %2d  ' % n + ''.join('%10.2f' % (usage[k] / mb) for k in keys) + '   %10.3e \n' % usage['time_per_cycle']
+      root_print(my_rank, mgopt_printlevel, 1, output)
+
+    return report
+
   def options_used(self):
     """ Print the options selected to form the hierarchy """
     
@@ -1164,6 +1550,9 @@ class mgopt_solver:
     if hasattr(self, 'nrelax_post'):   output = output + "  nrelax_post: " + str(self.nrelax_post) + '\n' 
     if hasattr(self, 'nrelax_coarse'): output = output + "  nrelax_coarse: " + str(self.nrelax_coarse) + '\n\n' 
     if hasattr(self, 'preserve_optim'): output = output + "  preserve_optim: " + str(self.preserve_optim) + '\n' 
+    if hasattr(self, 'restrict_optim_state'): output = output + "  restrict_optim_state: " + str(self.restrict_optim_state) + '\n' 
+    if hasattr(self, 'release_inactive'): output = output + "  release_inactive: " + str(self.release_inactive) + '\n' 
+    if hasattr(self, 'flat_params'): output = output + "  flat_params: " + str(self.flat_params) + '\n' 
     if hasattr(self, 'zero_init_guess'): output = output + "  zero_init_guess: " + str(self.zero_init_guess) + '\n\n' 
     
     # Process per-level parameters
@@ -1183,6 +1572,95 @@ class mgopt_solver:
       
 
 
+  def state_dict(self, cursor, active=None, losses=None):
+    """
+    Rank-local state of the hierarchy, used by save_checkpoint(...)
+
+    Parameters
+    ----------
+    cursor : dict
+      Where training stopped, with keys phase ('nested_iteration' or 'mgopt'),
+      level, epoch, batch (number of batches already done in epoch), and
+      rng_state (the random number generator state at the start of epoch)
+
+    active : tuple or None
+      During nested iteration, the (model, optimizer) of the level being trained 
+
+    losses : list or None
+      During MG/Opt, the losses of the batches done so far
+    """
+    if active is not None:
+      active = model_optim_state(*active)
+    if losses is not None:
+      losses = resolve_losses(losses)
+
+    levels = []
+    for level in self.levels:
+      state = model_optim_state(level.model, getattr(level, 'optimizer', None))
+      for option in ['network', 'interp_params', 'optims', 'criterions', 'out_ls_step',
+                     'restrict_params', 'restrict_grads', 'restrict_states', 'interp_states', 'line_search']:
+        state[option] = getattr(level, option, None)
+      levels.append(state)
+
+    return { 'comm_size' : MPI.COMM_WORLD.Get_size(),
+             'cursor'    : cursor,
+             'options'   : { 'ni_steps'        : list(self.ni_steps),
+                             'ni_rfactor'      : self.ni_rfactor,
+                             'preserve_optim'  : self.preserve_optim, 
+                             'zero_init_guess' : self.zero_init_guess,
+                             'flat_params'     : self.flat_params },
+             'levels'    : levels,
+             'active'    : active,
+             'losses'    : losses }
+
+  def save_checkpoint(self, path, cursor, active=None, losses=None):
+    """
+    Write the state of the hierarchy (see state_dict), each rank writes its
+    own file checkpoint_filename(path, rank) in parallel.  The file is
+    written to a temporary name first, so a preempted write never replaces
+    a complete checkpoint.  Collective over MPI.COMM_WORLD.
+    """
+    comm = MPI.COMM_WORLD
+    filename = checkpoint_filename(path, comm.Get_rank())
+    torch.save(self.state_dict(cursor, active, losses), filename + '.tmp')
+    os.replace(filename + '.tmp', filename)
+    comm.Barrier()
+
+  def load_checkpoint(self, path):
+    """
+    Read the checkpoint written by save_checkpoint(path, ...) on this rank, and check that 
+    all ranks read a checkpoint of the same point in training.  Collective over MPI.COMM_WORLD.
+
+    Returns the state dictionary, see state_dict(...), to be passed as the
+    restart argument of initialize_with_nested_iteration and mgopt_solve
+    """
+    comm = MPI.COMM_WORLD
+    state = torch.load(checkpoint_filename(path, comm.Get_rank()), map_location=self.device)
+    if state['comm_size'] != comm.Get_size():
+      raise ValueError('Checkpoint ' + path + ' was written by ' + str(state['comm_size']) + ' ranks, not ' + str(comm.Get_size()))
+
+    cursor = state['cursor']
+    where = (cursor['phase'], cursor['level'], cursor['epoch'], cursor['batch'])
+    if any(w != where for w in comm.allgather(where)):
+      raise ValueError('Checkpoint ' + path + ' is inconsistent across ranks (a write was interrupted)')
+
+    return state
+
+  def batch_checkpoint(self, path, interval, num_batches, cursor, active=None, losses=None):
+    """
+    Return a callback for train_epoch that writes a checkpoint every interval
+    batches, or None if checkpointing is disabled.  Checkpoints after the
+    last batch are left to the end-of-epoch checkpoint.  
+    """
+    if (path is None) or (interval <= 0):
+      return None
+
+    def checkpoint(batch_idx):
+      if ((batch_idx+1) % interval == 0) and (batch_idx+1 < num_batches):
+        self.save_checkpoint(path, dict(cursor, batch=batch_idx+1), active, losses)
+
+    return checkpoint
+
   def initialize_with_nested_iteration(self, model_factory, ni_steps, 
                                        train_loader, 
                                        test_loader, 
@@ -1195,7 +1673,12 @@ class mgopt_solver:
                                        criterions       = "tb_mgopt_cross_ent", 
                                        preserve_optim   = True,
                                        seed             = None,
-                                       zero_init_guess  = False):
+                                       zero_init_guess  = False,
+                                       flat_params      = False,
+                                       prefetch         = 0,
+                                       checkpoint       = None,
+                                       checkpoint_interval = 0,
+                                       restart          = None):
     """
     Use nested iteration to create a hierarchy of models
 
@@ -1261,6 +1744,31 @@ class mgopt_solver:
     zero_init_guess : int
       If 1, then initialize nested iteration with all zero parameters on
       initial level.  Useful for parallel reproducibility.  Default is 0,False.
+
+    flat_params : boolean
+      Default False.  If True, the parameters and gradients of each level's
+      model are backed by one contiguous buffer (see FlatParameters), so the
+      MG/Opt vector algebra uses a single BLAS call per operation.
+
+    prefetch : int
+      Default 0.  If larger than 0, the number of batches loaded and moved to
+      the device on a background thread while training (see BatchStager).
+
+    checkpoint : string or None
+      Default None.  If set, the path prefix of a checkpoint (see
+      save_checkpoint) written at the end of every epoch on every level.
+
+    checkpoint_interval : int
+      Default 0.  If larger than 0, also write the checkpoint every
+      checkpoint_interval batches.
+
+    restart : string, dict or None
+      Default None.  A checkpoint path (or the result of load_checkpoint) to
+      resume from.  The other arguments must match the run that wrote the
+      checkpoint.  Completed levels are restored instead of trained, and the
+      level in progress resumes at the epoch and batch it was stopped at, with
+      the same data order.  A checkpoint written by mgopt_solve restores
+      every level, so that mgopt_solve(restart=...) can continue.
   
 
     Notes
@@ -1320,6 +1828,23 @@ class mgopt_solver:
     #  
     self.preserve_optim = bool(preserve_optim)
     self.zero_init_guess = bool(zero_init_guess)
+    self.flat_params = bool(flat_params)
+
+    ##
+    # Levels restored from the restart checkpoint (coarse to fine), and the level in progress
+    restored = []
+    resume_level = nlevels
+    if restart is not None:
+      if isinstance(restart, str):
+        restart = self.load_checkpoint(restart)
+      if list(restart['options']['ni_steps']) != list(ni_steps):
+        raise ValueError('Restart checkpoint was written with different ni_steps: ' + str(restart['options']['ni_steps']))
+      cursor = restart['cursor']
+      if cursor['phase'] == 'nested_iteration':
+        restored = restart['levels']
+        resume_level = cursor['level']
+      else:
+        restored = list(reversed(restart['levels']))
 
     ##
     # Initialize self.levels with nested iteration
@@ -1339,6 +1864,11 @@ class mgopt_solver:
       # Get rank from model
       if k == 0: rank = model.parallel_nn.fwd_app.mpi_comm.Get_rank()
 
+      ##
+      # Back the parameters by a flat buffer, before any optimizer holds them
+      if self.flat_params:
+        flatten_params(model)
+
       ##
       # For parallel reproducibility, set all parameters to 0
       if self.zero_init_guess:
@@ -1371,8 +1901,15 @@ class mgopt_solver:
           break
 
       ##
-      # Select Interpolate weights from coarser model to the new model
-      if (len(self.levels) > 0):
+      # Restore level from checkpoint, or select Interpolate weights from coarser model to the new model
+      first_epoch = 1
+      if k < len(restored):
+        load_model_optim_state(restored[k], model, optimizer if self.preserve_optim else None)
+        first_epoch = epochs + 1
+      elif k == resume_level:
+        load_model_optim_state(restart['active'], model, optimizer if self.preserve_optim else None)
+        first_epoch = cursor['epoch'] 
+      elif (len(self.levels) > 0):
         (get_interp_params, interp_params_kwargs) = self.process_get_interp_params(interp_params[k])
         new_params = get_interp_params(model, self.levels[-1].model, **interp_params_kwargs)
         write_params_inplace(model, new_params)
@@ -1393,21 +1930,36 @@ class mgopt_solver:
       # Begin epoch loop
       epoch_times = []
       test_times = []
-      for epoch in range(1, epochs + 1):
+      active = (model, optimizer if self.preserve_optim else None)
+      for epoch in range(first_epoch, epochs + 1):
+        ##
+        # Resuming mid-epoch, reproduce the data order of the epoch and skip the batches done 
+        start_batch = 0
+        if (k == resume_level) and (epoch == first_epoch):
+          set_rng_state(cursor['rng_state'])
+          start_batch = cursor['batch']
+        epoch_cursor = { 'phase' : 'nested_iteration', 'level' : k, 'epoch' : epoch, 'batch' : 0, 'rng_state' : get_rng_state() }
+        batch_checkpoint = self.batch_checkpoint(checkpoint, checkpoint_interval, len(train_loader), epoch_cursor, active)
+
         start_time = timer()
         # call train_epoch, depending on whether the optimizer state is preserved between runs
         if self.preserve_optim:
-          train_epoch(rank, model, train_loader, optimizer, epoch, criterion, criterion_kwargs, compose, log_interval, self.device, mgopt_printlevel)
+          train_epoch(rank, model, train_loader, optimizer, epoch, criterion, criterion_kwargs, compose, log_interval, self.device, mgopt_printlevel, prefetch=prefetch,
+                      start_batch=start_batch, checkpoint=batch_checkpoint)
         else:
-          train_epoch(rank, model, train_loader, optims[k], epoch, criterion, criterion_kwargs, compose, log_interval, self.device, mgopt_printlevel)
+          train_epoch(rank, model, train_loader, optims[k], epoch, criterion, criterion_kwargs, compose, log_interval, self.device, mgopt_printlevel, prefetch=prefetch,
+                      start_batch=start_batch, checkpoint=batch_checkpoint)
         end_time = timer()
         epoch_times.append( end_time-start_time )
     
         # test() is designed to be general for PyTorch networks
         start_time = timer()
-        test(rank, model, test_loader, criterion, criterion_kwargs, compose, self.device, mgopt_printlevel, indent='\n  ')
+        test(rank, model, test_loader, criterion, criterion_kwargs, compose, self.device, mgopt_printlevel, indent='\n  ', prefetch=prefetch)
         end_time = timer()
         test_times.append( end_time-start_time )
+
+        if checkpoint is not None:
+          self.save_checkpoint(checkpoint, dict(epoch_cursor, epoch=epoch+1, rng_state=get_rng_state()), active)
       
       ##
       # Store model and parameters
@@ -1418,13 +1970,17 @@ class mgopt_solver:
       self.levels[-1].optims = optims[k]
       self.levels[-1].criterions = criterions[k]
       self.levels[-1].out_ls_step = []
+      if k < len(restored):
+        self.levels[-1].out_ls_step = restored[k]['out_ls_step']
       if self.preserve_optim:
         self.levels[-1].optimizer = optimizer
 
       # Print epoch-level time averages
       if epochs == 0:
         root_print(rank, mgopt_printlevel, 1, '  Zero Nested Iteration Epochs -- Only Initializing Hierarchy ')
-      elif epochs == 1:
+      elif len(epoch_times) == 0:
+        root_print(rank, mgopt_printlevel, 1, '  Restored from checkpoint')
+      elif len(epoch_times) == 1:
         root_print(rank, mgopt_printlevel, 1, '  Time per epoch: %.2e ' % (stats.mean(epoch_times)) ) 
         root_print(rank, mgopt_printlevel, 1, '  Time per test:  %.2e ' % (stats.mean(test_times)) )
       else:
@@ -1454,7 +2010,14 @@ class mgopt_solver:
                         restrict_grads = ("tb_get_injection_restrict_params", {'grad' : True}), 
                         restrict_states = "tb_injection_restrict_network_state",
                         interp_states = "tb_injection_interp_network_state", 
-                        line_search = ('tb_simple_ls', {'alphas' : [0.001, 0.01, 0.1, 0.5, 1.0]})
+                        line_search = ('tb_simple_ls', {'alphas' : [0.001, 0.01, 0.1, 0.5, 1.0]}),
+                        restrict_optim_state = True,
+                        release_inactive = False,
+                        prefetch = 0,
+                        coarse_test_batches = None,
+                        checkpoint = None,
+                        checkpoint_interval = 0,
+                        restart = None
                         ):    
     """
     Use nested iteration to create a hierarchy of models
@@ -1527,6 +2090,48 @@ class mgopt_solver:
       line_search[k] describes the strategy for line search with the
       coarse-grid correction on level k in the MG/Opt hierarchy 
       -> If string or tuple, then the string/tuple defines option at all levels.
+      Note: tb_simple_ls and tb_simple_backtrack_ls evaluate trial points with
+      forward-only solves, warm-started from the previous trial.  Add
+      'max_iters' to ls_params to use fewer MGRIT iterations for trial points.
+
+    restrict_optim_state : boolean
+      Default True.  If True (and preserve_optim is True), restrict the Adam
+      or SGD optimizer state to the coarse level in each MG/Opt cycle, and
+      interpolate it back to the fine level after the coarse-grid solve, see
+      tb_parallel_injection_optim_state.  Other optimizers keep their own
+      state on each level.
+
+    release_inactive : boolean
+      Default False.  If True, release the XBraid state vectors and MPI
+      buffers of a level while the solver works on the coarser levels, and of
+      the coarser levels while it works on the finer one (see
+      BraidApp.releaseStorage).  They are rebuilt by the next solve on the
+      level, which then starts from the initial guess instead of the states of
+      the last solve.  See resource_report for the memory held by each level.
+
+    prefetch : int
+      Default 0.  If larger than 0, the number of batches loaded and moved to
+      the device on a background thread while the MG/Opt cycles run (see BatchStager).
+
+    coarse_test_batches : int or None
+      For mgopt_printlevel >= 2, the number of test batches used to evaluate
+      the coarse levels.  If None, the whole test set is used.
+
+    checkpoint : string or None
+      Default None.  If set, the path prefix of a checkpoint (see
+      save_checkpoint) written at the end of every epoch.
+
+    checkpoint_interval : int
+      Default 0.  If larger than 0, also write the checkpoint every
+      checkpoint_interval batches.
+
+    restart : string, dict or None
+      Default None.  A checkpoint path (or the result of load_checkpoint) 
+      written by mgopt_solve to resume from, at the epoch and batch it was
+      stopped at, with the same data order.  The hierarchy must have been
+      built first, e.g., with initialize_with_nested_iteration(restart=...),
+      and the other arguments must match the run that wrote the checkpoint.
+      A checkpoint written during nested iteration is ignored here.
 
     Notes
     -----
@@ -1562,9 +2167,13 @@ class mgopt_solver:
 
     ##
     # Store global solve parameters
+    self.restrict_optim_state = restrict_optim_state
     self.nrelax_pre = nrelax_pre
     self.nrelax_post = nrelax_post
     self.nrelax_coarse = nrelax_coarse
+    self.release_inactive = release_inactive
+    for level in self.levels:
+      level.cycle_times = []
 
     ##
     # Determine number of mgopt_levels
@@ -1597,16 +2206,49 @@ class mgopt_solver:
 
     ##
     # Begin loop over epochs
+    # Each loss is a LazyLoss until it is resolved, losses[:resolved] are floats
     losses = []
+    resolved = 0
     epoch_times = []
     test_times = []
-    for epoch in range(1, epochs + 1):
+
+    ##
+    # Restore the hierarchy, optimizers, and losses from the restart checkpoint
+    first_epoch = 1
+    if restart is not None:
+      if isinstance(restart, str):
+        restart = self.load_checkpoint(restart)
+      cursor = restart['cursor']
+      if cursor['phase'] == 'mgopt':
+        if len(restart['levels']) != len(self.levels):
+          raise ValueError('Restart checkpoint has ' + str(len(restart['levels'])) + ' levels, the hierarchy has ' + str(len(self.levels)))
+        for level, state in zip(self.levels, restart['levels']):
+          load_model_optim_state(state, level.model, getattr(level, 'optimizer', None))
+          level.out_ls_step = state['out_ls_step']
+        losses = list(restart['losses'])
+        resolved = len(losses)
+        first_epoch = cursor['epoch']
+      else:
+        restart = None
+
+    for epoch in range(first_epoch, epochs + 1):
       epoch_time_start = timer()
+
+      ##
+      # Resuming mid-epoch, reproduce the data order of the epoch and skip the batches done 
+      start_batch = 0
+      if (restart is not None) and (epoch == first_epoch):
+        set_rng_state(cursor['rng_state'])
+        start_batch = cursor['batch']
+      epoch_cursor = { 'phase' : 'mgopt', 'level' : 0, 'epoch' : epoch, 'batch' : 0, 'rng_state' : get_rng_state() }
+      batch_checkpoint = self.batch_checkpoint(checkpoint, checkpoint_interval, len(train_loader), epoch_cursor, losses=losses)
       
       ##
       # Begin loop over batches
       batch_total_time = 0.0
-      for batch_idx, (data, target) in enumerate(train_loader):
+      for batch_idx, (data, target) in enumerate(staged(train_loader, self.device, prefetch)):
+        if batch_idx < start_batch:
+          continue
         data = data.to(self.device)
         target = target.to(self.device)
         ##
@@ -1629,10 +2271,16 @@ class mgopt_solver:
         losses.append(loss_item)
         end_batch_time = timer()
         batch_total_time += (end_batch_time - start_batch_time)
+
+        if batch_checkpoint is not None:
+          batch_checkpoint(batch_idx)
         
         ##
         # Batch-level diagnostic printing
         if (batch_idx % log_interval == 0) or (batch_idx == (len(train_loader)-1) ):  
+          # reduce the losses of the interval together
+          losses[resolved:] = resolve_losses(losses[resolved:])
+          resolved = len(losses)
           if batch_idx==0:
             root_print(rank, mgopt_printlevel, 1, '')
 
@@ -1650,7 +2298,7 @@ class mgopt_solver:
       ##
       # Measure training accuracy
       start = timer()
-      test(rank, self.levels[0].model, test_loader, criterion, criterion_kwargs, compose, self.device, mgopt_printlevel, indent='\n  ')
+      test(rank, self.levels[0].model, test_loader, criterion, criterion_kwargs, compose, self.device, mgopt_printlevel, indent='\n  ', prefetch=prefetch)
       end = timer()
       test_times.append( end -start )
       
@@ -1659,11 +2307,12 @@ class mgopt_solver:
       if(mgopt_printlevel >= 2):
         for i, level in enumerate(self.levels[1:]):
           root_print(rank, mgopt_printlevel, 2, '  Test accuracy information for level ' + str(i+1))
-          test(rank, level.model, test_loader, criterion, criterion_kwargs, compose, self.device, mgopt_printlevel, indent='    ')
+          test(rank, level.model, test_loader, criterion, criterion_kwargs, compose, self.device, mgopt_printlevel, indent='    ', 
+               max_batches=coarse_test_batches, prefetch=prefetch)
       
       ##
       # Print epoch-level time averages
-      if epoch == 1:
+      if len(epoch_times) == 1:
         root_print(rank, mgopt_printlevel, 1, '  Time per epoch: %.2e ' % (stats.mean(epoch_times)) ) 
         root_print(rank, mgopt_printlevel, 1, '  Time per test:  %.2e ' % (stats.mean(test_times)) )
       else:
@@ -1671,6 +2320,10 @@ class mgopt_solver:
         root_print(rank, mgopt_printlevel, 1, '  Time per test:  %.2e (1 std dev %.2e)' % (stats.mean(test_times), stats.stdev(test_times)))
 
 
+      losses[resolved:] = resolve_losses(losses[resolved:])
+      resolved = len(losses)
+      if checkpoint is not None:
+        self.save_checkpoint(checkpoint, dict(epoch_cursor, epoch=epoch+1, rng_state=get_rng_state()), losses=losses)
       if losses[-1] < mgopt_tol:
         break
 
@@ -1689,6 +2342,8 @@ class mgopt_solver:
     See solve() for parameter description
     """
     
+    solve_start = timer()
+
     ##
     # Grab fine and coarse models and optimizers
     # We regenerate the optimizer each time, as some optimizers store state
@@ -1740,13 +2395,15 @@ class mgopt_solver:
     # 1. relax (carry out optimization steps)
     for k in range(self.nrelax_pre):
       loss_scalar = compute_fwd_bwd_pass(lvl, optimizer, model, data, target, criterion, criterion_kwargs, compose, v_h)
-      root_print(rank, mgopt_printlevel, 2, "  Pre-relax loss:       " + str(loss_scalar) ) 
+      if mgopt_printlevel >= 2:
+        root_print(rank, mgopt_printlevel, 2, "  Pre-relax loss:       " + str(loss_scalar) ) 
       optimizer.step()
 
     # 2. compute new gradient g_h
     # First evaluate network, forward and backward.  Return value is scalar value of the loss.
     fine_loss = compute_fwd_bwd_pass(lvl, optimizer, model, data, target, criterion, criterion_kwargs, compose, v_h)
-    root_print(rank, mgopt_printlevel, 2, "  Pre-relax done loss:  " + str(fine_loss)) 
+    if mgopt_printlevel >= 2:
+      root_print(rank, mgopt_printlevel, 2, "  Pre-relax done loss:  " + str(fine_loss)) 
     with torch.no_grad():
       g_h = get_params(model, deep_copy=True, grad=True)
       
@@ -1767,8 +2424,14 @@ class mgopt_solver:
     # x_H^{zero} = R(x_h)   and    \tilde{g}_H = R(g_h)
     with torch.no_grad():
       #do_restrict_states(model, coarse_model, **restrict_states_kwargs)
-      gtilde_H = get_restrict_grad(model, coarse_model, **restrict_grad_kwargs)
-      x_H      = get_restrict_params(model, coarse_model, **restrict_params_kwargs) 
+      if (get_restrict_grad is tb_parallel_get_injection_restrict_params) and \
+         (get_restrict_params is tb_parallel_get_injection_restrict_params) and \
+         (restrict_grad_kwargs['cf'] == restrict_params_kwargs['cf']):
+        # parameters and gradient share the messages
+        (x_H, gtilde_H) = tb_parallel_get_injection_restrict_params(model, coarse_model, cf=restrict_params_kwargs['cf'], grad='both')
+      else:
+        gtilde_H = get_restrict_grad(model, coarse_model, **restrict_grad_kwargs)
+        x_H      = get_restrict_params(model, coarse_model, **restrict_params_kwargs) 
       # For x_H to take effect, these parameters must be written to the next coarser network
       write_params_inplace(coarse_model, x_H)
       # Must store x_H for later error computation
@@ -1776,9 +2439,11 @@ class mgopt_solver:
 
 
     ## 
-    # We do not understand the stocasticity yet...but when we do, could consider
-    # restricting Adam state to coarse levels
-    ##tb_injection_restrict_adam_state(model, coarse_model, optimizer, coarse_optimizer, 2)
+    # Restrict the optimizer state (e.g., Adam moments) to the coarse level
+    transfer_optim_state = self.restrict_optim_state and self.preserve_optim and \
+                           optim_state_supported(optimizer, coarse_optimizer)
+    if transfer_optim_state:
+      tb_parallel_injection_restrict_optim_state(model, coarse_model, optimizer, coarse_optimizer, cf=self.ni_rfactor)
 
 
     # 4. compute gradient on coarse level, using restricted parameters
@@ -1806,18 +2471,24 @@ class mgopt_solver:
 
     # 6. solve coarse-grid 
     #  x_H = min f_H(x_H) - <v_H, x_H>
+    if self.release_inactive:
+      release_level(model)
+    coarse_start = timer()
     if (lvl+2) == mgopt_levels:
       # If on coarsest level, do a "solve" by carrying out a number of relaxation steps
       root_print(rank, mgopt_printlevel, 2, "\n  Level:  " + str(lvl+1))
       for m in range(self.nrelax_coarse):
         loss_scalar_coarse = compute_fwd_bwd_pass(lvl+1, coarse_optimizer, coarse_model, data, target, coarse_criterion, coarse_criterion_kwargs, coarse_compose, v_H)
         coarse_optimizer.step()
-        root_print(rank, mgopt_printlevel, 2, "  Coarsest grid solve loss: " + str(loss_scalar_coarse)) 
+        if mgopt_printlevel >= 2:
+          root_print(rank, mgopt_printlevel, 2, "  Coarsest grid solve loss: " + str(loss_scalar_coarse)) 
+      self.levels[lvl+1].cycle_times.append(timer() - coarse_start)
     else:
       # Recursive call
       self.__solve(lvl+1, data, target, v_H, mgopt_printlevel, 
                    mgopt_levels, restrict_params, restrict_grads,
                    restrict_states, interp_states, line_search)
+    coarse_time = timer() - coarse_start
     #
     root_print(rank, mgopt_printlevel, 2, "  Recursion exited\n")
       
@@ -1835,7 +2506,14 @@ class mgopt_solver:
       write_params_inplace(coarse_model, e_H)
       e_h = get_interp_params(model, coarse_model, **interp_params_kwargs) 
       #do_interp_states(model, coarse_model, **interp_states_kwargs)
+
+    # and interpolate the optimizer state of the coarse-grid solve back to the fine level
+    if transfer_optim_state:
+      tb_parallel_injection_interp_optim_state(model, coarse_model, optimizer, coarse_optimizer, cf=self.ni_rfactor)
       root_print(rank, mgopt_printlevel, 2, "  Norm of error correction:       " + str(np.sqrt(tensor_list_dot(e_h, e_h, comm).item())) ) 
+
+    if self.release_inactive:
+      release_level(coarse_model)
       
 
     # 8. apply linesearch to update x_h
@@ -1851,8 +2529,9 @@ class mgopt_solver:
     # 9. post-relaxation
     for k in range(self.nrelax_post):
       loss_scalar = compute_fwd_bwd_pass(lvl, optimizer, model, data, target, criterion, criterion_kwargs, compose, v_h)
-      if (k==0):  root_print(rank, mgopt_printlevel, 2, "  CG Corr done loss:    " + str(loss_scalar) ) 
-      else:       root_print(rank, mgopt_printlevel, 2, "  Post-relax loss:      " + str(loss_scalar) )
+      if mgopt_printlevel < 2: pass
+      elif (k==0):  root_print(rank, mgopt_printlevel, 2, "  CG Corr done loss:    " + str(loss_scalar) ) 
+      else:         root_print(rank, mgopt_printlevel, 2, "  Post-relax loss:      " + str(loss_scalar) )
       optimizer.step()
     ##
     if (mgopt_printlevel == 2):  
@@ -1864,6 +2543,8 @@ class mgopt_solver:
     if mgopt_printlevel == 3:
       root_print(rank, mgopt_printlevel, 3, "  Post-MG/Opt solution norm:       " + str(tensor_list_dot(x_h, x_h, comm).item()) ) 
 
+    # Time spent on this level, see resource_report
+    self.levels[lvl].cycle_times.append(timer() - solve_start - coarse_time)
 
     return loss_scalar   
         
@@ -0,0 +1,321 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import math
+import torch
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from torchbraid.braid_vector import BraidVector
+
+__all__ = ['NativeMGRIT']
+
+class NativeMGRIT:
+  """
+  An in-process MGRIT solver, written in PyTorch, for BraidApp objects.
+
+  This replaces braid_Drive for single processor runs. It uses the same
+  application interface as the XBraid callbacks (eval, getFeatureShapes and 
+  initializeVector), and the options set on the app (max levels, coarsening 
+  factor, iterations, tolerance and relaxation sweeps), so an app can switch
+  between XBraid and this solver. Because there are no C to Python callbacks 
+  for the vector operations, the overhead per step is much smaller. 
+
+  The algorithm is a FAS V-cycle with F or FCF relaxation, injection for
+  restriction and interpolation, and a sequential solve on the coarsest level.
+  The residual is computed at the fine C-points after relaxation. After the last
+  iteration a final FC relaxation is run on the fine level with done=True, which
+  is where the forward app records the layers for back propagation and the 
+  backward app accumulates the parameter gradients.
+
+  The steps in different C-intervals of a relaxation sweep are independent.
+  If the app supports evalBatch (with batched steps turned on) they are 
+  evaluated together, otherwise they can be run on a thread pool. The eval 
+  method of the torchbraid apps is not thread safe (it sets the done and level 
+  flags, records the layers for back propagation, and the backward app toggles
+  the parameter gradients), so the calls to eval are serialized unless the app
+  sets thread_safe_eval=True. The threads then only overlap the vector copies.
+  """
+
+  def __init__(self,app,num_threads=1):
+    """
+    Constructor.
+
+      Parameters:
+        app (BraidApp): The application to solve
+        num_threads (int): Number of threads evaluating the C-intervals of a sweep
+    """
+    assert app.getMPIComm().Get_size()==1, 'NativeMGRIT only supports a single processor'
+    assert not app.spatial_mg, 'NativeMGRIT does not support spatial coarsening'
+
+    self.app = app
+    self.num_threads = num_threads
+    self.pool = None
+    self.eval_lock = threading.Lock()
+
+    self.u = None          # fine level states from the last solve
+    self.times = None      # fine level times
+    self.iterations = 0
+    self.residuals = []
+
+  def __del__(self):
+    if self.pool is not None:
+      self.pool.shutdown()
+
+  ######################################################################
+  # hierarchy
+
+  def cfactor(self,level):
+    cfactor = self.app.getCFactor()
+    if isinstance(cfactor,int):
+      return cfactor
+    return cfactor.get(level,2)
+
+  def numRelax(self,level):
+    # matches the XBraid setup in BraidApp.initCore: F relaxation on the fine level
+    default = 0 if level==0 else self.app.getNumRelax()
+    return self.app.nrelax_levels.get(level,default)
+
+  def buildHierarchy(self):
+    """
+    Compute the number of steps on each level.
+    """
+    min_coarse = self.app.min_coarse if self.app.min_coarse is not None else 2
+
+    steps = [self.app.num_steps]
+    while len(steps)<self.app.getMaxLevels():
+      cf = self.cfactor(len(steps)-1)
+      if steps[-1] % cf!=0 or steps[-1]//cf<min_coarse:
+        break
+      steps += [steps[-1]//cf]
+    return steps
+
+  def levelTime(self,steps,i):
+    return self.app.Tf*i/steps
+
+  ######################################################################
+  # vector algebra on BraidVectors, these always return new vectors
+
+  @staticmethod
+  def axpy(alpha,x,y):
+    """ alpha*x + y """
+    return BraidVector(tuple([alpha*a+b for a,b in zip(x.tensors(),y.tensors())]))
+
+  @staticmethod
+  def norm2(x):
+    return sum([torch.sum(t*t).item() for t in x.tensors()])
+
+  ######################################################################
+  # stepping
+
+  def stepMany(self,level,steps,vectors,indices,done=False):
+    """
+    Step each vector from indices[i] to indices[i]+1 on a level, the steps are independent.
+    """
+    tstarts = [self.levelTime(steps,i) for i in indices]
+    tstops  = [self.levelTime(steps,i+1) for i in indices]
+
+    app = self.app
+    if getattr(app,'batched_steps',None) is not None and all([len(v.tensors())==1 for v in vectors]):
+      outputs = app.evalBatch([v.tensor() for v in vectors],tstarts,tstops,level,done)
+      return [BraidVector(y) for y in outputs]
+
+    def step(args):
+      v,tstart,tstop = args
+      y = v.clone()
+      if getattr(app,'thread_safe_eval',False):
+        app.eval(y,tstart,tstop,level,done)
+      else:
+        with self.eval_lock:
+          app.eval(y,tstart,tstop,level,done)
+      return y
+
+    args = list(zip(vectors,tstarts,tstops))
+    if self.num_threads>1 and len(args)>1:
+      if self.pool is None:
+        self.pool = ThreadPoolExecutor(self.num_threads)
+      return list(self.pool.map(step,args))
+    return [step(a) for a in args]
+
+  def addRHS(self,vectors,g,indices):
+    if g is None:
+      return vectors
+    return [self.axpy(1.0,v,g[i+1]) for v,i in zip(vectors,indices)]
+
+  def relaxF(self,level,steps,cf,u,g,done=False):
+    """
+    F-relaxation (or with done=True the final FC relaxation), in place on u.
+    """
+    num_intervals = steps//cf
+    last = cf if done else cf-1
+    for j in range(last):
+      indices = [k*cf+j for k in range(num_intervals)]
+      results = self.stepMany(level,steps,[u[i] for i in indices],indices,done)
+      for i,y in zip(indices,self.addRHS(results,g,indices)):
+        u[i+1] = y
+
+  def relaxC(self,level,steps,cf,u,g):
+    """
+    C-relaxation, in place on u.
+    """
+    indices = [k*cf+cf-1 for k in range(steps//cf)]
+    results = self.stepMany(level,steps,[u[i] for i in indices],indices)
+    for i,y in zip(indices,self.addRHS(results,g,indices)):
+      u[i+1] = y
+
+  def sequential(self,level,steps,u,g):
+    """
+    Solve exactly with a sweep over all the time steps.
+    """
+    for i in range(steps):
+      y = self.stepMany(level,steps,[u[i]],[i])
+      u[i+1] = self.addRHS(y,g,[i])[0]
+
+  def cycle(self,level,hierarchy,u,g,check=None):
+    """
+    One FAS V-cycle starting on a level, u is updated in place. If check is
+    a function of the residual norm returning True when converged, the cycle
+    stops before the coarse grid correction if it returns True.
+    
+    Returns the residual norm on this level computed after relaxation.
+    """
+    steps = hierarchy[level]
+    if level==len(hierarchy)-1:
+      self.sequential(level,steps,u,g)
+      return 0.0
+
+    cf = steps//hierarchy[level+1]
+
+    # relaxation: F(CF)^nrelax
+    self.relaxF(level,steps,cf,u,g)
+    for r in range(self.numRelax(level)):
+      self.relaxC(level,steps,cf,u,g)
+      self.relaxF(level,steps,cf,u,g)
+
+    # residual at the C-points: Phi(u_{i-1}) + g_i - u_i
+    c_indices = [k*cf for k in range(1,steps//cf+1)]
+    phi = self.stepMany(level,steps,[u[i-1] for i in c_indices],[i-1 for i in c_indices])
+    phi = self.addRHS(phi,g,[i-1 for i in c_indices])
+    residuals = [self.axpy(-1.0,u[i],p) for i,p in zip(c_indices,phi)]
+    res_norm = math.sqrt(sum([self.norm2(r) for r in residuals]))
+
+    if check is not None and check(res_norm):
+      return res_norm
+
+    # restrict by injection, and build the FAS right hand side
+    coarse_steps = hierarchy[level+1]
+    v = [u[0]]+[u[i] for i in c_indices]
+    phi_c = self.stepMany(level+1,coarse_steps,v[:-1],list(range(coarse_steps)))
+    g_c = [None]+[self.axpy(-1.0,p,self.axpy(1.0,vk,r)) for p,vk,r in zip(phi_c,v[1:],residuals)]
+
+    v_c = [x.clone() for x in v]
+    self.cycle(level+1,hierarchy,v_c,g_c)
+
+    # correct the C-points, then update the F-points
+    for k,i in enumerate(c_indices):
+      u[i] = self.axpy(1.0,self.axpy(-1.0,v[k+1],v_c[k+1]),u[i])
+    self.relaxF(level,steps,cf,u,g)
+
+    return res_norm
+
+  ######################################################################
+  # solve
+
+  def initialize(self,x,steps):
+    """
+    Build the initial fine level states. The previous solution is reused 
+    (as XBraid does) if its shapes are consistent.
+    """
+    app = self.app
+    times = [self.levelTime(steps,i) for i in range(steps+1)]
+
+    reuse = self.u is not None and len(self.u)==steps+1
+    u = [BraidVector(x)]
+    for i in range(1,steps+1):
+      shapes = app.getFeatureShapes(i,0)
+      if reuse and [tuple(t.shape) for t in self.u[i].tensors()]==[tuple(s) for s in shapes]:
+        v = self.u[i]
+      else:
+        v = BraidVector(tuple([torch.zeros(s,device=app.device) for s in shapes]))
+      app.initializeVector(times[i],v)
+      u += [v]
+    return times,u
+
+  def run(self,x):
+    """
+    Solve, x is the initial condition. Returns the tuple of tensors at the final time.
+    """
+    app = self.app
+    hierarchy = self.buildHierarchy()
+    steps = hierarchy[0]
+
+    self.times,self.u = self.initialize(x,steps)
+    self.iterations = 0
+    self.residuals = []
+
+    tol = app.getAbsTol()
+    if len(hierarchy)>1:
+      for it in range(app.getMaxIters()):
+        res_norm = self.cycle(0,hierarchy,self.u,None,check=lambda r: r<=tol)
+        self.residuals += [res_norm]
+        self.iterations += 1
+        if res_norm<=tol:
+          break
+
+    # final FC relaxation, every fine step is evaluated once with done=True
+    cf = steps//hierarchy[1] if len(hierarchy)>1 else steps
+    self.relaxF(0,steps,cf,self.u,None,done=True)
+
+    return tuple(self.u[-1].tensors())
+
+  ######################################################################
+  # access to the solution, with the same meaning as for XBraid
+
+  def getUVector(self,level,t):
+    if self.u is None or level!=0:
+      return None
+    i = round(t/self.app.dt)
+    if 0<=i<len(self.u):
+      return self.u[i]
+    return None
+
+  def getTimePoints(self):
+    if self.u is None:
+      return [],[]
+    return list(self.times),[v.clone() for v in self.u]
+
+  def getNumIterations(self):
+    return self.iterations
+
+  def getResidualHistory(self):
+    return list(self.residuals)
+# end NativeMGRIT
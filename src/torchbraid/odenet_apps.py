@@ -102,16 +102,25 @@ class ForwardODENetApp(BraidApp):
              the count (repeatitions) of each layer
 
            done_flag : tensor for indicating that "done" is being called
+
+           level_flag : tensor holding the level of the step being evaluated (see SpatialAdaptor)
+
+           compiler : StepCompiler used by evalLayer, None evaluates the layers eagerly
         """
     
         # this block of code prepares the data for easy sorting
         [self.counts,self.functors] = list(zip(*layers))
         self.indices = list(itertools.accumulate(self.counts))
         self.done_flag = tb_utils.DoneFlag.allocate()
+        self.level_flag = torch.tensor(0)
+        self.compiler = None
 
       def updateLayerDoneFlag(self,new_state):
         tb_utils.DoneFlag.update(self.done_flag,new_state)
 
+      def updateLayerLevel(self,level):
+        self.level_flag.fill_(level)
+
       def registerLayerDoneFlag(self,layer):
         tb_utils.DoneFlag.module_register(layer,self.done_flag)
 
@@ -133,9 +142,38 @@ class ForwardODENetApp(BraidApp):
           layer = ForwardODENetApp.ODEBlock(layer)
     
         layer = layer.to(device)
-        tb_utils.DoneFlag.module_register(layer,self.done_flag)
+        self.registerLayer(layer)
+
+        # layers built by the same functor share the compiled step, see evalLayer
+        layer.functor_index = ind
         return layer
 
+      def setCompiler(self,compiler):
+        self.compiler = compiler
+
+      def evalLayer(self,layer,level,dt,x,*args,**kwargs):
+        """
+        Evaluate the step layer(dt,x,*args,**kwargs). If a compiler is set, the step of
+        a layer built by this class is compiled for each functor, level, step size and 
+        feature shape.
+        """
+        index = getattr(layer,'functor_index',None)
+        if self.compiler is None or not self.compiler.available or index is None:
+          return layer(dt,x,*args,**kwargs)
+
+        key = (index,level,dt,layer.training,self.compiler.featureKey(x))
+        build = lambda: self.compiler.functionalStep(layer,dt)
+        return self.compiler(key,build,dict(layer.named_parameters()),dict(layer.named_buffers()),x,*args,**kwargs)
+
+      def registerLayer(self,layer):
+        """
+        Share the done and level flags with the modules of a layer.
+        """
+        tb_utils.DoneFlag.module_register(layer,self.done_flag)
+        for l in layer.modules():
+          if hasattr(l,'level_flag'):
+            l.level_flag = self.level_flag
+
       def layerWeights(self,layer):
         return [p.data if p is not None else None for p in layer.parameters()] +[b for b in layer.buffers()]
 
@@ -153,7 +191,7 @@ class ForwardODENetApp(BraidApp):
           params = self.layerWeights(layer)
           for ind,p in enumerate(params):
             if p is not None and p.dtype!=torch.bool:
-              req = comm.Irecv(p,source=src_proc,tag=int(fine_index+tag_shift*ind))
+              req = comm.irecv(p,source=src_proc,tag=int(fine_index+tag_shift*ind))
               requests += [req]
 
         for fine_index,dest_proc in send_layers_list:
@@ -162,7 +200,7 @@ class ForwardODENetApp(BraidApp):
           params = self.layerWeights(layer_dict[fine_index])
           for ind,p in enumerate(params):
             if p is not None and p.dtype!=torch.bool:
-              req = comm.Isend(p,dest=dest_proc,tag=int(fine_index+tag_shift*ind))
+              req = comm.isend(p,dest=dest_proc,tag=int(fine_index+tag_shift*ind))
               requests += [req]
 
         return requests
@@ -234,6 +272,12 @@ class ForwardODENetApp(BraidApp):
 
     self.initial_guess = None
 
+    # evaluates independent steps together, see setBatchedSteps
+    self.batched_steps = None
+
+    # how the steps on the coarse levels are evaluated, see setLevelPolicy
+    self.level_policy = None
+
     self.backpropped = dict()
     self.state_shapes = dict()
 
@@ -344,7 +388,8 @@ class ForwardODENetApp(BraidApp):
     The function is called every time an intial guess
     is required. No assumption about consistency between
     calls is made. This is particularly useful if the
-    initial guess may be different between batches.
+    initial guess may be different between batches. If
+    getState returns None, the default guess is used.
 
     To disable the initial guess once set, call this
     method with intial_guess=None.
@@ -354,14 +399,17 @@ class ForwardODENetApp(BraidApp):
   def getFeatureShapes(self,tidx,level):
     i = self.getFineTimeIndex(tidx,level)
     ind = bisect_right(self.layers_data_structure.indices,i)
-    return [self.shape0[ind],]
+    return self.getSpatialShapes([self.shape0[ind],],level)
 
   def getParameterShapes(self,tidx,level):
     return []
 
   def initializeVector(self,t,x):
     if  self.initial_guess is not None and t != 0.0:
-      x.replaceTensor(copy.deepcopy(self.initial_guess.getState(t)))
+      state = self.initial_guess.getState(t)
+      # a None state means no guess is available, keep the default
+      if state is not None:
+        x.replaceTensor(copy.deepcopy(state))
   # end initializeVector 
 
   def beginUpdateWeights(self):
@@ -371,7 +419,7 @@ class ForwardODENetApp(BraidApp):
 
       # don't recommunicate the layer parameters
       if self.requests is None:
-        self.requests = self.layers_data_structure.sendRecvLayers(self.getMPIComm(),
+        self.requests = self.layers_data_structure.sendRecvLayers(self.getTensorComm(),
                                                                   self.buildLayersRecvList(),
                                                                   self.buildLayersSendList(),
                                                                   self.layer_dict,
@@ -380,7 +428,7 @@ class ForwardODENetApp(BraidApp):
   def endUpdateWeights(self):
     with self.timer("endUpdateWeights"):
       if self.requests is not None:
-        MPI.Request.Waitall(self.requests)
+        self.getTensorComm().waitall(self.requests)
         self.requests = None
 
   def run(self,x,extra_args,extra_kwargs):
@@ -424,6 +472,7 @@ class ForwardODENetApp(BraidApp):
     """
 
     self.layers_data_structure.updateLayerDoneFlag(done)
+    self.layers_data_structure.updateLayerLevel(level)
 
     ts_index = self.getGlobalTimeIndex(tstart)
     if level==0 and done and ts_index in self.layer_owned:
@@ -443,16 +492,101 @@ class ForwardODENetApp(BraidApp):
     if record and self.training:
       with torch.enable_grad():
         t_y.requires_grad = True
-        ny = layer(dt,t_y,*self.extra_args,**self.extra_kwargs)
+        ny = self.layers_data_structure.evalLayer(layer,level,dt,t_y,*self.extra_args,**self.extra_kwargs)
         y.replaceTensor(ny.detach().clone()) 
 
       self.backpropped[ts_index] = (t_y,ny)
+    elif self.level_policy is not None and self.level_policy.applies(level):
+      with torch.no_grad():
+        ny = self.evalWithPolicy(layer,dt,t_y,level)
+        y.replaceTensor(ny) 
     else:
       with torch.no_grad():
-        ny = layer(dt,t_y,*self.extra_args,**self.extra_kwargs)
+        ny = self.layers_data_structure.evalLayer(layer,level,dt,t_y,*self.extra_args,**self.extra_kwargs)
         y.replaceTensor(ny) 
   # end eval
 
+  def setStepCompiler(self,compiler):
+    """
+    Compile the steps with a StepCompiler, None evaluates them eagerly.
+    """
+    self.layers_data_structure.setCompiler(compiler)
+
+  def setLevelPolicy(self,policy):
+    """
+    Set the LevelExecutionPolicy used for the steps on the coarse levels, None 
+    evaluates every level with the original layers.
+    """
+    self.level_policy = policy
+
+    telemetry = self.getTelemetry()
+    if telemetry is not None:
+      telemetry.setTag('level_policy',None if policy is None else repr(policy))
+
+  def getLevelPolicy(self):
+    return self.level_policy
+
+  def evalWithPolicy(self,layer,dt,x,level):
+    """
+    Evaluate a step on the level as prescribed by the level policy, with the 
+    step compiler if one is set (see setStepCompiler).
+    """
+    layer = self.getPolicyLayer(layer,level)
+    return self.layers_data_structure.evalLayer(layer,level,dt,x,*self.extra_args,**self.extra_kwargs)
+
+  def getPolicyLayer(self,layer,level):
+    residual = isinstance(layer,ForwardODENetApp.ODEBlock)
+
+    def register(step):
+      self.layers_data_structure.registerLayer(step)
+      # the policy steps of the layers built by one functor share a compiled step
+      if hasattr(layer,'functor_index'):
+        step.functor_index = ('policy',layer.functor_index)
+
+    return self.level_policy.getLayer(layer,level,residual,register)
+
+  def setBatchedSteps(self,enable,min_group=2):
+    """
+    Turn on the batched evaluation of independent time steps in evalBatch.
+    """
+    if enable:
+      self.batched_steps = tb_utils.BatchedStepEngine(min_group)
+    else:
+      self.batched_steps = None
+
+  def evalBatch(self,ys,tstarts,tstops,level,done):
+    """
+    Propagate a set of independent states, ys[i] from tstarts[i] to tstops[i].
+    This is the batched version of eval, used by solvers that know which steps
+    are independent (e.g. the steps in different C-intervals in a relaxation 
+    sweep). XBraid calls my_step for one step at a time, so is not able to use this.
+
+    Returns a list of the propagated state tensors.
+    """
+    self.layers_data_structure.updateLayerDoneFlag(done)
+    self.layers_data_structure.updateLayerLevel(level)
+
+    indices = [self.getGlobalTimeIndex(t) for t in tstarts]
+    layers = [self.layer_dict[i] if i in self.layer_owned else self.getLayer(i) for i in indices]
+    dts = [tstop-tstart for tstart,tstop in zip(tstarts,tstops)]
+
+    # the steps that record the graph for back propagation are evaluated one at a time
+    record = (level==0 and done and self.training)
+
+    if self.batched_steps is None or record:
+      results = []
+      for y,tstart,tstop in zip(ys,tstarts,tstops):
+        x = BraidVector(y)
+        self.eval(x,tstart,tstop,level,done)
+        results += [x.tensor()]
+      return results
+
+    if self.level_policy is not None and self.level_policy.applies(level):
+      layers = [self.getPolicyLayer(l,level) for l in layers]
+
+    with torch.no_grad():
+      return self.batched_steps(layers,dts,[y.detach() for y in ys],self.extra_args,self.extra_kwargs)
+
   def getPrimalWithGrad(self,tstart,tstop,level,done):
     """ 
     Get the forward solution associated with this
@@ -482,11 +616,13 @@ class ForwardODENetApp(BraidApp):
     y = t_x.detach().clone()
 
     self.layers_data_structure.updateLayerDoneFlag(level==0 and done)
+    # the primal state comes from the fine level
+    self.layers_data_structure.updateLayerLevel(0)
 
     x.requires_grad = True 
     dt = tstop-tstart
     with torch.enable_grad():
-      y = layer(dt,x,*self.extra_args,**self.extra_kwargs)
+      y = self.layers_data_structure.evalLayer(layer,level,dt,x,*self.extra_args,**self.extra_kwargs)
     return (y, x), layer
   # end getPrimalWithGrad
 
@@ -598,7 +734,7 @@ class BackwardODENetApp(BraidApp):
   def getFeatureShapes(self,tidx,level):
     fine_idx = self.getFineTimeIndex(tidx,level)
     # need to map back to the global fine index on the forward grid
-    return self.fwd_app.getFeatureShapes(self.num_steps-fine_idx,0)
+    return self.getSpatialShapes(self.fwd_app.getFeatureShapes(self.num_steps-fine_idx,0),level)
 
   def eval(self,w,tstart,tstop,level,done):
     """
@@ -636,6 +772,12 @@ class BackwardODENetApp(BraidApp):
         # perform adjoint computations
         t_w = w.tensor()
         t_w.requires_grad = False
+
+        # on a spatially coarsened level, the primal step is on the fine features
+        coarsened = (t_w.shape!=t_y.shape)
+        if coarsened:
+          for l in reversed(range(level)):
+            t_w = self.spatial_refine(t_w,l)
         t_y.backward(t_w,retain_graph=(level==0))
 
         # The above set's the gradient of the layer.parameters(), which, in case of SpliNet, is the templayer -> need to spread those sensitivities to the layer_models
@@ -663,7 +805,11 @@ class BackwardODENetApp(BraidApp):
         # this little bit of pytorch magic ensures the gradient isn't
         # stored too long in this calculation (in particulcar setting
         # the grad to None after saving it and returning it to braid)
-        w.replaceTensor(t_x.grad.detach().clone()) 
+        t_grad = t_x.grad.detach()
+        if coarsened:
+          for l in range(level):
+            t_grad = self.spatial_coarse(t_grad,l)
+        w.replaceTensor(t_grad.clone()) 
         t_x.grad = None
 
         for p,s in zip(layer.parameters(),required_grad_state):
@@ -106,6 +106,18 @@ class BraidApp:
     self.user_mpi_buf = user_mpi_buf
     # turn on user-allocated MPI buffers
 
+    # options set after construction, these are stored so
+    # that the core can be rebuilt (see resetCore)
+    self.nrelax_levels = dict()
+    self.final_fc_relax = False
+    self.reverted = False
+    self.storage = None
+    self.min_coarse = None
+    self.fmg = False
+    self.crelax_wt = None
+    self.relax_only_cg = None
+    self.timer_filestem = None
+
     # build up the core
     self.py_core = self.initCore()
 
@@ -120,10 +132,24 @@ class BraidApp:
     self.enable_diagnostics = False
 
     self.first = True
-    self.reverted = False
 
     self.device = None
     self.use_cuda = False
+
+    # convergence and cost counters, see setTelemetry
+    self.telemetry = None
+
+    # adjusts iterations and tolerance after each solve, see setIterationController
+    self.iteration_controller = None
+
+    # in process solver used instead of XBraid, see setNativeSolver
+    self.native_solver = None
+
+    # tensor traffic outside of XBraid, see setTensorComm
+    self.tensor_comm = None
+
+    # MG/Opt parameter transfers for each level pair, see getTransferPlan
+    self.transfer_plans = dict()
   # end __init__
 
   def getNumSteps(self):
@@ -186,7 +212,19 @@ class BraidApp:
     specified level and time index.
     """
 
-    return list(self.shape0)
+    return self.getSpatialShapes(self.shape0,level)
+
+  def getSpatialShapes(self,shapes : list,level : int) -> list:
+    """
+    Get the feature shapes on a level, given the shapes on the fine level.
+
+    If the spatial_ref_pair provides levelShape (e.g., the pairs in
+    torchbraid.utils.spatial), the shapes are coarsened as XBraid coarsens the
+    features between levels. Otherwise, the shapes are not changed.
+    """
+    if self.spatial_mg and hasattr(self.spatial_ref_pair,'levelShape'):
+      return [self.spatial_ref_pair.levelShape(s,level) for s in shapes]
+    return list(shapes)
 
   def getParameterShapes(self,tidx : int,level : int) -> list:
     """
@@ -279,6 +317,9 @@ class BraidApp:
     return int(self.num_steps/cnt)
     
   def printRuntimeFuncCall(self, t_start, t_stop, method):
+    if self.telemetry is not None:
+      self.telemetry.recordCallback(t_stop-t_start)
+
     if self.tb_print_level >= 2:
       print(f'Model '
             f'| rank: {self.getMPIComm().Get_rank()} '
@@ -303,10 +344,19 @@ class BraidApp:
 
     cfactor : int | dict
       The coarsening factor(s) to be used.
+
+    XBraid builds the hierarchy on the first solve, so if a solve has already
+    been run and the factor changes the core is rebuilt (see resetCore).
     """
 
+    changed = (cfactor!=self.cfactor)
     self.cfactor = cfactor 
 
+    if changed and not self.first:
+      # initCore applies the new coarsening factor
+      self.resetCore()
+      return
+
     core = (<PyBraid_Core> self.py_core).getCore()
     if isinstance(cfactor,dict):
       for level in sorted(cfactor.keys()):
@@ -323,6 +373,7 @@ class BraidApp:
     """
     cdef PyBraid_Core py_core = <PyBraid_Core> self.py_core
     cdef braid_Core core = py_core.getCore()
+    self.final_fc_relax = True
     braid_SetFinalFCRelax(core)
   
   def initCore(self):
@@ -379,7 +430,8 @@ class BraidApp:
     braid_SetPrintLevel(core,self.print_level)
     braid_SetNRelax(core,-1,self.nrelax)
     braid_SetNRelax(core,0,0) # set F relax on fine grid
-    braid_SetCFactor(core,-1,self.cfactor) # -1 implies chage on all levels
+    if isinstance(self.cfactor,int):
+      braid_SetCFactor(core,-1,self.cfactor) # -1 implies chage on all levels
     braid_SetAbsTol(core,self.abs_tol)
     braid_SetAccessLevel(core,0)
     #braid_SetCRelaxWt(core, -1, 1.2)   # Turn on weighted relaxation, probably want to add command line argument
@@ -389,6 +441,29 @@ class BraidApp:
     else:
       braid_SetSkip(core,1)
 
+    # options set after construction (only applied when the core is rebuilt)
+    for level in sorted(self.nrelax_levels.keys()):
+      braid_SetNRelax(core,level,self.nrelax_levels[level])
+    if isinstance(self.cfactor,dict):
+      for level in sorted(self.cfactor.keys()):
+        braid_SetCFactor(core,level,self.cfactor[level])
+    if self.final_fc_relax:
+      braid_SetFinalFCRelax(core)
+    if self.reverted:
+      braid_SetRevertedRanks(core,self.reverted)
+    if self.storage is not None:
+      braid_SetStorage(core,self.storage)
+    if self.min_coarse is not None:
+      braid_SetMinCoarse(core,self.min_coarse)
+    if self.fmg:
+      braid_SetFMG(core)
+    if self.crelax_wt is not None:
+      braid_SetCRelaxWt(core,-1,self.crelax_wt)
+    if self.relax_only_cg is not None:
+      braid_SetRelaxOnlyCG(core,self.relax_only_cg)
+    if self.timer_filestem is not None:
+      braid_SetTimerFile(core,len(self.timer_filestem),self.timer_filestem.encode('utf-8'))
+
     #_braid_SetVerbosity(core,1)
 
     # store the c pointer
@@ -398,6 +473,69 @@ class BraidApp:
     return py_core
   # end initCore
 
+  def resetCore(self):
+    """
+    Destroy the XBraid core and build a new one using the stored options.
+
+    XBraid only builds its hierarchy on the first call to braid_Drive, so
+    options like the maximum number of levels only take effect on a new
+    core. Any stored state (initial guesses from the last solve) is lost.
+    """
+    if self.py_core is not None:
+      core = (<PyBraid_Core> self.py_core).getCore()
+      braid_Destroy(core)
+      self.py_core = None
+
+    self.py_core = self.initCore()
+    self.first = True
+
+  def releaseStorage(self):
+    """
+    Release the state vectors and the MPI buffers held by the XBraid core of
+    this app, by replacing it with a new core (see resetCore).
+
+    The storage is re-materialized lazily, XBraid rebuilds the hierarchy on
+    the next call to runBraid. The next solve starts from the initial guess
+    instead of the states of the last solve. Used by MG/Opt to release the
+    levels it is not working on.
+    """
+    if self.first or self.native_solver is not None:
+      return
+
+    self.resetCore()
+    self.buffer = []
+    self.x0 = None
+    self.x_final = None
+
+  def getResourceUsage(self):
+    """
+    The number of bytes held by this app on this rank, as a dictionary with the
+    entries:
+      states         : state vectors stored in the XBraid hierarchy, on all levels
+      buffers        : MPI buffers allocated by my_bufalloc
+      transfer_plans : message buffers of the cached MG/Opt transfer plans
+    """
+    cdef braid_Core core
+    cdef braid_BaseVector bv
+    cdef int nlevels
+
+    def nbytes(tensors):
+      return sum(t.numel()*t.element_size() for t in tensors if t is not None)
+
+    states = 0
+    if (not self.first) and (self.native_solver is None):
+      core = (<PyBraid_Core> self.py_core).getCore()
+      braid_GetNLevels(core, &nlevels)
+      for level in range(nlevels):
+        for index in range(core.grids[level].ilower, core.grids[level].iupper+1):
+          _braid_UGetVectorRef(core, level, index, &bv)
+          if <unsigned int>(bv)!=0:
+            states += nbytes((<object> bv.userVector).tensors())
+
+    return { 'states'         : states,
+             'buffers'        : nbytes(self.buffer),
+             'transfer_plans' : sum(plan.nbytes() for _,_,plan in self.transfer_plans.values()) }
+
   def __del__(self):
     if self.py_core is not None:
 
@@ -600,6 +738,9 @@ class BraidApp:
     #                NULL,    NULL,   NULL,    b_step)    
 
   def runBraid(self,x):
+    if self.native_solver is not None:
+      return self.runNativeSolver(x)
+
     start = time.time() - self.start_time
     cdef PyBraid_Core py_core = <PyBraid_Core> self.py_core
     cdef braid_Core core = py_core.getCore()
@@ -615,9 +756,21 @@ class BraidApp:
          self.initializeStates()
        self.first = False
 
+       if self.telemetry is not None:
+         self.telemetry.beginSolve()
+         drive_start = time.time()
+
        with self.timer("braid_Drive"):
          braid_Drive(core) # my_step -> App:eval -> resnet "basic block"
 
+       if self.telemetry is not None:
+         drive_time = time.time()-drive_start
+         iter_cnt,_ = self.getBraidStats()
+         self.telemetry.endSolve(iter_cnt,self.getBraidResidualHistory(),drive_time)
+
+       if self.iteration_controller is not None:
+         self.iteration_controller.endSolve(self)
+
        self.printBraidStats()
 
        fin = self.getFinal()
@@ -632,7 +785,55 @@ class BraidApp:
     self.printRuntimeFuncCall(t_start=start, t_stop=time.time() - self.start_time, method='runBraid')
     return fin
 
+  def runNativeSolver(self,x):
+    """
+    Solve with the in process solver instead of braid_Drive.
+    """
+    start = time.time() - self.start_time
+    fin = None
+    try:
+      if self.telemetry is not None:
+        self.telemetry.beginSolve()
+        drive_start = time.time()
+
+      with self.timer("native_solve"):
+        fin = self.native_solver.run(x)
+
+      if self.telemetry is not None:
+        drive_time = time.time()-drive_start
+        self.telemetry.endSolve(self.native_solver.getNumIterations(),
+                                self.native_solver.getResidualHistory(),drive_time)
+
+      if self.iteration_controller is not None:
+        self.iteration_controller.endSolve(self)
+    except:
+      output_exception('runNativeSolver')
+
+    if torch.cuda.is_available():
+      torch.cuda.synchronize()
+    self.printRuntimeFuncCall(t_start=start, t_stop=time.time() - self.start_time, method='runNativeSolver')
+    return fin
+
+  def setNativeSolver(self,solver):
+    """
+    Set an in process solver (e.g. NativeMGRIT) to use instead of XBraid.
+
+    Parameters
+    ----------
+
+    solver : NativeMGRIT | None
+      The solver, if None XBraid is used.
+    """
+    self.native_solver = solver
+
+  def getNativeSolver(self):
+    return self.native_solver
+
   def getBraidStats(self):
+    if self.native_solver is not None:
+      history = self.native_solver.getResidualHistory()
+      return self.native_solver.getNumIterations(),(history[-1] if len(history)>0 else 0.0)
+
     cdef PyBraid_Core py_core = <PyBraid_Core> self.py_core
     cdef braid_Core core = py_core.getCore()
 
@@ -646,7 +847,70 @@ class BraidApp:
     braid_GetRNorms(core, &niter, &resnorm);
 
     return iter_cnt,resnorm
-  # end printBraidStats
+  # end getBraidStats
+
+  def getBraidResidualHistory(self):
+    """
+    Get the residual norm computed at each iteration of the last solve.
+
+    Returns
+    -------
+
+    A list of floats, one for each iteration.
+    """
+    if self.native_solver is not None:
+      return self.native_solver.getResidualHistory()
+
+    cdef PyBraid_Core py_core = <PyBraid_Core> self.py_core
+    cdef braid_Core core = py_core.getCore()
+
+    cdef int iter_cnt
+    cdef int nrequest
+    cdef double * rnorms
+
+    braid_GetNumIter(core, &iter_cnt);
+
+    nrequest = iter_cnt+1 
+    rnorms = <double *> malloc(nrequest*sizeof(double))
+    braid_GetRNorms(core, &nrequest, rnorms);
+
+    history = [rnorms[i] for i in range(nrequest)]
+    free(rnorms)
+
+    return history
+  # end getBraidResidualHistory
+
+  def setTelemetry(self,telemetry):
+    """
+    Set the object recording convergence and cost for each solve.
+
+    Parameters
+    ----------
+
+    telemetry : BraidTelemetry | None
+      Object to record the telemetry, if None telemetry is disabled.
+    """
+    self.telemetry = telemetry
+
+  def getTelemetry(self):
+    return self.telemetry
+
+  def setIterationController(self,controller):
+    """
+    Set the object that adjusts the iteration cap and tolerance after each solve.
+
+    Parameters
+    ----------
+
+    controller : AdaptiveIterationController | None
+      The controller, if None the iteration cap and tolerance are fixed.
+    """
+    self.iteration_controller = controller
+    if controller is not None:
+      controller.attach(self)
+
+  def getIterationController(self):
+    return self.iteration_controller
 
   def printBraidStats(self):
     cdef PyBraid_Core py_core = <PyBraid_Core> self.py_core
@@ -674,22 +938,59 @@ class BraidApp:
     return self.py_core    
  
   def setStorage(self, storage):
+    self.storage = storage
     core = (<PyBraid_Core> self.py_core).getCore()
     braid_SetStorage(core, storage)
 
   def setMinCoarse(self, mc):
+    self.min_coarse = mc
     core = (<PyBraid_Core> self.py_core).getCore()
     braid_SetMinCoarse(core, mc)
 
   def setNumRelax(self,relax,level=-1):
-    self.nrelax = relax 
+    if level==-1:
+      # this includes the fine level
+      self.nrelax = relax 
+      self.nrelax_levels = {0 : relax}
+    else:
+      self.nrelax_levels[level] = relax
 
     core = (<PyBraid_Core> self.py_core).getCore()
-    braid_SetNRelax(core,level,self.nrelax)
+    braid_SetNRelax(core,level,relax)
+
+  def getNumRelax(self):
+    return self.nrelax
 
   def getMaxIters(self):
     return self.max_iters
 
+  def getMaxLevels(self):
+    return self.max_levels
+
+  def setMaxLevels(self,max_levels):
+    """
+    Set the maximum number of levels in the MGRIT hierarchy.
+
+    XBraid builds the hierarchy on the first solve, so if a solve has already
+    been run the core is rebuilt (see resetCore).
+    """
+    if max_levels==self.max_levels:
+      return
+
+    self.max_levels = max_levels
+
+    if not self.first:
+      self.resetCore()
+    else:
+      core = (<PyBraid_Core> self.py_core).getCore()
+      braid_SetMaxLevels(core, self.max_levels)
+
+  def getCFactor(self):
+    return self.cfactor
+
+  def getSkipDowncycle(self):
+    return self.skip_downcycle==1
+
   def setMaxIters(self,max_iters):
     self.max_iters = max_iters
 
@@ -703,19 +1004,23 @@ class BraidApp:
     braid_SetAbsTol(core,self.abs_tol)
 
   def setFMG(self):
+    self.fmg = True
     core = (<PyBraid_Core> self.py_core).getCore()
     braid_SetFMG(core)
 
   def setCRelaxWt(self, CWt):
+    self.crelax_wt = CWt
     core = (<PyBraid_Core> self.py_core).getCore()
     braid_SetCRelaxWt(core, -1, CWt)
 
   def setRelaxOnlyCG(self, flag):
+    self.relax_only_cg = flag
     core = (<PyBraid_Core> self.py_core).getCore()
     braid_SetRelaxOnlyCG(core, flag)
 
 
   def setTimerFile(self, filestem):
+    self.timer_filestem = filestem
     core = (<PyBraid_Core> self.py_core).getCore()
     braid_SetTimerFile(core, len(filestem), filestem.encode('utf-8'))
 
@@ -736,6 +1041,9 @@ class BraidApp:
     core = (<PyBraid_Core> self.py_core).getCore()
     braid_SetSkip(core,self.skip_downcycle)
 
+  def getAbsTol(self):
+    return self.abs_tol
+
   def setRevertedRanks(self,reverted):
     self.reverted = reverted 
     core = (<PyBraid_Core> self.py_core).getCore()
@@ -746,6 +1054,9 @@ class BraidApp:
     cdef braid_Core core = (<PyBraid_Core> self.py_core).getCore()
     cdef braid_BaseVector bv
 
+    if self.native_solver is not None:
+      return self.native_solver.getUVector(level,t)
+
     with self.timer("getUVector"): 
       
       index = self.getGlobalTimeIndex(t)
@@ -760,6 +1071,30 @@ class BraidApp:
   def getMPIComm(self):
     return self.mpi_comm
 
+  def setTensorComm(self,tensor_comm):
+    """
+    Set the communicator used for the tensor traffic outside of XBraid 
+    (layer weights, boundary states and gradients). XBraid always uses
+    the MPI communicator.
+
+    Parameters
+    ----------
+
+    tensor_comm : TensorComm | None
+      The communicator, if None the MPI communicator is used.
+    """
+    if tensor_comm is not None:
+      assert tensor_comm.Get_size()==self.mpi_comm.Get_size()
+      assert tensor_comm.Get_rank()==self.mpi_comm.Get_rank()
+    self.tensor_comm = tensor_comm
+
+  def getTensorComm(self):
+    if self.tensor_comm is None:
+      from torchbraid.utils import MPITensorComm
+      # device tensors go through host memory, unless MPI is GPU aware
+      self.tensor_comm = MPITensorComm(self.mpi_comm,stage=not self.user_mpi_buf)
+    return self.tensor_comm
+
   def getGlobalTimeIndex(self,t):
     return round(t / self.dt)
 
@@ -844,6 +1179,10 @@ class BraidApp:
     cdef braid_BaseVector bv 
     cdef braid_Core core = (<PyBraid_Core> self.py_core).getCore()
 
+    if self.native_solver is not None:
+      assert level==0
+      return self.native_solver.getTimePoints()
+
     times  = []
     values = []
     for i in range(core.grids[level].ilower,core.grids[level].iupper+1):
@@ -1034,6 +1373,147 @@ class BraidApp:
     return np.arange(clower, cupper + 1, cf, dtype=int)
 
 
+  def getTransferPlan(self, model_fine, model_coarse, cf, restrict):
+    '''
+    Return the TransferPlan moving the layer-parallel parameters from
+    model_coarse to model_fine (restrict is False, injection interpolation) or
+    from model_fine to model_coarse (restrict is True, injection restriction).
+
+    The plan depends only on the layer distributions of the two levels, so it is
+    built on first use and cached on this app for each (fine, coarse) level pair.
+    '''
+    key = (id(model_fine), id(model_coarse), cf, restrict)
+    if key in self.transfer_plans:
+      return self.transfer_plans[key][-1]
+
+    from torchbraid.transfer_plan import TransferPlan
+
+    fine_fwd_app = model_fine.parallel_nn.fwd_app
+    coarse_fwd_app = model_coarse.parallel_nn.fwd_app
+    my_rank = fine_fwd_app.mpi_comm.Get_rank()
+
+    ##
+    # Get ilower and iupper points on local time-grid indices.  These come from the
+    # distribution of the time steps, so the plan can be built for a level whose
+    # hierarchy was released (see releaseStorage)
+    coarse_ilower, coarse_iupper = coarse_fwd_app.getStepBounds()   # index of lowest and highest (inclusive) layers owned by proc
+    coarse_gupper = coarse_fwd_app.num_steps                        # global upper index of layers
+    fine_ilower, fine_iupper = fine_fwd_app.getStepBounds()
+    fine_gupper = fine_fwd_app.num_steps
+
+    if restrict:
+      src_app, src_model, src_ilower, src_iupper, src_gupper = fine_fwd_app, model_fine, fine_ilower, fine_iupper, fine_gupper
+      dst_app, dst_model, dst_ilower, dst_iupper, dst_gupper = coarse_fwd_app, model_coarse, coarse_ilower, coarse_iupper, coarse_gupper
+    else:
+      src_app, src_model, src_ilower, src_iupper, src_gupper = coarse_fwd_app, model_coarse, coarse_ilower, coarse_iupper, coarse_gupper
+      dst_app, dst_model, dst_ilower, dst_iupper, dst_gupper = fine_fwd_app, model_fine, fine_ilower, fine_iupper, fine_gupper
+
+    ##
+    # Check that your layer parallel torchbraid model is the same length as expected by Braid
+    # On last _active_ processor, the number of layers is one less than the number of points
+    src_layers = list(src_model.parallel_nn.layer_models)
+    num_layer_parallel = len(src_layers)
+    if my_rank == self.GetProc(src_app, src_gupper): 
+      num_layer_parallel = num_layer_parallel + 1
+    if (num_layer_parallel != (src_iupper - src_ilower + 1) ):
+      output_exception("getTransferPlan:  number of LayerParallel layers " + str(num_layer_parallel) +\
+                       " not what was expected based on ilower and iupper, " + str(src_iupper - src_ilower + 1) )
+
+    ##
+    # Sends, grouped by destination in increasing layer index.
+    # Interpolation duplicates each coarse layer to cf fine layers,
+    # restriction injects the layers at C-points
+    sends = dict()
+    for i, layer in enumerate(src_layers):
+      if restrict:
+        if ((src_ilower + i) % cf) != 0:
+          continue
+        points = [ (src_ilower + i) // cf ]
+      else:
+        points = [ (src_ilower + i)*cf + d for d in range(cf) ]
+
+      for point in points:
+        dest = self.GetProc(dst_app, point)
+        sends.setdefault(dest, []).append(layer)
+
+    ##
+    # Receives, one for each owner of a range of the local layers.
+    # ==> Note that the global last time-point doesn't have a corresponding layer to receive 
+    dst_layers = list(dst_model.parallel_nn.layer_models)
+    last_point = dst_iupper + 1
+    if (dst_iupper == dst_gupper):
+      last_point = dst_iupper
+    recvs = []
+    for point in range(dst_ilower, last_point):
+      # Processor owning the source layer of this point
+      if restrict: source = self.GetProc(src_app, point*cf)
+      else:        source = self.GetProc(src_app, point // cf)
+
+      if len(recvs) == 0 or recvs[-1][0] != source:
+        recvs.append( (source, []) )
+      recvs[-1][1].append( dst_layers[point - dst_ilower] )
+
+    plan = TransferPlan(self.getTensorComm(), sorted(sends.items()), recvs, tag=7919)
+    # the models are kept so their ids can't be reused
+    self.transfer_plans[key] = (model_fine, model_coarse, plan)
+    return plan
+
+  def getOpenCloseParams(self, model, grad=False):
+    ''' 
+    Copy the parameters (or gradients) of the OpenLayer and CloseLayer of model,
+    these are injected directly between levels on rank 0.
+    '''
+    open_params = None
+    close_params = None
+    with torch.no_grad():
+      for child in model.children():
+        if child is model.parallel_nn:
+          continue
+
+        name = type(child).__name__
+        lp_params = []
+        for param in child.parameters():
+          if grad: lp_params.append(param.grad.clone().detach())    # Note the clone, i.e., deep copy
+          else:    lp_params.append(param.clone().detach())
+        
+        if name == 'CloseLayer':
+          close_params = lp_params
+        elif name == 'OpenLayer':
+          open_params = lp_params
+        else:
+          output_exception('Layer type needs to be OpenLayer, CloseLayer, or LayerParallel')
+
+    if open_params == None:
+      output_exception('OpenLayer not found on rank 0')
+    if close_params == None:
+      output_exception('CloseLayer not found on rank 0')
+    return open_params + close_params
+
+  def parallel_injection_transfer(self, model_fine, model_coarse, cf, restrict, grad):
+    '''
+    Run the cached TransferPlan for this level pair, see parallel_injection_interp_params
+    and parallel_injection_restrict_params. If grad is 'both', the parameters and
+    gradients travel in the same messages and a tuple (params, grads) is returned.
+    '''
+    plan = self.getTransferPlan(model_fine, model_coarse, cf, restrict)
+    src_model = model_fine if restrict else model_coarse
+    my_rank = self.mpi_comm.Get_rank()
+
+    ##
+    # Rank 0:    parameter order is LayerParallel, OpenLayer, CloseLayer
+    # Rank k>0:  owns a chunk of LayerParallel
+    if grad == 'both':
+      params, grads = plan.execute(params=True, grads=True)
+      if my_rank == 0:
+        params = params + self.getOpenCloseParams(src_model, grad=False)
+        grads  = grads  + self.getOpenCloseParams(src_model, grad=True)
+      return params, grads
+
+    params = plan.execute(params=not grad, grads=bool(grad))
+    if my_rank == 0:
+      params = params + self.getOpenCloseParams(src_model, grad=bool(grad))
+    return params
+
   def parallel_injection_interp_params(self, model_fine, model_coarse, cf=2, grad=False):
     
     ''' 
@@ -1044,7 +1524,11 @@ class BraidApp:
     
     Return a list of the interpolated model parameters.  Always do a deep copy.
 
-    If grad is True, return the network gradient instead
+    If grad is True, return the network gradient instead. If grad is 'both', return
+    a tuple of the parameters and gradients, which share the messages.
+
+    The communication pattern is precomputed for each level pair (see
+    getTransferPlan), every pair of processors exchanges one packed message.
     
     Note: The placement of this function is a bit odd.  We interpolate MGOpt
     solver parameters by calling a function that resides inside the forward
@@ -1055,160 +1539,9 @@ class BraidApp:
       messages to do that.
 
     '''
-    # See
-    # https://stackoverflow.com/questions/383565/how-to-iterate-over-a-list-repeating-each-element-in-python
-    def duplicate(iterable,n):
-      """A generator that repeats each entry n times"""
-      for item in iterable:
-        first = True
-        for _ in range(n):
-          yield item,first
-          first = False
-    
-    ##
-    # Get foward apps 
-    fine_fwd_app = model_fine.parallel_nn.fwd_app
-    coarse_fwd_app = model_coarse.parallel_nn.fwd_app
-    
-    ##
-    # Set up comm and return value interp_params
-    comm = fine_fwd_app.mpi_comm
-    my_rank = comm.Get_rank()
-    num_ranks = comm.Get_size()
-    open_params = None
-    close_params = None
-    send_requests = []
-    recv_requests = []
-    
-    ##
-    # Get braid_Core's, and ilower and iupper points on local time-grid indices
-    cdef braid_Core fine_fwd_core = (<PyBraid_Core> fine_fwd_app.py_core).getCore()
-    cdef braid_Core coarse_fwd_core = (<PyBraid_Core> coarse_fwd_app.py_core).getCore()
-    cdef coarse_ilower = coarse_fwd_core.grids[0].ilower    # index of lowest layers owned by proc
-    cdef coarse_iupper = coarse_fwd_core.grids[0].iupper    # index of highest layers owned by proc (inclusive)
-    cdef coarse_gupper = coarse_fwd_core.grids[0].gupper    # global upper index of layers
-    cdef fine_ilower = fine_fwd_core.grids[0].ilower
-    cdef fine_iupper = fine_fwd_core.grids[0].iupper
-    cdef fine_gupper = fine_fwd_core.grids[0].gupper
-    cdef int tag
-
-    ##
-    # Check that your layer parallel torchbraid model is the same length as expected by Braid
-    num_layer_parallel = 0
-    with torch.no_grad():
-      for child in model_coarse.children():
-        name = str(type(child))
-        name = name[ name.rfind('.')+1 : name.rfind('\'') ]
-        if name == 'LayerParallel':
-          for lp_child in child.layer_models:
-            num_layer_parallel = num_layer_parallel + 1
-    ##
-    # On last _active_ processor, num_layer_parallel is one less than the number of layers
-    if my_rank == self.GetProc(coarse_fwd_app, coarse_gupper): 
-      num_layer_parallel = num_layer_parallel + 1
-    if (num_layer_parallel != (coarse_iupper - coarse_ilower + 1) ):
-      output_exception("parallel_injection_interp_params:  number of LayerParallel layers " + str(num_layer_parallel) +\
-                       " not what was expected based on ilower and iupper, " + str(coarse_iupper - coarse_ilower + 1) )
-    
-    ##
-    # Loop 1: loop over all children, MPI sending the interpolated layer-parallel weights 
-    with torch.no_grad():
-      for child in model_coarse.children():
-        name = str(type(child))
-        name = name[ name.rfind('.')+1 : name.rfind('\'') ]
-        
-        # handle layer parallel modules differently 
-        if name == 'LayerParallel':
-
-          fidx = 0
-          # loop over each layer-parallel layer
-          # note, that duplicate does the piece-wise interpolation
-          for (lp_child, lp_f) in duplicate(child.layer_models, cf):
-            lp_params = []
-            for param in lp_child.parameters():
-              if grad: lp_params.append(param.grad.clone().detach())
-              else:    lp_params.append(param.clone().detach())
-            # end for param loop
-            
-            # MPI tag is the LayerParallel index (on fine grid) of this time point
-            tag = coarse_ilower*cf + fidx
-            proc = self.GetProc(fine_fwd_app, tag)
-            req = comm.isend(lp_params, dest=proc, tag=tag)  
-            send_requests.append( req )
-            
-            fidx = fidx + 1
-          # end for lp_child loop
-                 
-        else:
-          
-          # Do simple injection for the opening and closing layers.  
-          lp_params=[]
-          for param in child.parameters():
-            if grad: lp_params.append(param.grad.clone().detach())    # Note the clone, i.e., deep copy
-            else:    lp_params.append(param.clone().detach())
-          
-          if name == 'CloseLayer':
-            close_params = lp_params
-          elif name == 'OpenLayer':
-            open_params = lp_params
-          else:
-            output_exception('Layer type needs to be OpenLayer, CloseLayer, or LayerParallel')
-
-      # end for child loop
-    
-      ##
-      # Begin construction of output.
-      # Rank 0:    parameter order is LayerParallel, OpenLayer, CloseLayer
-      # Rank k>0:  owns a chunk of LayerParallel
-      interp_params = []
-      
-      ##
-      # Loop over fine model, receiving all of your weights at every layer (F and C)
-      # ==> Note that the global last time-point doesn't have a corresponding layer to receive 
-      last_point = fine_iupper + 1
-      if (fine_iupper == fine_gupper):
-        last_point = fine_iupper
-      for point in np.arange(fine_ilower, last_point):
-      
-        # Processor to receive from (owns Cpt to the left of "point")
-        proc = self.GetProc(coarse_fwd_app, int(point/cf))
-        # Receive params (rely on pickle to convert data types (list and torch.nn.Parameter)
-        req = comm.irecv(source=proc, tag=point)
-        recv_requests.append( req )
-
-      for req in recv_requests:
-        # Store params in order from layer 0 to layer gupper
-        lp_params = req.wait()
-        interp_params = interp_params + lp_params
-      
-      ##
-      # If processor 0, interpolate OpenLayer and CloseLayer
-      # Note: interpolation is just a "deep" copy of open_params
-      if my_rank == 0:
-        if open_params == None:
-          output_exception('OpenLayer not found on rank 0')
-        #
-        interp_params = interp_params + open_params
-        
-        if close_params == None:
-          output_exception('CloseLayer not found on rank 0')
-        #
-        interp_params = interp_params + close_params
-      
-      ##
-      # Finish all sends
-      for req in send_requests:
-        req.wait()
-
-    ##
     # If spatial coarsening is ever desired, an interpolation function could be
-    # applied here to interp_params
-    #
-    # If/when we incorporate state interpolation here, we could write the
-    # state and params directly into model_fine 
-    
-    return interp_params
-  
+    # applied here to the result
+    return self.parallel_injection_transfer(model_fine, model_coarse, cf, False, grad)
   
 
   def parallel_injection_restrict_params(self, model_fine, model_coarse, cf=2, grad=False):
@@ -1221,161 +1554,11 @@ class BraidApp:
     
     Return a list of the restricted model parameters.  Always do a deep copy.
 
-    If grad is True, return the network gradient instead
+    If grad is True, return the network gradient instead. If grad is 'both', return
+    a tuple of the parameters and gradients, which share the messages.
     
     Note: The placement of this function is a bit odd.  See above discussion at
     start of parallel_injection_interp_params.  
     '''
-    # See
-    # https://stackoverflow.com/questions/383565/how-to-iterate-over-a-list-repeating-each-element-in-python
-    def duplicate(iterable,n):
-      """A generator that repeats each entry n times"""
-      for item in iterable:
-        first = True
-        for _ in range(n):
-          yield item,first
-          first = False
-    
-    ##
-    # Get foward apps 
-    fine_fwd_app = model_fine.parallel_nn.fwd_app
-    coarse_fwd_app = model_coarse.parallel_nn.fwd_app
-    
-    ##
-    # Set up comm and return value interp_params
-    comm = fine_fwd_app.mpi_comm
-    my_rank = comm.Get_rank()
-    num_ranks = comm.Get_size()
-    open_params = None
-    close_params = None
-    send_requests = []
-    recv_requests = []
-    
-    ##
-    # Get braid_Core's, and ilower and iupper points on local time-grid indices
-    cdef braid_Core fine_fwd_core = (<PyBraid_Core> fine_fwd_app.py_core).getCore()
-    cdef braid_Core coarse_fwd_core = (<PyBraid_Core> coarse_fwd_app.py_core).getCore()
-    cdef coarse_ilower = coarse_fwd_core.grids[0].ilower    # index of lowest layers owned by proc
-    cdef coarse_iupper = coarse_fwd_core.grids[0].iupper    # index of highest layers owned by proc (inclusive)
-    cdef coarse_gupper = coarse_fwd_core.grids[0].gupper    # global upper index of layers
-    cdef fine_ilower = fine_fwd_core.grids[0].ilower
-    cdef fine_iupper = fine_fwd_core.grids[0].iupper
-    cdef fine_gupper = fine_fwd_core.grids[0].gupper
-    cdef int tag
-
-    ##
-    # Check that your layer parallel torchbraid model is the same length as expected by Braid
-    num_layer_parallel = 0
-    with torch.no_grad():
-      for child in model_fine.children():
-        name = str(type(child))
-        name = name[ name.rfind('.')+1 : name.rfind('\'') ]
-        if name == 'LayerParallel':
-          for lp_child in child.layer_models:
-            num_layer_parallel = num_layer_parallel + 1
-    ##
-    # On last _active_ processor, num_layer_parallel is one less than the number of layers
-    if my_rank == self.GetProc(fine_fwd_app, fine_gupper): 
-      num_layer_parallel = num_layer_parallel + 1
-    if (num_layer_parallel != (fine_iupper - fine_ilower + 1) ):
-      output_exception("parallel_injection_restrict_params: number of LayerParallel layers " + str(num_layer_parallel) + " not what was expected based on ilower and iupper, " + str(fine_iupper - fine_ilower + 1) )
-    
-    ##
-    # Loop 1: loop over all children, MPI sending the restricted layer-parallel weights 
-    with torch.no_grad():
-      for child in model_fine.children():
-        name = str(type(child))
-        name = name[ name.rfind('.')+1 : name.rfind('\'') ]
-        
-        # handle layer parallel modules differently 
-        if name == 'LayerParallel':
-
-          fidx = -1
-          # loop over each layer-parallel layer
-          for lp_child in child.layer_models: 
-            # Only do restriction if C-point
-            fidx = fidx + 1
-            if ((fine_ilower + fidx) % cf) == 0:
-              lp_params = []
-              for param in lp_child.parameters():
-                if grad: lp_params.append(param.grad.clone().detach())
-                else:    lp_params.append(param.clone().detach())
-              # end for param loop
-              
-              #MPI tag is the LayerParallel index (on coarse grid) of this time point
-              tag = int( (fine_ilower + fidx) / cf )
-              proc = self.GetProc(coarse_fwd_app, tag)
-              req = comm.isend(lp_params, dest=proc, tag=tag)  
-              send_requests.append( req )
-            
-          # end for lp_child loop
-                 
-        else:
-          
-          # Do simple injection for the opening and closing layers.  
-          lp_params=[]
-          for param in child.parameters():
-            if grad: lp_params.append(param.grad.clone().detach())    # Note the clone, i.e., deep copy
-            else:    lp_params.append(param.clone().detach())
-          
-          if name == 'CloseLayer':
-            close_params = lp_params
-          elif name == 'OpenLayer':
-            open_params = lp_params
-          else:
-            output_exception('Layer type needs to be OpenLayer, CloseLayer, or LayerParallel')
-
-      # end for child loop
-    
-      ##
-      # Begin construction of output.
-      # Rank 0:    parameter order is LayerParallel, OpenLayer, CloseLayer
-      # Rank k>0:  owns a chunk of LayerParallel
-      restrict_params = []
-      
-      ##
-      # Loop over coarse model, receiving all of your weights at every layer (F and C)
-      # ==> Note that the global last time-point doesn't have a corresponding layer to receive 
-      last_point = coarse_iupper + 1
-      if (coarse_iupper == coarse_gupper):
-        last_point = coarse_iupper
-      for point in np.arange(coarse_ilower, last_point):
-        # Processor to receive from
-        proc = self.GetProc(fine_fwd_app, int(point*cf))
-        # Receive params (rely on pickle to convert data types (list and torch.nn.Parameter)
-        req = comm.irecv(source=proc, tag=point)
-        recv_requests.append( req )
-
-      for req in recv_requests:
-        # Store params in order from layer 0 to layer gupper
-        lp_params = req.wait()
-        restrict_params = restrict_params + lp_params
-      
-      ##
-      # If processor 0, interpolate OpenLayer and CloseLayer
-      # Note: interpolation is just a "deep" copy of open_params
-      if my_rank == 0:
-        if open_params == None:
-          output_exception('OpenLayer not found on rank 0')
-        #
-        restrict_params = restrict_params + open_params
-        
-        if close_params == None:
-          output_exception('CloseLayer not found on rank 0')
-        #
-        restrict_params = restrict_params + close_params
-      
-      ##
-      # Finish all sends
-      for req in send_requests:
-        req.wait()
-      
-    ##
-    # If spatial coarsening is ever desired, an interpolation function could be
-    # applied here to restrict_params
-    #
-    # If/when we incorporate state interpolation, we could write the
-    # state and params directly into model_fine instead of returning
-    
-    return restrict_params
+    return self.parallel_injection_transfer(model_fine, model_coarse, cf, True, grad)
 # end BraidApp
@@ -106,6 +106,9 @@ cdef int my_step(braid_App app, braid_Vector ustop, braid_Vector fstop, braid_Ve
       # modify the state vector in place
       pyApp.eval(u,tstart,tstop,level,done)
 
+      if pyApp.telemetry is not None:
+        pyApp.telemetry.recordStep(level,time.time()-pyApp.start_time-start)
+
       # store final step
       if level==0 and tstop==pyApp.Tf:
         pyApp.x_final = u.clone()
@@ -285,6 +288,9 @@ cdef int my_bufpack_cpu(braid_App app, braid_Vector u, void *buffer,int tidx, in
         tbuffer.copy_(flat)
         start += size
 
+      if pyApp.telemetry is not None:
+        pyApp.telemetry.recordSend(start*get_bytes(float))
+
   except:
     output_exception("my_bufpack_cpu")
 
@@ -312,6 +318,9 @@ cdef int my_bufpack_cuda(braid_App app, braid_Vector u, void *buffer,int tidx, i
         app_buffer[start:start + size] = flat
         start += size
 
+      if pyApp.telemetry is not None:
+        pyApp.telemetry.recordSend(start*get_bytes(__float_alloc_type__))
+
       # finish the data movement
       torch.cuda.synchronize()
 
@@ -445,7 +454,8 @@ cdef int my_refine(braid_App app, braid_Vector cu, braid_Vector *fu_ptr, braid_C
   with pyApp.timer("refine"):
     ten_cu =  (<object> cu).tensor()
 
-    braid_CoarsenRefStatusGetNRefine(status,&level)
+    # the fine level of the transition, as in my_coarsen
+    braid_CoarsenRefStatusGetLevel(status,&level)
 
     fu_mem = pyApp.spatial_refine(ten_cu,level)
     fu_vec = BraidVector(fu_mem)
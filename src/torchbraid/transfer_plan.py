@@ -0,0 +1,198 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import torch
+
+__all__ = ['TransferPlan']
+
+class TransferPlan:
+  """
+  A precomputed exchange of layer parameters (and gradients) between two
+  levels of the MG/Opt hierarchy, used by the parallel injection interpolation
+  and restriction.
+
+  Every pair of processors exchanges one message: the sender packs all the
+  layers bound for a destination into a single contiguous buffer, and the
+  receiver splits its buffer into views shaped like its own layers. The buffers
+  and (persistent) requests are allocated on first use and reused afterwards. 
+  When several quantities are requested (e.g., parameters and gradients), each
+  message holds all the parameters followed by all the gradients.
+  """
+
+  def __init__(self,comm,sends,recvs,tag=0):
+    """
+    Parameters
+    ----------
+
+    comm : TensorComm
+      The communicator used for the messages
+
+    sends : list
+      List of (destination rank, layers) with the local layers sent to each
+      destination, in the order the destination expects them
+
+    recvs : list
+      List of (source rank, layers) with the layers of the receiving model that 
+      are filled by each source, in the order of the output
+
+    tag : int
+      The MPI tag of the messages
+    """
+    self.comm = comm
+    self.rank = comm.Get_rank()
+    self.sends = sends
+    self.recvs = recvs
+    self.tag = tag
+
+    self.recv_shapes = [[p.shape for l in layers for p in l.parameters()] for _,layers in recvs]
+    self.buffers = dict()
+
+  @staticmethod
+  def flatten(layers,getter):
+    """
+    Flatten the tensors getter(p) for the parameters p of layers, a None
+    is replaced by zeros.
+    """
+    result = []
+    for l in layers:
+      for p in l.parameters():
+        t = getter(p)
+        if t is None:
+          result.append(torch.zeros(p.numel(),dtype=p.dtype,device=p.device))
+        else:
+          result.append(t.detach().reshape(-1))
+    return result
+
+  @staticmethod
+  def get_param(p):
+    return p
+
+  @staticmethod
+  def get_grad(p):
+    return p.grad
+
+  def allocate(self,parts,dtype,device):
+    """
+    Allocate the message buffers and the persistent requests, for messages
+    holding "parts" copies of the layer sizes (parameters and/or gradients).
+    """
+    send_buffers = []
+    for dest,layers in self.sends:
+      numel = parts*sum(p.numel() for l in layers for p in l.parameters())
+      send_buffers.append(torch.empty(numel,dtype=dtype,device=device))
+
+    recv_buffers = []
+    for shapes in self.recv_shapes:
+      numel = parts*sum(s.numel() for s in shapes)
+      recv_buffers.append(torch.empty(numel,dtype=dtype,device=device))
+
+    # messages to this rank are copied, the others use persistent requests
+    recv_requests = [self.comm.recv_init(buf,source,self.tag) 
+                     for (source,_),buf in zip(self.recvs,recv_buffers) if source!=self.rank]
+    send_requests = [self.comm.send_init(buf,dest,self.tag) 
+                     for (dest,_),buf in zip(self.sends,send_buffers) if dest!=self.rank]
+
+    return send_buffers,recv_buffers,recv_requests,send_requests
+
+  def execute(self,params=True,grads=False):
+    """
+    Exchange the parameters and/or the gradients.
+
+    Returns a list of the received parameters or gradients, in the order of the 
+    receiving layers. If both are requested a tuple (parameters, gradients) is
+    returned. The tensors are views into fresh storage, one copy per source.
+    """
+    assert(params or grads)
+    getters = [g for g,use in [(self.get_param,params),(self.get_grad,grads)] if use]
+
+    results = self.exchange(getters)
+    if len(results)==2:
+      return tuple(results)
+    return results[0]
+
+  def exchange(self,getters):
+    """
+    Exchange the tensors getter(p) for the parameters p of the layers, these must
+    have the shape of the parameter (e.g., gradients or optimizer state). All the 
+    getters share the messages. 
+
+    Returns one list for each getter, ordered as in execute.
+    """
+    layer_params = [p for _,layers in self.sends+self.recvs for l in layers for p in l.parameters()]
+    if len(layer_params)==0:
+      return [[] for _ in getters]
+    ref = layer_params[0]
+
+    key = (len(getters),ref.dtype,ref.device)
+    if key not in self.buffers:
+      self.buffers[key] = self.allocate(len(getters),ref.dtype,ref.device)
+    send_buffers,recv_buffers,recv_requests,send_requests = self.buffers[key]
+
+    with torch.no_grad():
+      # post the receives before packing 
+      active = [r.start() for r in recv_requests]
+
+      local = None
+      for (dest,layers),buf in zip(self.sends,send_buffers):
+        flat = [t for getter in getters for t in self.flatten(layers,getter)]
+        if len(flat)>0:
+          torch.cat(flat,out=buf)
+        if dest==self.rank:
+          local = buf
+
+      active += [r.start() for r in send_requests]
+      self.comm.waitall(active)
+
+      results = [[] for _ in getters]
+      for (source,_),buf,shapes in zip(self.recvs,recv_buffers,self.recv_shapes):
+        received = (local if source==self.rank else buf).clone()
+
+        sizes = [s.numel() for s in shapes]
+        if sum(sizes)==0:
+          continue
+        for i,part in enumerate(torch.split(received,sum(sizes))):
+          results[i] += [v.view(s) for v,s in zip(torch.split(part,sizes),shapes)]
+
+    return results
+
+  def receiving_params(self):
+    """
+    The parameters of the receiving layers, in the order of the exchanged lists.
+    """
+    return [p for _,layers in self.recvs for l in layers for p in l.parameters()]
+
+  def nbytes(self):
+    """
+    The number of bytes held by the message buffers allocated so far.
+    """
+    return sum(b.numel()*b.element_size() for send_buffers,recv_buffers,_,_ in self.buffers.values()
+                                          for b in send_buffers+recv_buffers)
+# end TransferPlan
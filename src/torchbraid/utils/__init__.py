@@ -29,35 +29,70 @@
 # ************************************************************************
 #@HEADER
 
+import importlib
+
 from .context_timer import ContextTimer
 from .context_timer_manager import ContextTimerManager
+from .braid_telemetry import BraidTelemetry
+from .iteration_controller import AdaptiveIterationController
+from .tensor_comm import TensorComm, MPITensorComm, TorchDistributedComm
 
 # import some useful helper functions
 from .functional import l2_reg
-from .gittools import git_rev 
 
 # import bufpackunpack tools
 from .bufpackunpack import buffer_size, pack_buffer, unpack_buffer
 
 # import custom LP modules and support
 from .done_flag import DoneFlag, DoneFlagMixin
-from .lp_batchnorm import LPBatchNorm2d
+from .lp_batchnorm import LPBatchNorm1d, LPBatchNorm2d, LPGroupNorm, LPLayerNorm
 
-try:
-  # use the global one
-  from mpi4py import MPI
-except:
-  # default to the local dummy
-  print('\n-- Torchbraid Warning: No MPI found, using internal \'fake_mpi\'\n')
-  from .fake_mpi import MPI
+import torch
 
-# import mean intiial guess storage
-from .mean_initial_guess_storage import MeanInitialGuessStorage
+# Optional utilities are loaded on first access (PEP 562) to keep the
+# cost of "import torchbraid" down on every rank.
+_lazy_attributes = {
+  'git_rev'                 : ('.gittools','git_rev'),
+  'MeanInitialGuessStorage' : ('.mean_initial_guess_storage','MeanInitialGuessStorage'),
+  'WarmStartStorage'        : ('.warm_start_storage','WarmStartStorage'),
+  'BatchedStepEngine'       : ('.batched_step','BatchedStepEngine'),
+  'lp_data_loader'          : ('.lp_data_loader','lp_data_loader'),
+  'BatchStager'             : ('.batch_stager','BatchStager'),
+  'data_parallel'           : ('.data_parallel',None),
+  'AvgPoolBilinear'         : ('.spatial','AvgPoolBilinear'),
+  'InjectionNearest'        : ('.spatial','InjectionNearest'),
+  'ChannelProjection'       : ('.spatial','ChannelProjection'),
+  'SpatialAdaptor'          : ('.spatial','SpatialAdaptor'),
+  'LevelExecutionPolicy'    : ('.level_policy','LevelExecutionPolicy'),
+  'StepCompiler'            : ('.step_compiler','StepCompiler'),
+}
+
+def _import_mpi():
+  try:
+    # use the global one
+    from mpi4py import MPI
+  except:
+    # default to the local dummy
+    print('\n-- Torchbraid Warning: No MPI found, using internal \'fake_mpi\'\n')
+    from .fake_mpi import MPI
+  return MPI
+
+def __getattr__(name):
+  if name=='MPI':
+    value = _import_mpi()
+  elif name in _lazy_attributes:
+    module_name,attr = _lazy_attributes[name]
+    module = importlib.import_module(module_name,__name__)
+    value = module if attr is None else getattr(module,attr)
+  else:
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
-import gc
-import torch
-import traceback
-import pickle
+  # cache the result so __getattr__ is not called again
+  globals()[name] = value
+  return value
+
+def __dir__():
+  return sorted(list(globals().keys()) + list(_lazy_attributes.keys()) + ['MPI'])
 
 def seed_from_rank(seed,rank):
   """
@@ -69,6 +104,25 @@ def seed_from_rank(seed,rank):
   return (1664525*(seed+rank) + 1013904113)% 2**32
 # end seed_from_rank
 
+def compute_levels(num_steps,min_coarse_size,cfactor): 
+  from math import log, floor 
+  # we want to find $L$ such that ( max_L min_coarse_size*cfactor**L <= num_steps)
+  levels =  floor(log(num_steps/min_coarse_size,cfactor))+1 
+
+  if levels<1:
+    levels = 1
+  return levels
+# end compute_levels
+
+def root_print(rank, printlevel_cutoff, importance, s):
+  ''' 
+  Parallel print routine 
+  Only print if rank == 0 and the message is "important"
+  '''
+  if rank==0:
+    if importance <= printlevel_cutoff:
+      print(s, flush=True)
+
 def tensor_memory(prefix,min_size=0,total_only=False):
   """
   Helper function to print the memory footprint of all the torch tensors.
@@ -77,6 +131,8 @@ def tensor_memory(prefix,min_size=0,total_only=False):
   Setting the total_only=True will only print a summary
   """
 
+  import gc
+
   objects = gc.get_objects()
   tqueue = [o for o in objects if isinstance(o,torch.Tensor)]
   s = ''
@@ -103,6 +159,8 @@ def tensor_memory(prefix,min_size=0,total_only=False):
 # end print_tensors
 
 def stack_string(prefix=None):
+  import traceback
+
   stack = traceback.format_stack()
   lines = []
   for l in stack:
@@ -121,6 +179,8 @@ def pickle_size(obj):
   What is the size in bytes of the pickled stream from
   this object.
   """
+  import pickle
+
   return len(pickle.dumps(obj))
 
 def getDevice(comm):
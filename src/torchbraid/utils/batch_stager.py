@@ -0,0 +1,132 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import queue
+import threading
+
+import torch
+
+class BatchStager:
+  """
+  Iterate over a data loader with the upcoming batches loaded and moved to
+  the device on a background thread, so the loader latency overlaps with the
+  training of the current batch.
+
+  At most "depth" batches are staged ahead (a bounded queue). On CUDA devices
+  the copies are issued on a side stream, and the consumer waits on an event
+  before using a batch. Exceptions raised by the loader are re-raised by the
+  iterator. Breaking out of the loop stops the background thread.
+
+  With lp_data_loader only layer-parallel rank 0 loads the input, so the
+  other ranks stage just the batch size and targets.
+  """
+
+  _done = object()
+
+  def __init__(self,loader,device,depth=2):
+    """
+    Parameters:
+      loader (iterable): Yields (data, target) pairs, e.g. a DataLoader
+      device (torch.device): Device the batches are moved to
+      depth (int): Number of batches staged ahead
+    """
+    assert(depth>=1)
+    self.loader = loader
+    self.device = torch.device(device) if device is not None else torch.device('cpu')
+    self.depth = depth
+
+  def __len__(self):
+    return len(self.loader)
+
+  @property
+  def dataset(self):
+    return self.loader.dataset
+
+  def stage(self,batch,stream):
+    data,target = batch
+    if stream is None:
+      return data.to(self.device),target.to(self.device),None
+
+    with torch.cuda.stream(stream):
+      data = data.to(self.device,non_blocking=True)
+      target = target.to(self.device,non_blocking=True)
+      event = torch.cuda.Event()
+      event.record(stream)
+    return data,target,event
+
+  def produce(self,batches,stop):
+    stream = torch.cuda.Stream(self.device) if self.device.type=='cuda' else None
+    try:
+      for batch in self.loader:
+        item = self.stage(batch,stream)
+        while not stop.is_set():
+          try:
+            batches.put(item,timeout=0.1)
+            break
+          except queue.Full:
+            pass
+        if stop.is_set():
+          return
+      batches.put(self._done)
+    except BaseException as e:
+      batches.put(e)
+
+  def __iter__(self):
+    batches = queue.Queue(maxsize=self.depth)
+    stop = threading.Event()
+    thread = threading.Thread(target=self.produce,args=(batches,stop),daemon=True)
+    thread.start()
+
+    try:
+      while True:
+        item = batches.get()
+        if item is self._done:
+          break
+        if isinstance(item,BaseException):
+          raise item
+
+        data,target,event = item
+        if event is not None:
+          current = torch.cuda.current_stream(self.device)
+          current.wait_event(event)
+          # the memory was allocated on the side stream
+          data.record_stream(current)
+          target.record_stream(current)
+        yield data,target
+    finally:
+      stop.set()
+      # release the producer if it is blocked on a full queue
+      while thread.is_alive():
+        try:
+          batches.get(timeout=0.1)
+        except queue.Empty:
+          pass
+      thread.join()
@@ -0,0 +1,186 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import copy
+import torch
+
+try:
+  from torch.func import functional_call, stack_module_state, vmap
+except ImportError: # pragma: no cover
+  # older versions of PyTorch, only concatenation is available
+  functional_call = None
+
+class BatchedStepEngine:
+  """
+  Evaluate a set of independent time steps together.
+
+  The steps in different C-intervals are independent within a relaxation sweep.
+  Instead of calling each layer on its own state, the steps are grouped by 
+  time step size and layer architecture, and each group is evaluated with one
+  call:
+
+    - If the steps in a group use the same layer (shared weights, as happens on
+      coarse levels or for SpliNets) the states are concatenated along the batch
+      dimension and the layer is called once.
+    - Otherwise the weights of the layers are stacked and the layer is evaluated
+      with torch.func.vmap over torch.func.functional_call.
+
+  Steps that can't be batched safely are evaluated one at a time, this 
+  includes layers with buffers in training mode (e.g. batch norm, where the
+  statistics depend on the batch) and steps with extra arguments.
+  """
+
+  def __init__(self,min_group=2):
+    """
+    Constructor.
+
+      Parameters:
+        min_group (int): Smallest group that is batched, smaller groups are evaluated one at a time
+    """
+    self.min_group = min_group
+
+    # stateless copies of the layers used by functional_call, keyed by architecture
+    self.base_modules = dict()
+
+    # (layer,signature) keyed by id(layer), holding the layer keeps the id unique
+    self.signatures = dict()
+
+  def signature(self,layer):
+    """
+    A key identifying the architecture of a layer, layers with the same key can be vmapped.
+    The key is computed on the first use of a layer and cached.
+    """
+    entry = self.signatures.get(id(layer))
+    if entry is None or entry[0] is not layer:
+      entry = (layer,self.architecture(layer))
+      self.signatures[id(layer)] = entry
+    return entry[1]
+
+  @staticmethod
+  def architecture(layer):
+    """
+    Compute the signature of a layer, this formats the layer so is not cheap.
+    """
+    params = tuple([(n,tuple(p.shape),p.dtype) for n,p in layer.named_parameters()])
+    buffers = tuple([(n,tuple(b.shape),b.dtype) for n,b in layer.named_buffers()])
+    return (type(layer),repr(layer),params,buffers)
+
+  @staticmethod
+  def batchable(layer):
+    """
+    Layers whose buffers are updated in training mode are evaluated one at a time.
+    """
+    return not (layer.training and len(list(layer.buffers()))>0)
+
+  @torch.no_grad()
+  def __call__(self,layers,dts,states,extra_args=(),extra_kwargs=None):
+    """
+    Evaluate the time steps.
+
+      Parameters:
+        layers (list): The layer for each step, called as layer(dt,x,*extra_args,**extra_kwargs)
+        dts (list): Time step size for each step
+        states (list): Input state (a tensor) for each step
+        extra_args (tuple): Extra arguments passed to every layer
+        extra_kwargs (dict): Extra keyword arguments passed to every layer
+
+      Returns:
+        A list with the output state of each step.
+    """
+    if extra_kwargs is None:
+      extra_kwargs = dict()
+
+    results = len(states)*[None]
+
+    # extra arguments may depend on the batch, so can't be concatenated
+    if len(extra_args)>0 or len(extra_kwargs)>0:
+      for i,(layer,dt,x) in enumerate(zip(layers,dts,states)):
+        results[i] = layer(dt,x,*extra_args,**extra_kwargs)
+      return results
+
+    # group the steps that can be evaluated together
+    groups = dict()
+    for i,(layer,dt,x) in enumerate(zip(layers,dts,states)):
+      if not self.batchable(layer):
+        results[i] = layer(dt,x)
+        continue
+
+      key = (dt,tuple(x.shape),x.dtype,self.signature(layer))
+      groups.setdefault(key,[]).append(i)
+
+    for (dt,_,_,sig),indices in groups.items():
+      group_layers = [layers[i] for i in indices]
+      group_states = [states[i] for i in indices]
+
+      if len(indices)<self.min_group:
+        outputs = [l(dt,x) for l,x in zip(group_layers,group_states)]
+      elif all([l is group_layers[0] for l in group_layers]):
+        outputs = self.concatenate(group_layers[0],dt,group_states)
+      elif functional_call is not None:
+        outputs = self.vectorize(sig,group_layers,dt,group_states)
+      else:
+        outputs = [l(dt,x) for l,x in zip(group_layers,group_states)]
+
+      for i,y in zip(indices,outputs):
+        results[i] = y
+
+    return results
+
+  def concatenate(self,layer,dt,states):
+    """
+    Evaluate a layer shared by all the steps with one call on the concatenated batch.
+    """
+    sizes = [x.shape[0] for x in states]
+    y = layer(dt,torch.cat(states))
+    return list(torch.split(y,sizes))
+
+  def vectorize(self,sig,layers,dt,states):
+    """
+    Evaluate layers with the same architecture using vmap over the stacked weights.
+    """
+    if sig not in self.base_modules:
+      self.base_modules[sig] = copy.deepcopy(layers[0]).to('meta')
+    base = self.base_modules[sig]
+
+    # the copy must share the done flag (a plain attribute, not copied to meta)
+    for b,l in zip(base.modules(),layers[0].modules()):
+      if hasattr(l,'done_flag'):
+        b.done_flag = l.done_flag
+    base.train(layers[0].training)
+
+    params,buffers = stack_module_state(layers)
+
+    def step(p,b,x):
+      return functional_call(base,(p,b),(dt,x))
+
+    y = vmap(step)(params,buffers,torch.stack(states))
+    return list(torch.unbind(y))
+# end BatchedStepEngine
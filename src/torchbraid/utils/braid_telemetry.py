@@ -0,0 +1,168 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import json
+import time
+
+from collections import deque
+
+class BraidTelemetry:
+  """
+  Convergence and cost counters for the solves of a BraidApp.
+
+  A record is produced for every call to braid_Drive. It contains the residual
+  history, the number of steps and the time spent stepping on each level, the
+  number of messages (and bytes) sent, and the time spent in braid_Drive versus
+  the time spent in the python callbacks. Only counters are updated during
+  the solve, so this is cheap enough to leave on.
+
+  Records are kept in a bounded queue, and can optionally be streamed to a 
+  file object (one JSON object per line).
+  """
+
+  def __init__(self,name,rank=0,stream=None,max_records=1000):
+    """
+    Constructor.
+
+      Parameters:
+        name (str): Name of the solve recorded (e.g. "forward" or "backward")
+        rank (int): The rank of this processor, added to each record
+        stream (file): Optional file object, each record is written as a JSON line
+        max_records (int): Maximum number of records to keep in memory
+    """
+    self.name = name
+    self.rank = rank
+    self.stream = stream
+    self.records = deque(maxlen=max_records)
+    self.solve_count = 0
+    self.current = None
+    self.tags = dict()
+
+  def setTag(self,key,value):
+    """
+    Add a tag (e.g. a description of the configuration) to the following records,
+    a value of None removes the tag.
+    """
+    if value is None:
+      self.tags.pop(key,None)
+    else:
+      self.tags[key] = value
+
+  def beginSolve(self):
+    """
+    Reset the counters for a new solve.
+    """
+    self.current = {'solve'          : self.name,
+                    'index'          : self.solve_count,
+                    'rank'           : self.rank,
+                    'step_count'     : [],
+                    'step_time'      : [],
+                    'messages_sent'  : 0,
+                    'bytes_sent'     : 0,
+                    'callback_time'  : 0.0,
+                    'callback_count' : 0,
+                    'tags'           : dict(self.tags),
+                    'start'          : time.time()}
+
+  def recordStep(self,level,elapsed):
+    """
+    Record a step on a level, taking elapsed seconds.
+    """
+    if self.current is None:
+      return
+
+    counts = self.current['step_count']
+    times  = self.current['step_time']
+    if level>=len(counts):
+      counts.extend([0]*(level+1-len(counts)))
+      times.extend([0.0]*(level+1-len(times)))
+
+    counts[level] += 1
+    times[level]  += elapsed
+
+  def recordCallback(self,elapsed):
+    """
+    Record the time spent in a python callback.
+    """
+    if self.current is None:
+      return
+
+    self.current['callback_time']  += elapsed
+    self.current['callback_count'] += 1
+
+  def recordSend(self,nbytes):
+    """
+    Record a message of nbytes being sent.
+    """
+    if self.current is None:
+      return
+
+    self.current['messages_sent'] += 1
+    self.current['bytes_sent']    += nbytes
+
+  def endSolve(self,iterations,residuals,drive_time):
+    """
+    Finalize the record for this solve, and stream it if requested.
+
+      Parameters:
+        iterations (int): Number of MGRIT iterations
+        residuals (list): Residual norm history, one entry per iteration
+        drive_time (float): Time spent in braid_Drive (seconds)
+    """
+    if self.current is None:
+      return
+
+    record = self.current
+    record['iterations'] = iterations
+    record['residuals']  = list(residuals)
+    record['drive_time'] = drive_time
+    record['braid_time'] = drive_time-record['callback_time']
+
+    self.records.append(record)
+    self.solve_count += 1
+    self.current = None
+
+    if self.stream is not None:
+      self.stream.write(json.dumps(record)+'\n')
+      self.stream.flush()
+
+  def getRecords(self):
+    """
+    Get a list of the records (oldest first).
+    """
+    return list(self.records)
+
+  def clear(self):
+    """
+    Remove all stored records.
+    """
+    self.records.clear()
+# end BraidTelemetry
@@ -32,6 +32,7 @@
 import numpy as np
 
 from mpi4py import MPI
+from torch.utils.data import Sampler
 
 
 def split_communicator(comm: MPI.Comm, splitting: int):
@@ -55,6 +56,101 @@ def split_communicator(comm: MPI.Comm, splitting: int):
   return comm_dp, comm_lp
 
 
+def node_ids(comm: MPI.Comm):
+  """
+  Determine which node each process of a communicator is on.
+  :param comm: Communicator
+  :return: List with the node index of each rank in comm, nodes are numbered by their lowest rank
+  """
+  rank = comm.Get_rank()
+
+  # processes that can share memory are on the same node
+  node_comm = comm.Split_type(MPI.COMM_TYPE_SHARED, key=rank)
+  leader = node_comm.allreduce(rank, op=MPI.MIN)
+  node_comm.Free()
+
+  leaders = comm.allgather(leader)
+  numbering = {l: i for i, l in enumerate(sorted(set(leaders)))}
+  return [numbering[l] for l in leaders]
+
+
+def split_communicator_topology(comm: MPI.Comm, splitting: int):
+  """
+  Creates new communicators for data parallelism & layer parallelism, placing
+  consecutive layer-parallel ranks on the same node when possible.
+
+  Layer-parallel neighbours exchange states every MGRIT iteration, while data-parallel
+  peers communicate once per batch. So the processes are ordered by node, and each
+  layer-parallel communicator is a contiguous block of this ordering. The sizes of
+  the communicators are the same as split_communicator.
+  :param comm: Communicator to be used as the basis for new communicators
+  :param splitting: Splitting factor (number of processes for spatial parallelism)
+  :return: Space and time communicator
+  """
+  rank = comm.Get_rank()
+  size = comm.Get_size()
+  assert size % splitting == 0, 'Communicator size must be a multiple of the splitting'
+
+  lp_size = size // splitting
+
+  # node major ordering of the processes
+  nodes = node_ids(comm)
+  order = sorted(range(size), key=lambda r: (nodes[r], r))
+  position = order.index(rank)
+
+  x_color = position % lp_size
+  t_color = position // lp_size
+
+  comm_dp = comm.Split(color=x_color, key=position)
+  comm_lp = comm.Split(color=t_color, key=position)
+  return comm_dp, comm_lp
+
+
+def message_volume(comm: MPI.Comm, comm_dp: MPI.Comm, comm_lp: MPI.Comm, lp_bytes: int, dp_bytes: int):
+  """
+  Estimate the intra-node and inter-node message volume of a data & layer parallel layout.
+
+  The layer-parallel traffic is modeled as lp_bytes sent in each direction between
+  consecutive ranks of comm_lp (e.g. the C-point states of one MGRIT iteration). The
+  data-parallel traffic is a ring allreduce of dp_bytes (e.g. the gradient), where
+  each rank sends 2*(n-1)/n*dp_bytes to the next rank of comm_dp.
+  :param comm: Communicator the layout was split from
+  :param comm_dp: Data parallel communicator
+  :param comm_lp: Layer parallel communicator
+  :param lp_bytes: Bytes sent between layer-parallel neighbours
+  :param dp_bytes: Bytes reduced over the data-parallel communicator
+  :return: Dictionary with the total (all processes) 'intra_node' and 'inter_node' bytes for
+           the 'lp' and 'dp' traffic, the same on all ranks
+  """
+  rank = comm.Get_rank()
+  nodes = node_ids(comm)
+
+  lp_ranks = comm_lp.allgather(rank)
+  dp_ranks = comm_dp.allgather(rank)
+
+  volume = {'lp': {'intra_node': 0, 'inter_node': 0},
+            'dp': {'intra_node': 0, 'inter_node': 0}}
+
+  def add(kind, dest, nbytes):
+    where = 'intra_node' if nodes[rank] == nodes[dest] else 'inter_node'
+    volume[kind][where] += nbytes
+
+  # count the messages sent by this rank
+  lp_index = comm_lp.Get_rank()
+  for neighbor in [lp_index - 1, lp_index + 1]:
+    if 0 <= neighbor < len(lp_ranks):
+      add('lp', lp_ranks[neighbor], lp_bytes)
+
+  num_dp = len(dp_ranks)
+  if num_dp > 1:
+    add('dp', dp_ranks[(comm_dp.Get_rank() + 1) % num_dp], 2.0 * (num_dp - 1) / num_dp * dp_bytes)
+
+  for kind in volume:
+    for where in volume[kind]:
+      volume[kind][where] = comm.allreduce(volume[kind][where], op=MPI.SUM)
+  return volume
+
+
 def average_gradients(model, comm_dp):
   """
   Averages gradients for comm_dp
@@ -77,19 +173,87 @@ class Partition(object):
     return self.data[data_idx]
 
 
+def strided_partition(indices, procs, rank, batch_size):
+  """
+  Select the entries of indices owned by rank when blocks of batch_size are
+  dealt round robin to procs processors. This is computed with a strided view
+  instead of a loop over the indices.
+  :param indices: Numpy array of (shuffled) indices
+  :param procs: Number of processors
+  :param rank: Rank to select the indices for
+  :param batch_size: Size of the blocks
+  :return: Numpy array of the indices owned by rank
+  """
+  stride = procs * batch_size
+  full = len(indices) // stride * stride
+
+  # rows of the reshaped array are one round of blocks, column "rank" is ours
+  head = indices[:full].reshape(-1, procs, batch_size)[:, rank, :].reshape(-1)
+  tail = indices[full + rank * batch_size:full + (rank + 1) * batch_size]
+  return np.concatenate([head, tail])
+
+
 class Partioner(object):
   def __init__(self, data, procs, seed, batch_size):
-    def partion(iterable, start, select, skip):
-      return [x for i, x in enumerate(iterable[start:]) if i % (select + skip) < select]
-
     self.data = data
     indices = np.arange(0, len(self.data))
-    np.random.seed(seed)
-    np.random.shuffle(indices)
-    self.partitions = [partion(indices,
-                               start=batch_size * i,
-                               select=batch_size,
-                               skip=batch_size * (procs - 1)) for i in range(procs)]
+
+    # use a private generator, this is the same sequence as np.random.seed
+    # but doesn't reset the global state
+    np.random.RandomState(seed).shuffle(indices)
+    self.partitions = [strided_partition(indices, procs, rank, batch_size).tolist() for rank in range(procs)]
 
   def get_partion(self, rank):
     return Partition(self.data, self.partitions[rank])
+
+
+class StridedSampler(Sampler):
+  """
+  Sampler for data parallel training giving each rank its share of the samples.
+
+  The (shuffled) indices are dealt round robin to the ranks in blocks of
+  batch_size, matching Partioner. The shuffle is drawn from a private
+  generator seeded with (seed, epoch), so all ranks agree without communication
+  and calling set_epoch reshuffles. The indices are produced in chunks of
+  chunk_size, without a shuffle no index array of the full dataset is built.
+  """
+
+  def __init__(self, num_samples, procs, rank, batch_size, shuffle=True, seed=0, chunk_size=2 ** 20):
+    assert (0 <= rank < procs)
+    self.num_samples = num_samples
+    self.procs = procs
+    self.rank = rank
+    self.batch_size = batch_size
+    self.shuffle = shuffle
+    self.seed = seed
+    self.chunk_size = chunk_size
+    self.epoch = 0
+
+  def set_epoch(self, epoch):
+    self.epoch = epoch
+
+  def __iter__(self):
+    stride = self.procs * self.batch_size
+    full = self.num_samples // stride * stride
+    rows = max(1, self.chunk_size // stride)
+
+    if self.shuffle:
+      dtype = np.int32 if self.num_samples < 2 ** 31 else np.int64
+      rng = np.random.default_rng([self.seed, self.epoch])
+      indices = rng.permutation(self.num_samples).astype(dtype, copy=False)
+      chunk = lambda begin, end: indices[begin:end]
+    else:
+      chunk = lambda begin, end: np.arange(begin, min(end, self.num_samples))
+
+    for begin in range(0, full, rows * stride):
+      end = min(begin + rows * stride, full)
+      yield from chunk(begin, end).reshape(-1, self.procs, self.batch_size)[:, self.rank, :].reshape(-1).tolist()
+
+    begin = full + self.rank * self.batch_size
+    yield from chunk(begin, begin + self.batch_size).tolist()
+
+  def __len__(self):
+    stride = self.procs * self.batch_size
+    full = self.num_samples // stride * stride
+    tail = min(self.batch_size, max(0, self.num_samples - full - self.rank * self.batch_size))
+    return full // self.procs + tail
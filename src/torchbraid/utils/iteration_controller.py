@@ -0,0 +1,154 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+from collections import deque
+
+class AdaptiveIterationController:
+  """
+  Adjust the iteration count and tolerance of a BraidApp from solve to solve.
+
+  After each solve the residual history is inspected. If the residual target 
+  was not reached the iteration cap is raised immediately. If the target was 
+  reached in fewer iterations than the cap for a number of consecutive solves
+  (the hysteresis), the cap is lowered by one. The cap is clamped to 
+  [min_iters,max_iters]. The absolute tolerance handed to XBraid is the residual
+  target, or if rel_tol is set, the larger of abs_tol and rel_tol times the 
+  initial residual of the previous solve. XBraid stops early when the tolerance
+  is met, so the cap only matters for solves that are hard to converge.
+
+  The residual norms from XBraid are global, so all ranks make the same decision.
+  """
+
+  def __init__(self,name,abs_tol,rel_tol=None,min_iters=1,max_iters=10,hysteresis=2,rank=0,print_level=0,max_records=1000):
+    """
+    Constructor.
+
+      Parameters:
+        name (str): Name of the solve controlled (e.g. "forward" or "backward")
+        abs_tol (float): Residual target
+        rel_tol (float): Optional residual target relative to the initial residual
+        min_iters (int): Smallest allowed iteration cap
+        max_iters (int): Largest allowed iteration cap
+        hysteresis (int): Number of consecutive solves that converge early before the cap is lowered
+        rank (int): The rank of this processor, only rank 0 prints
+        print_level (int): If larger than zero, print each change of the cap
+        max_records (int): Maximum number of decisions to keep in memory
+    """
+    assert(min_iters>=1)
+    assert(min_iters<=max_iters)
+    assert(hysteresis>=1)
+
+    self.name = name
+    self.abs_tol = abs_tol
+    self.rel_tol = rel_tol
+    self.min_iters = min_iters
+    self.max_iters = max_iters
+    self.hysteresis = hysteresis
+    self.rank = rank
+    self.print_level = print_level
+
+    self.early_count = 0
+    self.solve_count = 0
+    self.records = deque(maxlen=max_records)
+
+  def attach(self,app,iters=None):
+    """
+    Apply the initial iteration cap and tolerance to an app.
+    """
+    if iters is None:
+      iters = app.getMaxIters()
+    iters = min(max(iters,self.min_iters),self.max_iters)
+
+    app.setMaxIters(iters)
+    app.setAbsTol(self.abs_tol)
+
+  def endSolve(self,app):
+    """
+    Update the iteration cap and tolerance of an app after a solve.
+    """
+    # negative norms are iterations where the residual was not computed
+    history = [r for r in app.getBraidResidualHistory() if r>=0.0]
+    if len(history)==0:
+      return
+
+    iters = app.getMaxIters()
+    tol = app.getAbsTol()
+    residual = history[-1]
+
+    # number of iterations that were needed to reach the tolerance
+    needed = None
+    for i,r in enumerate(history):
+      if r<=tol:
+        needed = i+1
+        break
+
+    new_iters = iters
+    if needed is None:
+      new_iters = min(iters+1,self.max_iters)
+      self.early_count = 0
+    elif needed<iters:
+      self.early_count += 1
+      if self.early_count>=self.hysteresis:
+        new_iters = max(iters-1,self.min_iters)
+        self.early_count = 0
+    else:
+      self.early_count = 0
+
+    new_tol = self.abs_tol
+    if self.rel_tol is not None:
+      new_tol = max(self.abs_tol,self.rel_tol*history[0])
+
+    if new_iters!=iters:
+      app.setMaxIters(new_iters)
+    if new_tol!=tol:
+      app.setAbsTol(new_tol)
+
+    record = {'solve'     : self.name,
+              'index'     : self.solve_count,
+              'residual'  : residual,
+              'needed'    : needed,
+              'max_iters' : iters,
+              'new_iters' : new_iters,
+              'abs_tol'   : tol,
+              'new_tol'   : new_tol}
+    self.records.append(record)
+    self.solve_count += 1
+
+    if self.print_level>0 and self.rank==0 and new_iters!=iters:
+      print('AdaptiveIterationController ({}): solve {} residual = {:.4e}, max iters {} -> {}, abs tol = {:.4e}'.format(
+             self.name,record['index'],residual,iters,new_iters,new_tol))
+
+  def getRecords(self):
+    return list(self.records)
+
+  def clear(self):
+    self.records.clear()
+# end AdaptiveIterationController
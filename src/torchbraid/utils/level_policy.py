@@ -0,0 +1,159 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import contextlib
+import torch
+import torch.nn as nn
+
+class PolicyBlock(nn.Module):
+  """
+  A step on a level governed by a LevelExecutionPolicy. Only the layer is 
+  evaluated under autocast and in the channels last format, its output is 
+  converted back to the dtype and layout of the state before the residual
+  update x+dt*layer(x) (for ODE blocks), so the state is not rounded.
+  """
+  def __init__(self,layer,residual,autocast_dtype=None,channels_last=False):
+    super().__init__()
+
+    self.layer = layer
+    self.residual = residual
+    self.autocast_dtype = autocast_dtype
+    self.channels_last = channels_last
+
+  def forward(self,dt,x,*args,**kwargs):
+    x_in = x
+    if self.channels_last and x.dim()==4:
+      x_in = x.contiguous(memory_format=torch.channels_last)
+
+    context = contextlib.nullcontext()
+    if self.autocast_dtype is not None:
+      context = torch.autocast(device_type=x.device.type,dtype=self.autocast_dtype)
+
+    with context:
+      f = self.layer(x_in,*args,**kwargs)
+    f = f.to(x.dtype).contiguous()
+
+    if self.residual:
+      return x+dt*f
+    return f
+# end PolicyBlock
+
+class LevelExecutionPolicy:
+  """
+  How the forward steps are evaluated on each level of the time grid hierarchy.
+
+  The coarse levels only compute corrections, so they can be evaluated with less 
+  accuracy than the fine level. On the levels the policy applies to (level>=min_level)
+  the layer of a step can be
+
+    - evaluated under autocast, for instance in bfloat16
+    - evaluated with the state in the channels last memory format (4D states only)
+    - replaced by a cheaper user supplied surrogate
+
+  The state stored by braid keeps its dtype and memory format, and the residual
+  update of an ODE step is done in the dtype of the state (see PolicyBlock). The 
+  fine level, and any step that records the graph for back propagation, always 
+  uses the original layer in full precision. Compare the telemetry records 
+  (iterations, residuals and step time per level, see LPModule.enableTelemetry)
+  with and without the policy to measure its effect.
+  """
+
+  def __init__(self,autocast_dtype=None,channels_last=False,surrogate=None,min_level=1):
+    """
+    Constructor.
+
+      Parameters:
+        autocast_dtype (torch.dtype): Dtype used for autocast (e.g. torch.bfloat16), None disables autocast
+        channels_last (bool): Evaluate 4D states in the channels last memory format
+        surrogate (callable): Called as surrogate(layer,level), returns a module used in place of the 
+                              layer on the level. The layer is the one passed to the step functor 
+                              (not the ODE block), the surrogate should use its parameters rather 
+                              than copy them so that it follows the training. None uses the layer.
+        min_level (int): First level the policy applies to
+    """
+    assert(min_level>=1)
+
+    self.autocast_dtype = autocast_dtype
+    self.channels_last = channels_last
+    self.surrogate = surrogate
+    self.min_level = min_level
+
+    # the policy blocks, keyed by the id of the block and the level
+    self.blocks = dict()
+
+  def __repr__(self):
+    return 'LevelExecutionPolicy(autocast_dtype={}, channels_last={}, surrogate={}, min_level={})'.format(
+             self.autocast_dtype,self.channels_last,self.surrogate is not None,self.min_level)
+
+  def applies(self,level):
+    """
+    Is the step evaluation on this level changed by the policy.
+    """
+    return level>=self.min_level
+
+  def getLayer(self,block,level,residual,register=None):
+    """
+    Get the step (called as step(dt,x,*args,**kwargs)) used in place of an ODE or
+    plain block on the level. 
+
+    The residual flag is True for ODE blocks. The register function is called 
+    on a new policy block, this shares the flags of the app with its modules.
+    """
+    if not self.applies(level):
+      return block
+
+    key = (id(block),level)
+    if key not in self.blocks:
+      layer = block.layer
+      if self.surrogate is not None:
+        layer = self.surrogate(layer,level)
+
+      step = PolicyBlock(layer,residual,self.autocast_dtype,self.channels_last).to(self.device(block))
+      if register is not None:
+        register(step)
+
+      # keep a reference to the block so the id is not reused
+      self.blocks[key] = (block,step)
+
+    return self.blocks[key][1]
+
+  @staticmethod
+  def device(block):
+    for p in block.parameters():
+      return p.device
+    return torch.device('cpu')
+
+  def clear(self):
+    """
+    Remove the stored policy blocks, they are rebuilt when needed.
+    """
+    self.blocks = dict()
+# end LevelExecutionPolicy
@@ -4,17 +4,17 @@ import torch.nn.functional as F
 
 from .done_flag import *
 
-__all__ = ['LPBatchNorm2d']
+__all__ = ['LPBatchNorm1d','LPBatchNorm2d','LPGroupNorm','LPLayerNorm']
 
-class LPBatchNorm2d(DoneFlagMixin,nn.Module):
+class _LPBatchNorm(DoneFlagMixin,nn.Module):
     
   def __init__(self,channels,momentum=0.1,eps=1e-5):
     """
-    Constructor. This is the same as BatchNorm2d, however it has additional functionality
+    Constructor. This is the same as the torch batch norm, however it has additional functionality
     that allows the user to set the internal done_flag tensor. This done flag is anticipated
     to be paired with training and using 'done' in the layer-parallel/MGRIT algorithm. 
     The default value of the done flag is True. In that case, the batch norm during evaluation
-    and training will behave like torch.nn.BatchNorm2d. However, when the done flag is False,
+    and training will behave like the torch batch norm. However, when the done flag is False,
     training will not result in a permenant change in running mean and variance (eval has the
     same behavior).
 
@@ -45,20 +45,42 @@ class LPBatchNorm2d(DoneFlagMixin,nn.Module):
     self.var.fill_(1)
 
   def forward(self,x):
-    if self.done_flag and self.training:
-      bn_train_mode = True
-      mean = self.mean
-      var = self.var
-      #print('TRAIN-DONE')
-    elif not self.done_flag and self.training:
-      bn_train_mode = True
-      mean = self.mean.clone()
-      var = self.var.clone()
-      #print('TRAIN-FIX')
+    if self.training and self.done_flag:
+      # batch statistics, the running mean and variance are updated
+      return F.batch_norm(x,self.mean,self.var,self.weight,self.bias,True,self.momentum,self.eps)
+    elif self.training:
+      # batch statistics, without running stats nothing is updated (or copied)
+      return F.batch_norm(x,None,None,self.weight,self.bias,True,self.momentum,self.eps)
     else:
-      bn_train_mode = False
-      mean = self.mean
-      var = self.var
-      #print('EVAL')
- 
-    return F.batch_norm(x,mean,var,self.weight,self.bias,bn_train_mode,self.momentum,self.eps)
+      return F.batch_norm(x,self.mean,self.var,self.weight,self.bias,False,self.momentum,self.eps)
+
+class LPBatchNorm1d(_LPBatchNorm):
+  """
+  Done flag aware version of torch.nn.BatchNorm1d, see LPBatchNorm2d.
+  """
+  pass
+
+class LPBatchNorm2d(_LPBatchNorm):
+  """
+  Done flag aware version of torch.nn.BatchNorm2d. When the done flag is False,
+  training uses the batch statistics without changing the running mean and variance.
+  """
+  pass
+
+class LPGroupNorm(DoneFlagMixin,nn.GroupNorm):
+  """
+  Done flag aware version of torch.nn.GroupNorm. Group norm only uses the statistics
+  of each sample, so the output doesn't depend on the done flag. The flag is registered
+  so the layer can be used where the network is set up for the other LP norms.
+  """
+  def __init__(self,*args,**kwargs):
+    super().__init__(*args,**kwargs)
+    self.register_buffer("done_flag",DoneFlag.allocate())
+
+class LPLayerNorm(DoneFlagMixin,nn.LayerNorm):
+  """
+  Done flag aware version of torch.nn.LayerNorm, see LPGroupNorm.
+  """
+  def __init__(self,*args,**kwargs):
+    super().__init__(*args,**kwargs)
+    self.register_buffer("done_flag",DoneFlag.allocate())
@@ -0,0 +1,137 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import torch
+
+from torch.utils.data import DataLoader, Sampler, Subset
+
+class EpochSampler(Sampler):
+  """
+  A sampler producing the same order on every processor.
+
+  The permutation for each epoch is drawn from a generator seeded with 
+  seed+epoch, so processors that call set_epoch with the same value agree
+  without communication.
+  """
+
+  def __init__(self,num_samples,shuffle=True,seed=0):
+    self.num_samples = num_samples
+    self.shuffle = shuffle
+    self.seed = seed
+    self.epoch = 0
+
+  def set_epoch(self,epoch):
+    self.epoch = epoch
+
+  def __iter__(self):
+    if not self.shuffle:
+      return iter(range(self.num_samples))
+
+    generator = torch.Generator()
+    generator.manual_seed(self.seed+self.epoch)
+    return iter(torch.randperm(self.num_samples,generator=generator).tolist())
+
+  def __len__(self):
+    return self.num_samples
+
+class PlaceholderLoader:
+  """
+  A loader for the layer-parallel processors that don't need the input.
+
+  For each batch it yields a 0-d tensor holding the batch size (accepted by
+  ForwardODENetApp.batchSize) and the targets. The samples are never loaded.
+  """
+
+  def __init__(self,dataset,targets,batch_size,sampler,drop_last=False):
+    self.dataset = dataset
+    self.targets = targets
+    self.batch_size = batch_size
+    self.sampler = sampler
+    self.drop_last = drop_last
+
+  def __iter__(self):
+    indices = list(iter(self.sampler))
+    for start in range(0,len(indices),self.batch_size):
+      batch = indices[start:start+self.batch_size]
+      if self.drop_last and len(batch)<self.batch_size:
+        break
+      yield torch.tensor(len(batch)),self.targets[torch.tensor(batch)]
+
+  def __len__(self):
+    if self.drop_last:
+      return len(self.sampler)//self.batch_size
+    return (len(self.sampler)+self.batch_size-1)//self.batch_size
+
+def dataset_targets(dataset):
+  """
+  Get the targets of a dataset without loading the samples. This works for
+  datasets with a "targets" attribute (e.g. torchvision datasets), and 
+  subsets of them.
+  """
+  if isinstance(dataset,Subset):
+    return dataset_targets(dataset.dataset)[torch.as_tensor(dataset.indices)]
+
+  if hasattr(dataset,'targets'):
+    return torch.as_tensor(dataset.targets)
+
+  raise ValueError('Dataset has no "targets" attribute, pass the targets explicitly')
+
+def lp_data_loader(dataset,comm_lp,batch_size,shuffle=True,seed=0,targets=None,drop_last=False,**kwargs):
+  """
+  Build a data loader for layer-parallel training.
+
+  Only layer-parallel rank 0 uses the input, so only it gets a real DataLoader.
+  The other ranks get a PlaceholderLoader yielding the batch size (as a 0-d tensor)
+  and the targets, so no samples are read or decoded there. All ranks use the same
+  EpochSampler, so the batches agree across the layer-parallel group. Call
+  set_epoch on the sampler (loader.sampler) for a new shuffle each epoch.
+
+    Parameters:
+      dataset (Dataset): The dataset
+      comm_lp (MPI.Comm): The layer-parallel communicator
+      batch_size (int): The batch size
+      shuffle (bool): Shuffle the samples
+      seed (int): Seed for the shuffle, must be the same on all ranks
+      targets (tensor): Targets of the dataset, by default taken from dataset.targets
+      drop_last (bool): Drop the last incomplete batch
+      kwargs: Extra arguments to the DataLoader on rank 0 (e.g. num_workers)
+
+    Returns:
+      The loader for this rank
+  """
+  sampler = EpochSampler(len(dataset),shuffle,seed)
+
+  if comm_lp.Get_rank()==0:
+    return DataLoader(dataset,batch_size=batch_size,sampler=sampler,drop_last=drop_last,**kwargs)
+
+  if targets is None:
+    targets = dataset_targets(dataset)
+  return PlaceholderLoader(dataset,torch.as_tensor(targets),batch_size,sampler,drop_last)
@@ -35,10 +35,17 @@ class MeanInitialGuessStorage:
   """
   A class that stores the average state value at each time step 
   for different classes.
+
+  The averages for all time steps are kept in one dense tensor per state
+  tensor, with shape [num_times,class_count,*state_shape]. Time stamps are
+  rounded to the integer step index t/dt, so times accumulated with round off
+  share a row, and state_map maps the step index to a row of this tensor. The class means of a batch are
+  computed with a single index_add_ and bincount, so adding a state costs a
+  fixed number of tensor operations, independent of the number of classes.
   """
 
   @torch.no_grad()
-  def __init__(self,class_count,average_weight):
+  def __init__(self,class_count,average_weight,dt):
     """
     Constructor for the mean value storage class.
     
@@ -46,27 +53,35 @@ class MeanInitialGuessStorage:
         class_count (int: >0): How many classes will be used
         average_weight (float: [0,1]): Weighting for the average operation. The result is
                                        (1-average_weight)*old_state + average_weight*new_state
+        dt (float: >0): Time step, used to map times to step indices
     """
 
     assert(0 < class_count)
     assert(0.0 <= average_weight <= 1.0)
+    assert(0.0 < dt)
 
     self.class_count = class_count
     self.average_weight = average_weight
-    self.state_map = dict()
+    self.dt = dt
+    self.state_map = dict()  # maps a step index to a row of the dense states
+    self.states = None       # tuple of tensors [num_times,class_count,*state_shape]
 
-  def getTimeStamps(self):
+  def getTimeIndices(self):
     return self.state_map.keys()
 
+  def getTimeStamps(self):
+    return [index*self.dt for index in self.state_map.keys()]
+
   @torch.no_grad()
   def getState(self,t,classes):
     """
     Get the state at time t, associated with a list of classes.
     """
-    state = []
-    for s in self.state_map[t]:
-      state += [s[classes].clone()]
-    return tuple(state)
+    row = self.state_map[self._timeIndex(t)]
+    classes = self._ensure_classes(classes,self.states[0].device)
+
+    # advanced indexing returns a copy
+    return tuple([s[row][classes] for s in self.states])
 
   @torch.no_grad()
   def addState(self,t,state,classes):
@@ -74,11 +89,55 @@ class MeanInitialGuessStorage:
     Incoporate, through averaging, the state at time t into the 
     average of states. 
     """
+    self.addStates([t],[state],classes)
 
-    if t in self.state_map:
-      self._average(self.state_map[t],state,classes,self.average_weight) 
-    else:
-      self.state_map[t] = self._initialize(state,classes,self.average_weight) 
+  @torch.no_grad()
+  def addStates(self,times,states,classes):
+    """
+    Incoporate, through averaging, the states at a list of times into 
+    the average of states. All the states belong to the same batch, and
+    so share the classes. 
+    """
+    states = [self._ensure_tuple(s) for s in states]
+    if len(states)==0:
+      return
+
+    if self.states is None:
+      self.states = tuple([torch.zeros([0,self.class_count]+list(s.shape[1:]),dtype=s.dtype,device=s.device) 
+                           for s in states[0]])
+
+    rows = torch.tensor([self._row(t) for t in times],dtype=torch.long,device=self.states[0].device)
+
+    # stack the batch over time: each entry is [len(times),batch,*state_shape]
+    stacked = tuple([torch.stack(s) for s in zip(*states)])
+
+    means = tuple([s[rows] for s in self.states])
+    self._average(means,stacked,classes,self.average_weight,dim=1)
+
+    for s,m in zip(self.states,means):
+      s[rows] = m
+
+  def _timeIndex(self,t):
+    return round(t/self.dt)
+
+  def _row(self,t):
+    """
+    Get the row of the dense states for a time stamp, adding one if required.
+    """
+    index = self._timeIndex(t)
+    if index in self.state_map:
+      return self.state_map[index]
+
+    row = len(self.state_map)
+    self.state_map[index] = row
+
+    # grow the storage, doubling to amortize the copy
+    capacity = self.states[0].shape[0]
+    if row>=capacity:
+      extra = max(capacity,1)
+      self.states = tuple([torch.cat([s,torch.zeros([extra]+list(s.shape[1:]),dtype=s.dtype,device=s.device)]) 
+                           for s in self.states])
+    return row
 
   @torch.no_grad()
   def _ensure_tuple(self,state):
@@ -97,47 +156,33 @@ class MeanInitialGuessStorage:
 
     return state
 
-  @torch.no_grad()
-  def _initialize(self,new_state,classes,average_weight):
+  def _ensure_classes(self,classes,device):
     """
-    Compute an initial set of mean states, based on
-    a passed in state
+    Ensure the classes are a tensor of indices on the device.
     """
+    return torch.as_tensor(classes,dtype=torch.long,device=device)
 
-    state = self._ensure_tuple(new_state)
-
-    # create a bunch of zeros, with the batch size replacing the classes
-    zeros = len(state)*[None]
-    for i,s in enumerate(state):
-      dtype = s.dtype
-      shape = tuple([self.class_count]+list(s.shape[1:]))
-      device = s.device
-      zeros[i] = torch.zeros(shape, dtype=dtype, device=s.device)
-
-    zeros = tuple(zeros)
-
-    # average (in place) the current state into the newly created zeros
-    self._average(zeros,state,classes,average_weight)
-
-    return zeros
- 
   @torch.no_grad()
-  def _average(self,old_mean,new_state,classes,average_weight):
+  def _average(self,old_mean,new_state,classes,average_weight,dim=0):
     """
-    Average in a new set of states
+    Average in a new set of states. The class dimension of old_mean and 
+    the batch dimension of new_state is dim, classes not present in the 
+    batch are unchanged.
     """
 
-    if isinstance(classes,torch.Tensor):
-      classes = classes.tolist()
-
     state = self._ensure_tuple(new_state)
+    classes = self._ensure_classes(classes,state[0].device)
+
+    counts = torch.bincount(classes,minlength=self.class_count)
+
+    # weight is zero for classes that are not present
+    weight = average_weight*(counts>0).to(state[0].dtype)/counts.clamp(min=1).to(state[0].dtype)
+    present = average_weight*(counts>0).to(state[0].dtype)
+
+    for o,s in zip(old_mean,state):
+      shape = [1]*o.dim()
+      shape[dim] = self.class_count
 
-    u_classes = list(set(classes))
-    for cls in u_classes:
-      # find all indices that match
-      indices = [ind for ind,c in enumerate(classes) if c==cls]
- 
-      # perform the weighted average
-      for o,s in zip(old_mean,state):
-        o[cls] *= (1.0-average_weight)
-        o[cls] += average_weight*torch.mean(s[indices],dim=0)
+      # (1-w)*o + w*mean for the present classes, where mean = sums/counts
+      sums = torch.zeros_like(o).index_add_(dim,classes,s)
+      o.add_(weight.view(shape)*sums-present.view(shape)*o)
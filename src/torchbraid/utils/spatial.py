@@ -0,0 +1,206 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import abc
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+class SpatialRefPair(abc.ABC):
+  """
+  Base class for spatial coarsening and refinement of NCHW feature maps
+  between the levels of the time hierarchy. An instance is passed as the
+  spatial_ref_pair argument of LayerParallel, it unpacks into the
+  (coarsen,refine) callables used by XBraid.
+
+  XBraid coarsens the features at every level transition, so the features on
+  level l are coarsened l times. The BraidApp uses levelShape to size the
+  vectors and the MPI buffers on each level (see getFeatureShapes).
+
+  Derived classes implement coarsenShape, restrict and prolong. Coarsening
+  does nothing when coarsenShape returns the fine shape, for instance when
+  the features are already small. 
+
+  The level passed to coarsen and refine is the fine level of the transition,
+  coarsen(x,l) maps features on level l to level l+1 and refine(x,l) maps
+  features on level l+1 to level l.
+  """
+
+  def __init__(self):
+    # the fine shape (C,H,W) of each (level,coarse shape), needed to refine
+    self.fine_shapes = dict()
+
+  def __iter__(self):
+    return iter((self.coarsen,self.refine))
+
+  @abc.abstractmethod
+  def coarsenShape(self,shape):
+    """ The coarse shape (C,H,W) of the fine shape (C,H,W) """
+    pass
+
+  @abc.abstractmethod
+  def restrict(self,x):
+    """ Coarsen the features x, returns a new tensor """
+    pass
+
+  @abc.abstractmethod
+  def prolong(self,x,shape):
+    """ Refine the features x to the fine shape (C,H,W), returns a new tensor """
+    pass
+
+  def register(self,level,fine,coarse):
+    fine,coarse = tuple(fine),tuple(coarse)
+    known = self.fine_shapes.setdefault((level,coarse),fine)
+    if known!=fine:
+      raise ValueError(f'{type(self).__name__}: features of shape {known} and {fine} both coarsen to {coarse} '
+                       f'on level {level}, so they can not be refined. Change the coarsening factor or minimum size.')
+
+  def levelShape(self,shape,level):
+    """ The shape (N,C,H,W) of the features on level, given the fine level shape """
+    shape = tuple(shape)
+    for l in range(level):
+      coarse = tuple(self.coarsenShape(shape[-3:]))
+      self.register(l,shape[-3:],coarse)
+      shape = shape[:-3]+coarse
+    return torch.Size(shape)
+
+  def coarsen(self,x,level):
+    fine = tuple(x.shape[-3:])
+    coarse = tuple(self.coarsenShape(fine))
+    self.register(level,fine,coarse)
+    if coarse==fine:
+      return x.clone()
+    return self.restrict(x)
+
+  def refine(self,x,level):
+    coarse = tuple(x.shape[-3:])
+    if (level,coarse) not in self.fine_shapes:
+      raise ValueError(f'{type(self).__name__}: features of shape {coarse} were never coarsened from level {level}')
+    fine = self.fine_shapes[(level,coarse)]
+    if coarse==fine:
+      return x.clone()
+    return self.prolong(x,fine)
+# end SpatialRefPair
+
+class SpatialPair(SpatialRefPair):
+  """
+  Base class for pairs that coarsen the height and width by factor. The
+  features are only coarsened if both are divisible by factor, and stay at
+  least min_size.
+  """
+  def __init__(self,factor=2,min_size=4):
+    super().__init__()
+    self.factor = factor
+    self.min_size = min_size
+
+  def coarsenShape(self,shape):
+    c,h,w = shape
+    f = self.factor
+    if (h % f) or (w % f) or (h//f < self.min_size) or (w//f < self.min_size):
+      return (c,h,w)
+    return (c,h//f,w//f)
+
+class AvgPoolBilinear(SpatialPair):
+  """ Average pooling to coarsen, bilinear interpolation to refine """
+  def restrict(self,x):
+    return F.avg_pool2d(x,self.factor)
+
+  def prolong(self,x,shape):
+    return F.interpolate(x,size=shape[-2:],mode='bilinear',align_corners=False)
+
+class InjectionNearest(SpatialPair):
+  """ Strided injection to coarsen, nearest neighbor interpolation to refine """
+  def restrict(self,x):
+    f = self.factor
+    return x[...,::f,::f].contiguous()
+
+  def prolong(self,x,shape):
+    return F.interpolate(x,size=shape[-2:],mode='nearest')
+
+class ChannelProjection(SpatialRefPair):
+  """
+  Average each group of factor channels to coarsen, and copy the coarse
+  channel to the group to refine. The features are only coarsened if the
+  number of channels is divisible by factor, and stays at least min_channels.
+  """
+  def __init__(self,factor=2,min_channels=1):
+    super().__init__()
+    self.factor = factor
+    self.min_channels = min_channels
+
+  def coarsenShape(self,shape):
+    c,h,w = shape
+    f = self.factor
+    if (c % f) or (c//f < self.min_channels):
+      return (c,h,w)
+    return (c//f,h,w)
+
+  def restrict(self,x):
+    return x.unflatten(-3,(x.shape[-3]//self.factor,self.factor)).mean(dim=-3)
+
+  def prolong(self,x,shape):
+    return x.repeat_interleave(self.factor,dim=-3)
+
+class SpatialAdaptor(nn.Module):
+  """
+  Wrap a layer so it can be evaluated on the coarsened features of the
+  coarse levels. The level is set by the ForwardODENetApp, which shares its
+  level_flag with the adaptors in its layers.
+
+  mode='direct' evaluates the layer on the coarse features. This suits
+  fully convolutional layers with a spatial pair, and a coarse step costs
+  factor**2 less per level.
+
+  mode='galerkin' refines the features to the fine level, evaluates the layer
+  and coarsens the result. This works for any layer (e.g., with ChannelProjection)
+  but costs as much as a fine step, only the stored states and messages are smaller.
+  """
+  def __init__(self,layer,pair,mode='direct'):
+    super().__init__()
+    assert(mode in ['direct','galerkin'])
+
+    self.layer = layer
+    self.pair = pair
+    self.mode = mode
+    self.level_flag = torch.tensor(0)
+
+  def forward(self,x,*args,**kwargs):
+    level = int(self.level_flag)
+    if level==0 or self.mode=='direct':
+      return self.layer(x,*args,**kwargs)
+
+    for l in reversed(range(level)):
+      x = self.pair.refine(x,l)
+    y = self.layer(x,*args,**kwargs)
+    for l in range(level):
+      y = self.pair.coarsen(y,l)
+    return y
+# end SpatialAdaptor
@@ -0,0 +1,184 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import copy
+import contextlib
+import torch
+
+try:
+  from torch.func import functional_call
+except ImportError: # pragma: no cover
+  functional_call = None
+
+class StepCompiler:
+  """
+  Compile the step functions of an app with torch.compile.
+
+  A step function is compiled once for each key, the key identifies the functor
+  (or method) evaluated, the level and the feature shape of the state. The batch
+  dimension is compiled as a dynamic dimension, so changing the batch size does
+  not create a new graph. The steps that record the graph for back propagation and
+  the steps evaluated without gradients are compiled separately.
+
+  If torch.compile is not available (before PyTorch 2.0), or compiling or running a graph fails, the
+  step function is evaluated eagerly from then on (the failures are kept in 
+  "failures"). Compiled functional steps share a module, so should not be used 
+  with multiple threads evaluating steps (e.g. NativeMGRIT with num_threads>1).
+
+  The step functions share code objects, so count against the same recompile
+  limit of torch.compile. The limit is raised to max_graphs only while the
+  compiled steps run, the global setting is not changed.
+  """
+
+  def __init__(self,backend='inductor',mode=None,dynamic=True,max_graphs=64,print_level=0):
+    """
+    Constructor.
+
+      Parameters:
+        backend (str): The torch.compile backend, the default inductor backend also runs on the CPU
+        mode (str): The torch.compile mode (e.g. "reduce-overhead"), None for the default
+        dynamic (bool): Compile with dynamic shapes, so the batch size can change
+        max_graphs (int): Lower bound for the recompile limit of torch.compile, every key needs its own graph
+        print_level (int): 0 = no output, 1 = report failures, 2 = report every compilation
+    """
+    self.backend = backend
+    self.mode = mode
+    self.dynamic = dynamic
+    self.print_level = print_level
+
+    # the (function,compiled function) pairs, the compiled function is None after a failure
+    self.graphs = dict()
+    self.failures = dict()
+
+    self.available = hasattr(torch,'compile')
+
+    # the recompile limit used by the compiled steps (renamed in newer versions of PyTorch)
+    self.limits = dict()
+    if self.available:
+      config = torch._dynamo.config
+      for name in ['recompile_limit','cache_size_limit']:
+        if hasattr(config,name):
+          self.limits[name] = max(getattr(config,name),max_graphs)
+          break
+
+  @staticmethod
+  def featureKey(tensors):
+    """
+    The shapes (without the leading batch dimension) and dtypes of the tensors.
+    """
+    if isinstance(tensors,torch.Tensor):
+      tensors = [tensors]
+    return tuple([(tuple(t.shape[1:]),t.dtype,t.device.type) for t in tensors])
+
+  @staticmethod
+  def functionalStep(layer,*leading_args):
+    """
+    Build a step function called as step(params,buffers,*args,**kwargs), that evaluates
+    layer(*leading_args,*args,**kwargs) with the parameters and buffers passed in. The
+    function is shared by all the layers with the same architecture as this one.
+    """
+    base = copy.deepcopy(layer).to('meta')
+
+    # the copy must share the flags (plain attributes, not copied to meta)
+    for b,l in zip(base.modules(),layer.modules()):
+      for name in ['done_flag','level_flag']:
+        if hasattr(l,name) and name not in l._buffers:
+          setattr(b,name,getattr(l,name))
+    base.train(layer.training)
+
+    def step(params,buffers,*args,**kwargs):
+      return functional_call(base,(params,buffers),leading_args+args,kwargs)
+
+    return step
+
+  def __call__(self,key,build,*args,**kwargs):
+    """
+    Evaluate the step function for a key.
+
+      Parameters:
+        key (tuple): Identifies the step function, the gradient mode is added
+        build (callable): Called without arguments to construct the step function, when the key is new
+        args, kwargs: Arguments of the step function
+    """
+    key = key+(torch.is_grad_enabled(),)
+    if key not in self.graphs:
+      self.graphs[key] = self.compile(key,build())
+
+    fn,compiled = self.graphs[key]
+    if compiled is not None:
+      try:
+        with self.limitContext():
+          return compiled(*args,**kwargs)
+      except Exception as e:
+        self.fail(key,e)
+        self.graphs[key] = (fn,None)
+
+    return fn(*args,**kwargs)
+
+  def limitContext(self):
+    """
+    Raise the recompile limit for the duration of a compiled step.
+    """
+    if len(self.limits)==0:
+      return contextlib.nullcontext()
+    return torch._dynamo.config.patch(**self.limits)
+
+  def compile(self,key,fn):
+    if not self.available:
+      return (fn,None)
+
+    if self.print_level>1:
+      print('StepCompiler: compiling {}'.format(key))
+
+    try:
+      compiled = torch.compile(fn,backend=self.backend,mode=self.mode,dynamic=self.dynamic)
+    except Exception as e:
+      self.fail(key,e)
+      return (fn,None)
+
+    return (fn,compiled)
+
+  def fail(self,key,error):
+    """
+    Record a failure to compile or run the graph for a key.
+    """
+    if self.print_level>0:
+      print('StepCompiler: falling back to eager evaluation for {}: {}'.format(key,error))
+
+    self.failures[key] = repr(error)
+
+  def clear(self):
+    """
+    Remove the compiled graphs, they are rebuilt when needed.
+    """
+    self.graphs = dict()
+    self.failures = dict()
+# end StepCompiler
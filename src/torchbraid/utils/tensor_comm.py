@@ -0,0 +1,287 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import abc
+import torch
+
+class TensorRequest:
+  """
+  Handle for a non-blocking tensor operation, call wait to complete it.
+  """
+  def __init__(self,request,finish=None,buffers=None):
+    self.request = request
+    self.finish = finish
+    self.buffers = buffers # keeps staging buffers alive
+    self.done = False
+
+  def wait(self):
+    if self.done:
+      return
+    if self.request is not None:
+      if hasattr(self.request,'Wait'):
+        self.request.Wait()
+      else:
+        self.request.wait()
+    if self.finish is not None:
+      self.finish()
+    self.done = True
+    self.buffers = None
+
+class PersistentTensorRequest:
+  """
+  A send or receive set up once (see TensorComm.send_init), start returns a 
+  TensorRequest for each use.
+  """
+  def __init__(self,start):
+    self.start_func = start
+
+  def start(self):
+    return self.start_func()
+
+class TensorComm(abc.ABC):
+  """
+  The tensor communication used by torchbraid outside of XBraid.
+
+  This covers the layer weights (sendRecvLayers), and the boundary states and
+  gradients exchanged by BraidFunction. XBraid's own messages always go
+  through MPI. The rank numbering must be the same as the MPI communicator
+  used by the apps.
+  """
+
+  @abc.abstractmethod
+  def Get_rank(self):
+    pass
+
+  @abc.abstractmethod
+  def Get_size(self):
+    pass
+
+  @abc.abstractmethod
+  def isend(self,tensor,dest,tag=0):
+    """ Start sending a tensor, returns a TensorRequest. """
+    pass
+
+  @abc.abstractmethod
+  def irecv(self,tensor,source,tag=0):
+    """ Start receiving into a tensor, returns a TensorRequest. """
+    pass
+
+  def send_init(self,tensor,dest,tag=0):
+    """ Set up a send of tensor that can be started repeatedly, returns a PersistentTensorRequest. """
+    return PersistentTensorRequest(lambda: self.isend(tensor,dest,tag))
+
+  def recv_init(self,tensor,source,tag=0):
+    """ Set up a receive into tensor that can be started repeatedly, returns a PersistentTensorRequest. """
+    return PersistentTensorRequest(lambda: self.irecv(tensor,source,tag))
+
+  @abc.abstractmethod
+  def bcast(self,tensor,root=0):
+    """ Broadcast a tensor in place. """
+    pass
+
+  @abc.abstractmethod
+  def allreduce(self,tensor):
+    """ Sum a tensor over all ranks in place. """
+    pass
+
+  @abc.abstractmethod
+  def barrier(self):
+    pass
+
+  def waitall(self,requests):
+    for r in requests:
+      r.wait()
+
+class MPITensorComm(TensorComm):
+  """
+  Tensor communication using an mpi4py communicator.
+
+  Unless stage is False (for a GPU aware MPI, see user_mpi_buf), device 
+  tensors are staged through host memory.
+  """
+
+  def __init__(self,comm,stage=True):
+    self.comm = comm
+    self.stage = stage
+
+  def staged(self,tensor):
+    return self.stage and tensor.device.type!='cpu'
+
+  def Get_rank(self):
+    return self.comm.Get_rank()
+
+  def Get_size(self):
+    return self.comm.Get_size()
+
+  def isend(self,tensor,dest,tag=0):
+    if self.staged(tensor):
+      tensor = tensor.cpu()
+    return TensorRequest(self.comm.Isend(tensor,dest=dest,tag=tag),buffers=tensor)
+
+  def irecv(self,tensor,source,tag=0):
+    if self.staged(tensor):
+      buffer = torch.empty_like(tensor,device='cpu')
+      request = self.comm.Irecv(buffer,source=source,tag=tag)
+      return TensorRequest(request,finish=lambda: tensor.copy_(buffer),buffers=buffer)
+    return TensorRequest(self.comm.Irecv(tensor,source=source,tag=tag))
+
+  def send_init(self,tensor,dest,tag=0):
+    if self.staged(tensor):
+      # the host buffer is allocated once, and refreshed on each start
+      buffer = torch.empty_like(tensor,device='cpu')
+      return self.persistent(self.comm.Send_init(buffer,dest=dest,tag=tag),
+                             before=lambda: buffer.copy_(tensor))
+    return self.persistent(self.comm.Send_init(tensor,dest=dest,tag=tag))
+
+  def recv_init(self,tensor,source,tag=0):
+    if self.staged(tensor):
+      buffer = torch.empty_like(tensor,device='cpu')
+      return self.persistent(self.comm.Recv_init(buffer,source=source,tag=tag),
+                             finish=lambda: tensor.copy_(buffer))
+    return self.persistent(self.comm.Recv_init(tensor,source=source,tag=tag))
+
+  @staticmethod
+  def persistent(request,before=None,finish=None):
+    def start():
+      if before is not None:
+        before()
+      request.Start()
+      return TensorRequest(request,finish=finish)
+    return PersistentTensorRequest(start)
+
+  def constants(self):
+    """
+    The module providing IN_PLACE, SUM and Request for the communicator.
+    """
+    from torchbraid.utils.thread_mpi import ThreadComm
+    if isinstance(self.comm,ThreadComm):
+      from torchbraid.utils.thread_mpi import MPI
+    else:
+      from mpi4py import MPI
+    return MPI
+
+  def bcast(self,tensor,root=0):
+    if self.staged(tensor):
+      buffer = tensor.cpu()
+      self.comm.Bcast(buffer,root=root)
+      tensor.copy_(buffer)
+    else:
+      self.comm.Bcast(tensor,root=root)
+
+  def allreduce(self,tensor):
+    MPI = self.constants()
+    if self.staged(tensor):
+      buffer = tensor.cpu()
+      self.comm.Allreduce(MPI.IN_PLACE,buffer,op=MPI.SUM)
+      tensor.copy_(buffer)
+    else:
+      self.comm.Allreduce(MPI.IN_PLACE,tensor,op=MPI.SUM)
+
+  def barrier(self):
+    self.comm.Barrier()
+
+  def waitall(self,requests):
+    self.constants().Request.Waitall([r.request for r in requests])
+    for r in requests:
+      if not r.done and r.finish is not None:
+        r.finish()
+      r.done = True
+      r.buffers = None
+
+class TorchDistributedComm(TensorComm):
+  """
+  Tensor communication using a torch.distributed process group.
+
+  The process group must contain the same processes as the MPI communicator
+  used by the apps, with the group ranks matching the MPI ranks. With the 
+  gloo backend device tensors are staged through host memory.
+  """
+
+  def __init__(self,group=None):
+    import torch.distributed as dist
+
+    assert dist.is_initialized(), 'torch.distributed must be initialized, call "init_process_group"'
+
+    self.dist = dist
+    self.group = group
+    self.stage = dist.get_backend(group)=='gloo'
+
+    # get_global_rank is public from PyTorch 2.0
+    if hasattr(dist,'get_global_rank'):
+      self.get_global_rank = dist.get_global_rank
+    else:
+      from torch.distributed import distributed_c10d
+      self.get_global_rank = distributed_c10d._get_global_rank
+
+  def Get_rank(self):
+    return self.dist.get_rank(self.group)
+
+  def Get_size(self):
+    return self.dist.get_world_size(self.group)
+
+  def globalRank(self,rank):
+    if self.group is None:
+      return rank
+    return self.get_global_rank(self.group,rank)
+
+  def isend(self,tensor,dest,tag=0):
+    if self.stage and tensor.device.type!='cpu':
+      tensor = tensor.cpu()
+    work = self.dist.isend(tensor,dst=self.globalRank(dest),group=self.group,tag=tag)
+    return TensorRequest(work,buffers=tensor)
+
+  def irecv(self,tensor,source,tag=0):
+    if self.stage and tensor.device.type!='cpu':
+      buffer = torch.empty_like(tensor,device='cpu')
+      work = self.dist.irecv(buffer,src=self.globalRank(source),group=self.group,tag=tag)
+      return TensorRequest(work,finish=lambda: tensor.copy_(buffer),buffers=buffer)
+
+    work = self.dist.irecv(tensor,src=self.globalRank(source),group=self.group,tag=tag)
+    return TensorRequest(work)
+
+  def bcast(self,tensor,root=0):
+    if self.stage and tensor.device.type!='cpu':
+      buffer = tensor.cpu()
+      self.dist.broadcast(buffer,src=self.globalRank(root),group=self.group)
+      tensor.copy_(buffer)
+    else:
+      self.dist.broadcast(tensor,src=self.globalRank(root),group=self.group)
+
+  def allreduce(self,tensor):
+    if self.stage and tensor.device.type!='cpu':
+      buffer = tensor.cpu()
+      self.dist.all_reduce(buffer,group=self.group)
+      tensor.copy_(buffer)
+    else:
+      self.dist.all_reduce(tensor,group=self.group)
+
+  def barrier(self):
+    self.dist.barrier(group=self.group)
@@ -0,0 +1,473 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+"""
+A communicator where the "ranks" are threads of one process.
+
+This implements the subset of mpi4py used by torchbraid's python code:
+Get_rank, Get_size, send/recv, Isend/Irecv and the persistent Send_init/Recv_init
+with Request.Wait/Test/Waitall, bcast, Bcast, gather, allgather, reduce, allreduce, 
+Reduce, Allreduce, Iallreduce, Split and Barrier. Messages are matched when the
+second of the send and the receive is posted, and the data is copied once, 
+directly from the send buffer into the receive buffer. So (as with MPI) a send 
+buffer must not be modified until its request completes. Python objects passed
+to send, bcast and the other lower case methods are shared, not copied, so must 
+not be modified by the receiver.
+
+PyTorch releases the GIL in its kernels, so threads give real parallelism for
+tensor heavy work. The XBraid solver is initialized with the underlying MPI 
+communicator (comm.ob_mpi), so this can't be passed to the XBraid based apps:
+LayerParallel can not run its time chunks on threads. It is useful for running
+and testing the python level communication without mpirun: an MPITensorComm 
+wrapping a ThreadComm drives the tensor traffic of the apps and of the MG/Opt 
+transfers (TransferPlan).
+
+Example:
+
+  from torchbraid.utils.thread_mpi import MPI, run
+
+  def main(comm):
+    return comm.allreduce(comm.Get_rank(),op=MPI.SUM)
+
+  results = run(4,main) # [6,6,6,6]
+"""
+
+import threading
+import functools
+
+from collections import deque
+
+import numpy as np
+import torch
+
+class _Op:
+  def __init__(self,name,scalar,tensor):
+    self.name = name
+    self.scalar = scalar
+    self.tensor = tensor
+
+  def __call__(self,a,b):
+    if isinstance(a,torch.Tensor):
+      return self.tensor(a,b)
+    if isinstance(a,np.ndarray):
+      return {'SUM' : np.add, 'PROD' : np.multiply, 'MAX' : np.maximum, 'MIN' : np.minimum}[self.name](a,b)
+    return self.scalar(a,b)
+
+  def __repr__(self):
+    return 'thread_mpi.'+self.name
+
+SUM  = _Op('SUM', lambda a,b: a+b,torch.add)
+PROD = _Op('PROD',lambda a,b: a*b,torch.mul)
+MAX  = _Op('MAX', max,torch.maximum)
+MIN  = _Op('MIN', min,torch.minimum)
+
+class _InPlace:
+  def __repr__(self):
+    return 'thread_mpi.IN_PLACE'
+
+IN_PLACE = _InPlace()
+UNDEFINED = -32766
+ANY_TAG = -1
+COMM_NULL = None
+
+def _resolve_op(op):
+  """
+  Map an operation (possibly from mpi4py) to a thread_mpi operation.
+  """
+  if isinstance(op,_Op):
+    return op
+
+  try:
+    from mpi4py import MPI as _MPI
+    mapping = {_MPI.SUM : SUM, _MPI.PROD : PROD, _MPI.MAX : MAX, _MPI.MIN : MIN}
+    for k,v in mapping.items():
+      if op==k:
+        return v
+  except ImportError: 
+    pass
+
+  raise ValueError('Unsupported reduction operation "{}"'.format(op))
+
+def _is_in_place(buf):
+  if buf is IN_PLACE:
+    return True
+  try:
+    from mpi4py import MPI as _MPI
+    return buf is _MPI.IN_PLACE
+  except ImportError:
+    return False
+
+def _buffer(buf):
+  """
+  Extract the data from an mpi4py style buffer specification (e.g. [buf,MPI.DOUBLE])
+  """
+  if isinstance(buf,(list,tuple)):
+    return buf[0]
+  return buf
+
+def _snapshot(buf):
+  # a copy of the local contribution to a collective
+  if isinstance(buf,torch.Tensor):
+    return buf.detach().clone()
+  return np.array(buf,copy=True)
+
+def _copy(dest,src):
+  if isinstance(dest,torch.Tensor):
+    with torch.no_grad():
+      dest.copy_(torch.as_tensor(src).reshape(dest.shape))
+  else:
+    np.copyto(dest,np.asarray(src).reshape(dest.shape))
+
+class Request:
+  """
+  A request for a non-blocking operation, complete once its event is set.
+  """
+  def __init__(self,world=None,event=None):
+    self.world = world
+    self.event = event
+
+  def Wait(self):
+    if self.event is not None:
+      self.world.wait(self.event)
+
+  def Test(self):
+    return self.event is None or self.event.is_set()
+
+  @staticmethod
+  def Waitall(requests):
+    # messages are matched when posted, so the order of the waits doesn't matter
+    for r in requests:
+      r.Wait()
+
+class Prequest(Request):
+  """
+  A persistent request, each call to Start posts the operation again.
+  """
+  def __init__(self,world,start):
+    super().__init__(world)
+    self.start = start
+
+  def Start(self):
+    self.event = self.start().event
+
+class _Message:
+  def __init__(self,data,event=None):
+    self.data = data
+    self.event = event
+
+class _Group:
+  """
+  State shared by the ranks (threads) of a communicator.
+  """
+  def __init__(self,size):
+    self.size = size
+    self.barrier = threading.Barrier(size)
+    self.slots = size*[None]
+
+class ThreadWorld:
+  """
+  The mailboxes and communicators shared by all the threads.
+  """
+  def __init__(self,size):
+    self.size = size
+    self.cond = threading.Condition()
+    self.mailboxes = dict()
+    self.sends = dict()
+    self.recvs = dict()
+    self.groups = []
+    self.aborted = False
+
+  def newGroup(self,size):
+    """
+    Create the shared state of a communicator, returns (group, group id).
+    """
+    with self.cond:
+      group = _Group(size)
+      self.groups += [group]
+      if self.aborted:
+        group.barrier.abort()
+      return group,len(self.groups)
+
+  def abort(self):
+    """
+    Release the ranks waiting in a collective or a receive, on every communicator.
+    """
+    with self.cond:
+      self.aborted = True
+      for group in self.groups:
+        group.barrier.abort()
+      self.cond.notify_all()
+
+  def wait(self,event):
+    while not event.wait(0.05):
+      if self.aborted:
+        raise threading.BrokenBarrierError('a thread_mpi rank failed')
+
+  def matchSend(self,key,data):
+    """
+    Post a send, copying into the receive buffer if it is already posted.
+    """
+    with self.cond:
+      if len(self.recvs.get(key,()))==0:
+        message = _Message(data,threading.Event())
+        self.sends.setdefault(key,deque()).append(message)
+        return message.event
+      posted = self.recvs[key].popleft()
+
+    _copy(posted.data,data)
+    posted.event.set()
+    return posted.event
+
+  def matchRecv(self,key,dest):
+    """
+    Post a receive, copying from the send buffer if it is already posted.
+    """
+    with self.cond:
+      if len(self.sends.get(key,()))==0:
+        posted = _Message(dest,threading.Event())
+        self.recvs.setdefault(key,deque()).append(posted)
+        return posted.event
+      message = self.sends[key].popleft()
+
+    _copy(dest,message.data)
+    message.event.set()
+    return message.event
+
+  def post(self,key,message):
+    with self.cond:
+      self.mailboxes.setdefault(key,deque()).append(message)
+      self.cond.notify_all()
+
+  def take(self,key):
+    with self.cond:
+      while len(self.mailboxes.get(key,())) == 0:
+        if self.aborted:
+          raise threading.BrokenBarrierError('a thread_mpi rank failed')
+        self.cond.wait()
+      return self.mailboxes[key].popleft()
+
+
+class ThreadComm:
+  """
+  A communicator between threads, see the module documentation.
+  """
+
+  def __init__(self,world,group,group_id,rank):
+    self.world = world
+    self.group = group
+    self.group_id = group_id
+    self.rank = rank
+
+  def Get_rank(self):
+    return self.rank
+
+  def Get_size(self):
+    return self.group.size
+
+  ####################################################################
+  # point to point
+
+  def _key(self,source,dest,tag):
+    return (self.group_id,source,dest,tag)
+
+  def send(self,obj,dest,tag=0):
+    # objects use their own mailboxes, separate from the buffer messages
+    self.world.post(self._key(self.rank,dest,tag)+('obj',),_Message(obj))
+
+  def recv(self,buf=None,source=0,tag=0):
+    return self.world.take(self._key(source,self.rank,tag)+('obj',)).data
+
+  def Send(self,buf,dest,tag=0):
+    self.Isend(buf,dest,tag).Wait()
+
+  def Recv(self,buf,source=0,tag=0):
+    self.Irecv(buf,source,tag).Wait()
+
+  def Isend(self,buf,dest,tag=0):
+    event = self.world.matchSend(self._key(self.rank,dest,tag),_buffer(buf))
+    return Request(self.world,event)
+
+  def Irecv(self,buf,source=0,tag=0):
+    event = self.world.matchRecv(self._key(source,self.rank,tag),_buffer(buf))
+    return Request(self.world,event)
+
+  def Send_init(self,buf,dest,tag=0):
+    return Prequest(self.world,lambda: self.Isend(buf,dest,tag))
+
+  def Recv_init(self,buf,source=0,tag=0):
+    return Prequest(self.world,lambda: self.Irecv(buf,source,tag))
+
+  ####################################################################
+  # collectives
+
+  def allgather(self,obj):
+    self.group.barrier.wait()
+    self.group.slots[self.rank] = obj
+    self.group.barrier.wait()
+    result = list(self.group.slots)
+    self.group.barrier.wait()
+    return result
+
+  def Barrier(self):
+    self.group.barrier.wait()
+
+  def bcast(self,obj,root=0):
+    return self.allgather(obj if self.rank==root else None)[root]
+
+  def Bcast(self,buf,root=0):
+    data = self.bcast(_buffer(buf),root)
+    if self.rank!=root:
+      _copy(_buffer(buf),data)
+    # the root's buffer is read until every rank has its copy
+    self.group.barrier.wait()
+
+  def gather(self,obj,root=0):
+    result = self.allgather(obj)
+    return result if self.rank==root else None
+
+  def allreduce(self,obj,op=SUM):
+    return functools.reduce(_resolve_op(op),self.allgather(obj))
+
+  def reduce(self,obj,op=SUM,root=0):
+    result = self.allreduce(obj,op)
+    return result if self.rank==root else None
+
+  def Allreduce(self,sendbuf,recvbuf,op=SUM):
+    recv = _buffer(recvbuf)
+    send = recv if _is_in_place(sendbuf) else _buffer(sendbuf)
+
+    # snapshot the local contribution, recvbuf may alias sendbuf
+    local = _snapshot(send)
+    _copy(recv,functools.reduce(_resolve_op(op),self.allgather(local)))
+
+  def Reduce(self,sendbuf,recvbuf,op=SUM,root=0):
+    local = _snapshot(_buffer(sendbuf))
+    result = functools.reduce(_resolve_op(op),self.allgather(local))
+    if self.rank==root:
+      _copy(_buffer(recvbuf),result)
+
+  def Iallreduce(self,sendbuf,recvbuf,op=SUM):
+    # collectives are blocking here, the request is already complete
+    self.Allreduce(sendbuf,recvbuf,op)
+    return Request()
+
+  ####################################################################
+  # communicator construction
+
+  def Split(self,color=0,key=0):
+    entries = self.allgather((color,key,self.rank))
+
+    members = sorted([(k,r) for c,k,r in entries if c==color and c!=UNDEFINED])
+
+    # the first member of each new group builds the shared state
+    state = None
+    if len(members)>0 and members[0][1]==self.rank:
+      state = self.world.newGroup(len(members))
+    states = self.allgather(state)
+
+    if color==UNDEFINED:
+      return COMM_NULL
+
+    group,group_id = states[members[0][1]]
+    new_rank = [r for k,r in members].index(self.rank)
+    return ThreadComm(self.world,group,group_id,new_rank)
+
+  def Dup(self):
+    return self.Split(0,self.rank)
+
+  def Free(self):
+    pass
+# end ThreadComm
+
+class _Namespace:
+  """
+  Mimics the mpi4py.MPI module for code that uses MPI.SUM etc. COMM_WORLD
+  is the communicator of the calling thread (set by run).
+  """
+  SUM = SUM
+  PROD = PROD
+  MAX = MAX
+  MIN = MIN
+  IN_PLACE = IN_PLACE
+  UNDEFINED = UNDEFINED
+  COMM_NULL = COMM_NULL
+  Request = Request
+  Prequest = Prequest
+
+  def __init__(self):
+    self._local = threading.local()
+
+  @property
+  def COMM_WORLD(self):
+    comm = getattr(self._local,'comm',None)
+    assert comm is not None, 'COMM_WORLD is only defined on threads started by "run"'
+    return comm
+
+MPI = _Namespace()
+
+def run(num_ranks,func,*args,**kwargs):
+  """
+  Run func(comm,*args,**kwargs) on num_ranks threads.
+
+  Returns the list of results ordered by rank. If a rank raises an
+  exception it is raised here, after all the threads finish.
+  """
+  world = ThreadWorld(num_ranks)
+  group,group_id = world.newGroup(num_ranks)
+
+  results = num_ranks*[None]
+  errors = num_ranks*[None]
+
+  def target(rank):
+    comm = ThreadComm(world,group,group_id,rank)
+    MPI._local.comm = comm
+    try:
+      results[rank] = func(comm,*args,**kwargs)
+    except BaseException as e:
+      errors[rank] = e
+      # release the ranks waiting in a collective or a receive, on any communicator
+      world.abort()
+
+  threads = [threading.Thread(target=target,args=(r,),name='thread_mpi-{}'.format(r)) for r in range(num_ranks)]
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+
+  # report the original error, not the broken barriers it caused
+  for e in errors:
+    if e is not None and not isinstance(e,threading.BrokenBarrierError):
+      raise e
+  for e in errors:
+    if e is not None:
+      raise e
+
+  return results
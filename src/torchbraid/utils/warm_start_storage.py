@@ -0,0 +1,235 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import numpy as np
+import torch
+
+from collections import OrderedDict
+
+class WarmStartStorage:
+  """
+  A class that stores the state at each local time step for individual samples,
+  keyed by their index in the dataset.
+
+  The best initial guess for a sample is often its own trajectory from the 
+  previous epoch. After a solve the states at the local time points are stored
+  for the samples in the batch; on the next visit to a sample they are returned 
+  through getState. Samples without a stored state are filled with the mean of 
+  the samples that do have one. If no sample in the batch has a stored state 
+  getState returns None and the default initial guess is used.
+
+  The states are stored in one array per state tensor of shape 
+  [max_samples,num_times,*state_shape]. If a filename is given the arrays are
+  memory mapped, so the store can exceed the host memory. If more samples than
+  max_samples are stored, the least recently used sample is evicted.
+  """
+
+  @torch.no_grad()
+  def __init__(self,num_samples,num_times,dt,max_samples=None,dtype=torch.float32,filename=None):
+    """
+    Constructor for the warm start storage class.
+
+      Parameters:
+        num_samples (int: >0): Number of samples in the dataset
+        num_times (int: >0): Number of time points stored for each sample
+        dt (float: >0): Time step, used to map times to indices
+        max_samples (int: >0): Bound on the number of samples stored, defaults to num_samples
+        dtype (torch.dtype): Storage type, torch.float16 halves the footprint
+        filename (str): If not None the prefix of the memory mapped files, otherwise
+                        the states are kept in memory
+    """
+    assert(0 < num_samples)
+    assert(0 < num_times)
+    assert(0.0 < dt)
+
+    if max_samples is None:
+      max_samples = num_samples
+    assert(0 < max_samples)
+
+    self.num_samples = num_samples
+    self.num_times = num_times
+    self.dt = dt
+    self.max_samples = min(max_samples,num_samples)
+    self.dtype = dtype
+    self.filename = filename
+
+    # allocated on the first addStates, when the shapes are known
+    self.arrays = None
+    self.memmaps = []
+    self.state_dtype = None
+    self.device = None
+
+    # maps a global time index to a row in the arrays
+    self.time_index = dict()
+
+    # maps a sample to a slot in the arrays, ordered from least to most recently used
+    self.slots = OrderedDict()
+    self.free_slots = list(range(self.max_samples-1,-1,-1))
+    self.valid = torch.zeros(self.max_samples,num_times,dtype=torch.bool)
+
+    self.indices = None
+
+  def _allocate(self,state):
+    self.arrays = []
+    for i,s in enumerate(state):
+      shape = tuple([self.max_samples,self.num_times]+list(s.shape[1:]))
+      if self.filename is None:
+        array = torch.zeros(shape,dtype=self.dtype)
+      else:
+        np_dtype = torch.zeros(0,dtype=self.dtype).numpy().dtype
+        memmap = np.memmap('{}.{}'.format(self.filename,i),dtype=np_dtype,mode='w+',shape=shape)
+        self.memmaps += [memmap]
+        array = torch.from_numpy(memmap)
+      self.arrays += [array]
+
+    self.state_dtype = state[0].dtype
+    self.device = state[0].device
+
+  def _timeIndex(self,t,create):
+    key = round(t/self.dt)
+    if key not in self.time_index:
+      if not create:
+        return None
+      assert len(self.time_index)<self.num_times, 'More time points than num_times'
+      self.time_index[key] = len(self.time_index)
+    return self.time_index[key]
+
+  def _assignSlots(self,indices):
+    """
+    Find (or create) the slot for each index, evicting the least recently used samples.
+    """
+    result = []
+    for i in indices:
+      if i in self.slots:
+        self.slots.move_to_end(i)
+      else:
+        if len(self.free_slots)==0:
+          _,evicted = self.slots.popitem(last=False)
+          self.valid[evicted] = False
+          self.free_slots.append(evicted)
+        self.slots[i] = self.free_slots.pop()
+      result += [self.slots[i]]
+    return torch.tensor(result,dtype=torch.long)
+
+  def getStoredCount(self):
+    return len(self.slots)
+
+  def setIndices(self,indices):
+    """
+    Set the dataset indices of the samples in the next batch.
+    """
+    if isinstance(indices,torch.Tensor):
+      indices = indices.tolist()
+    self.indices = list(indices)
+
+    # mark the samples as recently used
+    for i in self.indices:
+      if i in self.slots:
+        self.slots.move_to_end(i)
+
+  def clearIndices(self):
+    """
+    Forget the indices of the last batch, getState returns None until setIndices is called.
+    """
+    self.indices = None
+
+  @torch.no_grad()
+  def addStates(self,times,states,indices=None):
+    """
+    Store the states of a batch.
+
+      Parameters:
+        times (list): Time of each state
+        states (list): A tuple of tensors for each time, the first dimension is the batch
+        indices (list): Dataset index of each sample in the batch, defaults to the
+                        indices passed to setIndices
+    """
+    if indices is None:
+      indices = self.indices
+    assert indices is not None, 'Dataset indices required, call "setIndices"'
+    if isinstance(indices,torch.Tensor):
+      indices = indices.tolist()
+
+    assert len(indices)<=self.max_samples, 'Batch is larger than max_samples'
+
+    if len(states)==0:
+      return
+
+    states = [s if isinstance(s,tuple) else (s,) for s in states]
+    if self.arrays is None:
+      self._allocate(states[0])
+
+    slots = self._assignSlots(indices)
+    for t,state in zip(times,states):
+      tidx = self._timeIndex(t,create=True)
+      for array,s in zip(self.arrays,state):
+        array[slots,tidx] = s.detach().to('cpu',self.dtype)
+      self.valid[slots,tidx] = True
+
+  @torch.no_grad()
+  def getState(self,t):
+    """
+    Get the state at time t for the samples set by setIndices, or None if
+    no state is stored.
+    """
+    if self.arrays is None or self.indices is None:
+      return None
+
+    tidx = self._timeIndex(t,create=False)
+    if tidx is None:
+      return None
+
+    slots = torch.tensor([self.slots.get(i,-1) for i in self.indices],dtype=torch.long)
+    known = slots>=0
+    hit = torch.zeros(len(self.indices),dtype=torch.bool)
+    hit[known] = self.valid[slots[known],tidx]
+    if not hit.any():
+      return None
+
+    state = []
+    for array in self.arrays:
+      stored = array[slots[hit],tidx].to(self.device,self.state_dtype)
+      if hit.all():
+        state += [stored]
+      else:
+        s = torch.mean(stored,dim=0,keepdim=True).expand(len(self.indices),*stored.shape[1:]).clone()
+        s[hit.to(self.device)] = stored
+        state += [s]
+
+    return tuple(state)
+
+  def flush(self):
+    """
+    Write the memory mapped arrays to disk.
+    """
+    for memmap in self.memmaps:
+      memmap.flush()
+# end WarmStartStorage
@@ -0,0 +1,78 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import threading
+import torch
+import unittest
+
+from torchbraid.utils import BatchStager
+
+class FailingLoader:
+  def __iter__(self):
+    yield torch.zeros(2,3),torch.zeros(2)
+    raise RuntimeError('loader failed')
+
+  def __len__(self):
+    return 2
+
+class TestBatchStager(unittest.TestCase):
+  def test_order(self):
+    batches = [(torch.full((4,3),float(i)),torch.full((4,),i)) for i in range(7)]
+
+    for depth in [1,3,10]:
+      stager = BatchStager(batches,torch.device('cpu'),depth=depth)
+      self.assertEqual(len(stager),len(batches))
+
+      staged = list(stager)
+      self.assertEqual(len(staged),len(batches))
+      for (data,target),(ref_data,ref_target) in zip(staged,batches):
+        self.assertTrue(torch.equal(data,ref_data))
+        self.assertTrue(torch.equal(target,ref_target))
+
+  def test_early_exit(self):
+    batches = [(torch.zeros(1),torch.zeros(1)) for _ in range(50)]
+    count = threading.active_count()
+
+    for i,_ in enumerate(BatchStager(batches,'cpu',depth=2)):
+      if i==3:
+        break
+
+    # the background thread has stopped
+    self.assertEqual(threading.active_count(),count)
+
+  def test_exception(self):
+    stager = BatchStager(FailingLoader(),'cpu')
+    with self.assertRaises(RuntimeError):
+      for _ in stager:
+        pass
+
+if __name__ == '__main__':
+  unittest.main()
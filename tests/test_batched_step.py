@@ -0,0 +1,114 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import torch
+import torch.nn as nn
+import unittest
+
+from torchbraid.utils import BatchedStepEngine
+
+class Step(nn.Module):
+  def __init__(self,layer):
+    super().__init__()
+    self.layer = layer
+
+  def forward(self,dt,x):
+    return x+dt*self.layer(x)
+
+class TestBatchedStepEngine(unittest.TestCase):
+  def check(self,layers,dts,states):
+    with torch.no_grad():
+      expected = [l(dt,x) for l,dt,x in zip(layers,dts,states)]
+
+    engine = BatchedStepEngine()
+    results = engine(layers,dts,states)
+
+    self.assertEqual(len(results),len(expected))
+    for r,e in zip(results,expected):
+      self.assertEqual(r.shape,e.shape)
+      self.assertTrue(torch.allclose(r,e,atol=1e-6))
+
+  def test_shared_weights(self):
+    layer = Step(nn.Sequential(nn.Linear(3,3),nn.ReLU()))
+    states = [torch.rand(4,3) for i in range(5)]
+
+    self.check(5*[layer],5*[0.1],states)
+
+  def test_stacked_weights(self):
+    layers = [Step(nn.Sequential(nn.Conv2d(2,2,3,padding=1),nn.ReLU())) for i in range(4)]
+    states = [torch.rand(3,2,5,5) for i in range(4)]
+
+    self.check(layers,4*[0.25],states)
+
+  def test_mixed(self):
+    # different time steps, architectures and a single step group
+    a = Step(nn.Linear(3,3))
+    b = Step(nn.Linear(3,3))
+    c = Step(nn.Sequential(nn.Linear(3,3),nn.Tanh()))
+    layers = [a,b,c,a,b]
+    dts = [0.1,0.1,0.1,0.2,0.2]
+    states = [torch.rand(2,3) for i in range(5)]
+
+    self.check(layers,dts,states)
+
+  def test_batch_norm(self):
+    # training mode batch norm depends on the batch, so is not batched
+    layers = [Step(nn.BatchNorm1d(3)) for i in range(3)]
+    states = [torch.rand(4,3) for i in range(3)]
+
+    self.assertFalse(BatchedStepEngine.batchable(layers[0]))
+
+    engine = BatchedStepEngine()
+    results = engine(layers,3*[0.1],states)
+    self.assertEqual(len(results),3)
+
+    for l in layers:
+      l.eval()
+    self.assertTrue(BatchedStepEngine.batchable(layers[0]))
+    self.check(layers,3*[0.1],states)
+
+  def test_signature_cache(self):
+    layers = [Step(nn.Linear(3,3)) for i in range(2)]
+    states = [torch.rand(2,3) for i in range(2)]
+
+    engine = BatchedStepEngine()
+    engine(layers,2*[0.1],states)
+    self.assertEqual(len(engine.signatures),2)
+
+    # later calls reuse the cached signatures
+    sig = engine.signature(layers[0])
+    engine(layers,2*[0.1],states)
+    self.assertIs(engine.signature(layers[0]),sig)
+    self.assertEqual(engine.signature(layers[1]),sig)
+    self.assertEqual(len(engine.signatures),2)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -51,6 +51,68 @@ class TestDataParallel(unittest.TestCase):
         for rank in range(procs):
           self.assertListEqual(train_partition.partitions[rank], res[(procs,batch_size)][rank])
 
+  def test_strided_sampler(self):
+    from torchbraid.utils.data_parallel import StridedSampler
+
+    for num_samples in [20, 23, 3]:
+      for procs in range(1, 4):
+        for batch_size in [2, 5]:
+          # without a shuffle the blocks of consecutive indices are dealt round robin
+          expected = [[i for i in range(num_samples) if (i // batch_size) % procs == rank] for rank in range(procs)]
+
+          samplers = [StridedSampler(num_samples, procs, rank, batch_size, shuffle=False, chunk_size=7) for rank in range(procs)]
+          for rank in range(procs):
+            self.assertListEqual(list(samplers[rank]), expected[rank])
+            self.assertEqual(len(samplers[rank]), len(expected[rank]))
+
+          # shuffled, the ranks still partition the samples, independent of the chunk size
+          for epoch in range(2):
+            found = []
+            for rank in range(procs):
+              sampler = StridedSampler(num_samples, procs, rank, batch_size, seed=4)
+              sampler.set_epoch(epoch)
+              indices = list(sampler)
+              self.assertEqual(len(indices), len(sampler))
+
+              sampler.chunk_size = 3
+              self.assertListEqual(list(sampler), indices)
+              found += indices
+            self.assertListEqual(sorted(found), list(range(num_samples)))
+
+    sampler = StridedSampler(100, 2, 1, 5, seed=4)
+    first = list(sampler)
+    sampler.set_epoch(1)
+    self.assertNotEqual(first, list(sampler))
+
+  def test_split_communicator_topology(self):
+    from mpi4py import MPI
+    from torchbraid.utils.data_parallel import split_communicator, split_communicator_topology, message_volume, node_ids
+
+    comm = MPI.COMM_WORLD
+    size = comm.Get_size()
+
+    nodes = node_ids(comm)
+    self.assertEqual(len(nodes),size)
+    self.assertEqual(nodes[0],0)
+
+    for splitting in [s for s in range(1,size+1) if size % s==0]:
+      comm_dp,comm_lp = split_communicator_topology(comm,splitting)
+      ref_dp,ref_lp = split_communicator(comm,splitting)
+
+      # same sizes as the rank based layout
+      self.assertEqual(comm_dp.Get_size(),ref_dp.Get_size())
+      self.assertEqual(comm_lp.Get_size(),ref_lp.Get_size())
+
+      # every message is counted exactly once
+      volume = message_volume(comm,comm_dp,comm_lp,10,100)
+      lp_total = volume['lp']['intra_node']+volume['lp']['inter_node']
+      self.assertEqual(lp_total,splitting*2*(comm_lp.Get_size()-1)*10)
+
+      # consecutive layer-parallel ranks share a node if the node is large enough
+      if len(set(nodes))==1:
+        self.assertEqual(volume['lp']['inter_node'],0)
+        self.assertEqual(volume['dp']['inter_node'],0)
+
 if __name__ == '__main__':
   unittest.main()
 
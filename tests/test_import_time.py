@@ -0,0 +1,108 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+
+import os
+import sys
+import unittest
+import subprocess
+
+# modules that "import torchbraid" should not load
+DEFERRED_MODULES = ['torchbraid.gru_layer_parallel',
+                    'torchbraid.gru_apps',
+                    'torchbraid.gru_braid_function',
+                    'torchbraid.mgopt',
+                    'torchbraid.test_fixtures.test_cbs',
+                    'torchbraid.utils.mean_initial_guess_storage',
+                    'torchbraid.utils.data_parallel',
+                    'torchbraid.utils.gittools']
+
+# budget (in seconds) for the modules owned by torchbraid, this excludes torch
+# and mpi4py. Can be changed with the environment variable below
+IMPORT_TIME_BUDGET = float(os.environ.get('TORCHBRAID_IMPORT_TIME_BUDGET',0.5))
+
+def run_python(code,extra_args=[]):
+  result = subprocess.run([sys.executable]+extra_args+['-c',code],
+                          stdout=subprocess.PIPE,stderr=subprocess.PIPE,check=True)
+  return result.stdout.decode(),result.stderr.decode()
+
+def parse_import_time(stderr,prefix):
+  """
+  Parse the output of "python -X importtime" and sum the self times (in seconds)
+  of all the modules starting with prefix.
+  """
+  total = 0.0
+  for line in stderr.splitlines():
+    if not line.startswith('import time:'):
+      continue
+    fields = line[len('import time:'):].split('|')
+    if len(fields)!=3 or not fields[0].strip().isdigit():
+      continue
+    if fields[2].strip().startswith(prefix):
+      total += int(fields[0])*1e-6
+  return total
+
+class TestImportTime(unittest.TestCase):
+
+  def test_deferred_modules(self):
+    stdout,_ = run_python('import sys, torchbraid; print(" ".join(sys.modules.keys()))')
+    loaded = set(stdout.split())
+
+    self.assertIn('torchbraid.layer_parallel',loaded)
+    for m in DEFERRED_MODULES:
+      self.assertNotIn(m,loaded,f'"{m}" should not be loaded by "import torchbraid"')
+
+  def test_lazy_attributes(self):
+    import torchbraid
+    import torchbraid.utils as utils
+
+    self.assertTrue(torchbraid.GRU_Parallel is not None)
+    self.assertTrue(torchbraid.GRU_Serial is not None)
+    self.assertTrue(torchbraid.mgopt.mgopt_solver is not None)
+    self.assertTrue(utils.MeanInitialGuessStorage is not None)
+    self.assertTrue(utils.data_parallel.split_communicator is not None)
+    self.assertTrue(utils.MPI.COMM_WORLD.Get_size()>=1)
+
+    self.assertIn('GRU_Parallel',dir(torchbraid))
+    self.assertIn('MeanInitialGuessStorage',dir(utils))
+
+    with self.assertRaises(AttributeError):
+      torchbraid.not_an_attribute
+
+  def test_import_time(self):
+    _,stderr = run_python('import torchbraid',extra_args=['-X','importtime'])
+    tb_time = parse_import_time(stderr,'torchbraid')
+
+    print(f'\n  "import torchbraid" self time: {tb_time:.4f} s (budget = {IMPORT_TIME_BUDGET:.4f} s)')
+    self.assertLess(tb_time,IMPORT_TIME_BUDGET)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -133,6 +133,32 @@ class ConvBlock(nn.Module):
     return self.lin(x)
 # end layer
 
+class Conv2dBlock(nn.Module):
+  def __init__(self,num_ch):
+    super(Conv2dBlock, self).__init__()
+    self.conv = nn.Conv2d(num_ch,num_ch,kernel_size=3,padding=1)
+
+  def forward(self, x):
+    return torch.tanh(self.conv(x))
+# end layer
+
+class AutocastRecordBlock(nn.Module):
+  def __init__(self,dim,records):
+    super(AutocastRecordBlock, self).__init__()
+    self.lin = nn.Linear(dim,dim)
+    self.records = records
+    # shared with the app, holds the level of the step
+    self.level_flag = torch.tensor(0)
+
+  def forward(self, x):
+    if x.device.type=='cpu':
+      enabled = torch.is_autocast_cpu_enabled()
+    else:
+      enabled = torch.is_autocast_enabled()
+    self.records.append((int(self.level_flag),enabled))
+    return torch.tanh(self.lin(x))
+# end layer
+
 class TestTorchBraid(unittest.TestCase):
 
   def test_extra_linearNet_Exact(self):
@@ -378,6 +404,375 @@ class TestTorchBraid(unittest.TestCase):
     fine_tidx = m.fwd_app.getFineTimeIndex(tidx=23,level=1)
     self.assertEqual(fine_tidx,23*cfactor[0])
 
+  def test_telemetry(self):
+    basic_block = lambda: ReLUBlock(2)
+    max_iters = 4
+
+    # figure out the whole GPU situation
+    my_device,my_host = getDevice(MPI.COMM_WORLD) 
+
+    m = torchbraid.LayerParallel(MPI.COMM_WORLD,basic_block,4*MPI.COMM_WORLD.Get_size(),Tf=2.0,max_fwd_levels=2,max_bwd_levels=2,max_iters=max_iters)
+    m = m.to(my_device)
+    m.setPrintLevel(0)
+    m.enableTelemetry()
+
+    x0 = torch.rand(5,2,device=my_device)
+    w0 = torch.rand(5,2,device=my_device)
+
+    num_solves = 2
+    for i in range(num_solves):
+      y = m(x0)
+      y.backward(w0)
+
+    telemetry = m.getTelemetry()
+    self.assertEqual(len(telemetry['forward']),num_solves)
+    self.assertEqual(len(telemetry['backward']),num_solves)
+
+    for name in ['forward','backward']:
+      for i,record in enumerate(telemetry[name]):
+        self.assertEqual(record['solve'],name)
+        self.assertEqual(record['index'],i)
+        self.assertLessEqual(record['iterations'],max_iters)
+        self.assertTrue(len(record['residuals'])>0)
+        self.assertTrue(sum(record['step_count'])>0)
+        self.assertTrue(record['drive_time']>=record['callback_time'])
+        if MPI.COMM_WORLD.Get_size()==1:
+          self.assertEqual(record['messages_sent'],0)
+
+    m.clearTelemetry()
+    self.assertEqual(len(m.getTelemetry()['forward']),0)
+
+    m.enableTelemetry(False)
+    self.assertTrue(m.fwd_app.getTelemetry() is None)
+    self.assertTrue(m.bwd_app.getTelemetry() is None)
+
+  def test_adaptive_iterations(self):
+    basic_block = lambda: ReLUBlock(2)
+
+    my_device,my_host = getDevice(MPI.COMM_WORLD) 
+
+    m = torchbraid.LayerParallel(MPI.COMM_WORLD,basic_block,4*MPI.COMM_WORLD.Get_size(),Tf=2.0,max_fwd_levels=2,max_bwd_levels=2,max_iters=6)
+    m = m.to(my_device)
+    m.setPrintLevel(0)
+    m.enableAdaptiveIterations(fwd_tol=1e-8,bwd_tol=1e-4,min_iters=2,max_iters=6,hysteresis=1)
+
+    x0 = torch.rand(5,2,device=my_device)
+    w0 = torch.rand(5,2,device=my_device)
+
+    num_solves = 4
+    for i in range(num_solves):
+      y = m(x0)
+      y.backward(w0)
+
+      # the caps stay within the clamps
+      for iters in [m.getFwdMaxIters(),m.getBwdMaxIters()]:
+        self.assertTrue(2<=iters and iters<=6)
+
+    log = m.getAdaptiveIterationLog()
+    self.assertEqual(len(log['forward']),num_solves)
+    self.assertEqual(len(log['backward']),num_solves)
+
+    for name in ['forward','backward']:
+      for record in log[name]:
+        # the cap only moves by one per solve, and only goes up if the target was missed
+        self.assertLessEqual(abs(record['new_iters']-record['max_iters']),1)
+        if record['new_iters']>record['max_iters']:
+          self.assertTrue(record['needed'] is None)
+
+    # decisions are global
+    self.assertEqual(MPI.COMM_WORLD.allgather(m.getFwdMaxIters()),[m.getFwdMaxIters()]*MPI.COMM_WORLD.Get_size())
+
+    m.enableAdaptiveIterations(False)
+    self.assertTrue(m.fwd_app.getIterationController() is None)
+
+  def test_spatial_coarsening(self):
+    from torchbraid.utils.spatial import AvgPoolBilinear
+
+    comm = MPI.COMM_WORLD
+    my_device,my_host = getDevice(comm)
+    basic_block = lambda: Conv2dBlock(2)
+    steps = 4*comm.Get_size()
+
+    # the coarse level runs on 4x4 features, the converged result is that of the fine level
+    m = torchbraid.LayerParallel(comm,basic_block,steps,Tf=1.0,max_fwd_levels=2,max_bwd_levels=2,max_iters=40,
+                                 spatial_ref_pair=AvgPoolBilinear(factor=2,min_size=4))
+    m_ref = torchbraid.LayerParallel(comm,basic_block,steps,Tf=1.0,max_fwd_levels=1,max_bwd_levels=1,max_iters=1)
+    m_ref.load_state_dict(m.state_dict())
+    for model in [m,m_ref]:
+      model.to(my_device)
+      model.setPrintLevel(0)
+
+    torch.manual_seed(9)
+    x0 = torch.rand(3,2,8,8,device=my_device)
+    w0 = torch.rand(3,2,8,8,device=my_device)
+
+    def solve(model):
+      model.zero_grad()
+      x = x0.clone()
+      x.requires_grad = True
+      y = model(x)
+      y.backward(w0)
+      return y.detach().clone(),x.grad.clone(),[p.grad.clone() for p in model.parameters()]
+
+    y,xg,grads = solve(m)
+    y_ref,xg_ref,grads_ref = solve(m_ref)
+
+    self.assertEqual(m.fwd_app.getFeatureShapes(0,1)[0],torch.Size((3,2,4,4)))
+    self.assertTrue(torch.allclose(y,y_ref,atol=1e-5))
+    self.assertTrue(torch.allclose(xg,xg_ref,atol=1e-5))
+    for g,g_ref in zip(grads,grads_ref):
+      self.assertTrue(torch.allclose(g,g_ref,atol=1e-5))
+
+  def test_level_policy(self):
+    from torchbraid.utils import LevelExecutionPolicy
+
+    comm = MPI.COMM_WORLD
+    my_device,my_host = getDevice(comm)
+    records = []
+    basic_block = lambda: AutocastRecordBlock(3,records)
+
+    m = torchbraid.LayerParallel(comm,basic_block,4*comm.Get_size(),Tf=1.0,max_fwd_levels=2,max_bwd_levels=2,max_iters=30)
+    m = m.to(my_device)
+    m.setPrintLevel(0)
+
+    torch.manual_seed(3)
+    x0 = torch.rand(5,3,device=my_device)
+    w0 = torch.rand(5,3,device=my_device)
+
+    def solve():
+      records.clear()
+      m.zero_grad()
+      x = x0.clone()
+      x.requires_grad = True
+      y = m(x)
+      y.backward(w0)
+      return y.detach().clone(),x.grad.clone(),[p.grad.clone() for p in m.parameters()]
+
+    y_ref,xg_ref,grads_ref = solve()
+
+    m.setLevelPolicy(LevelExecutionPolicy(autocast_dtype=torch.bfloat16))
+    y,xg,grads = solve()
+
+    # the coarse levels only compute corrections, the converged result is unchanged
+    self.assertTrue(torch.allclose(y,y_ref,atol=1e-5))
+    self.assertTrue(torch.allclose(xg,xg_ref,atol=1e-5))
+    for g,g_ref in zip(grads,grads_ref):
+      self.assertTrue(torch.allclose(g,g_ref,atol=1e-5))
+
+    # autocast is used on the coarse level, and only there
+    for level,enabled in records:
+      self.assertEqual(enabled,level>0)
+    self.assertTrue(comm.allreduce(any(level>0 for level,_ in records),op=MPI.LOR))
+
+    m.setLevelPolicy(None)
+
+  def test_warm_start(self):
+    comm = MPI.COMM_WORLD
+    basic_block = lambda: ReLUBlock(2)
+
+    my_device,my_host = getDevice(comm)
+
+    m = torchbraid.LayerParallel(comm,basic_block,4*comm.Get_size(),Tf=2.0,max_fwd_levels=2,max_bwd_levels=2,max_iters=20)
+    m = m.to(my_device)
+    m.setPrintLevel(0)
+
+    torch.manual_seed(7)
+    batches = [(torch.rand(3,2,device=my_device),[0,1,2]),(torch.rand(3,2,device=my_device),[3,4,5])]
+
+    # converged solutions of each batch
+    exact = [m(x).detach().clone() for x,_ in batches]
+
+    def error(y,y_exact):
+      return comm.allreduce(torch.norm(y-y_exact).item(),op=MPI.MAX)
+
+    # a single iteration, the first batch is solved again after the second one
+    m.setMaxIters(1)
+    def solve_sequence():
+      errors = []
+      for (x,indices),y_exact in zip(batches+batches[:1],exact+exact[:1]):
+        if m.warm_start is not None:
+          m.setWarmStartIndices(indices)
+        errors += [error(m(x),y_exact)]
+      return errors
+
+    cold = solve_sequence()
+
+    storage = m.enableWarmStart(num_samples=6)
+    m.setMaxIters(20)
+    for x,indices in batches:
+      m.setWarmStartIndices(indices)
+      m(x)
+    self.assertEqual(storage.getStoredCount(),6)
+    # the initial condition is not stored
+    self.assertEqual(0 in storage.time_index,False)
+
+    m.setMaxIters(1)
+    warm = solve_sequence()
+
+    # the second solve of a batch starts from its own converged states
+    self.assertLess(warm[-1],cold[-1])
+    self.assertLess(warm[-1],1e-5)
+
+    m.disableWarmStart()
+
+  @unittest.skipIf(MPI.COMM_WORLD.Get_size()>1,'the native solver is single processor only')
+  def test_native_solver(self):
+    basic_block = lambda: ReLUBlock(2)
+
+    my_device,my_host = getDevice(MPI.COMM_WORLD) 
+
+    m = torchbraid.LayerParallel(MPI.COMM_WORLD,basic_block,16,Tf=2.0,max_fwd_levels=3,max_bwd_levels=3,max_iters=20)
+    m = m.to(my_device)
+    m.setPrintLevel(0)
+    m.setNumRelax(1,level=1)
+
+    x0 = torch.rand(5,2,device=my_device)
+    w0 = torch.rand(5,2,device=my_device)
+
+    def solve():
+      m.zero_grad()
+      x = x0.clone()
+      x.requires_grad = True
+      y = m(x)
+      y.backward(w0)
+      return y.detach().clone(),x.grad.clone(),[p.grad.clone() for p in m.parameters()]
+
+    # converged XBraid solve
+    y_braid,xg_braid,grads_braid = solve()
+
+    serial = None
+    for num_threads,batched in [(1,False),(4,False),(1,True)]:
+      m.setNativeSolver(num_threads=num_threads,batched_steps=batched)
+
+      y_native,xg_native,grads_native = solve()
+
+      # the threaded sweeps give the same result as the serial ones
+      if serial is None:
+        serial = (y_native,xg_native,grads_native)
+      elif not batched:
+        self.assertTrue(torch.equal(y_native,serial[0]))
+        self.assertTrue(torch.equal(xg_native,serial[1]))
+        for g_native,g_serial in zip(grads_native,serial[2]):
+          self.assertTrue(torch.equal(g_native,g_serial))
+
+      self.assertTrue(torch.allclose(y_native,y_braid,atol=1e-5))
+      self.assertTrue(torch.allclose(xg_native,xg_braid,atol=1e-5))
+      for g_native,g_braid in zip(grads_native,grads_braid):
+        self.assertTrue(torch.allclose(g_native,g_braid,atol=1e-5))
+
+      itr,res = m.getFwdStats()
+      self.assertTrue(itr>0)
+
+    # a single iteration is not converged, but the final relaxation must be consistent
+    m.setMaxIters(1)
+    y_native,_,_ = solve()
+    self.assertEqual(m.getFwdStats()[0],1)
+
+    m.setNativeSolver(False)
+    self.assertTrue(m.fwd_app.getNativeSolver() is None)
+
+  def test_tensor_comm(self):
+    import os
+    import tempfile
+    import torch.distributed as dist
+
+    from torchbraid.utils import MPITensorComm, TorchDistributedComm
+
+    comm = MPI.COMM_WORLD
+    basic_block = lambda: ReLUBlock(2)
+
+    m = torchbraid.LayerParallel(comm,basic_block,4*comm.Get_size(),Tf=2.0,max_fwd_levels=2,max_bwd_levels=2,max_iters=2)
+    m.setPrintLevel(0)
+
+    x0 = torch.rand(5,2)
+    w0 = torch.rand(5,2)
+
+    def solve():
+      m.zero_grad()
+      y = m(x0)
+      y.backward(w0)
+      return y.detach().clone(),[p.grad.clone() for p in m.parameters()]
+
+    self.assertTrue(isinstance(m.getTensorComm(),MPITensorComm))
+    y_mpi,grads_mpi = solve()
+
+    # a gloo process group over the same ranks
+    filename = None
+    if comm.Get_rank()==0:
+      filename = os.path.join(tempfile.mkdtemp(),'gloo_init')
+    filename = comm.bcast(filename,root=0)
+
+    if not dist.is_initialized():
+      dist.init_process_group('gloo',init_method='file://'+filename,rank=comm.Get_rank(),world_size=comm.Get_size())
+
+    m.setTensorComm(TorchDistributedComm())
+    y_dist,grads_dist = solve()
+
+    self.assertTrue(torch.allclose(y_dist,y_mpi))
+    for g_dist,g_mpi in zip(grads_dist,grads_mpi):
+      self.assertTrue(torch.allclose(g_dist,g_mpi))
+
+    m.setTensorComm(None)
+    self.assertTrue(isinstance(m.getTensorComm(),MPITensorComm))
+
+  def test_autotune(self):
+    import os
+    import json
+    import tempfile
+
+    basic_block = lambda: ReLUBlock(2)
+
+    my_device,my_host = getDevice(MPI.COMM_WORLD) 
+
+    m = torchbraid.LayerParallel(MPI.COMM_WORLD,basic_block,8*MPI.COMM_WORLD.Get_size(),Tf=2.0,max_fwd_levels=1,max_bwd_levels=1,max_iters=1)
+    m = m.to(my_device)
+    m.setPrintLevel(0)
+
+    batches = [torch.rand(5,2,device=my_device) for i in range(2)]
+
+    cache_file = None
+    if MPI.COMM_WORLD.Get_rank()==0:
+      cache_file = os.path.join(tempfile.mkdtemp(),'autotune.json')
+    cache_file = MPI.COMM_WORLD.bcast(cache_file,root=0)
+
+    search_space = {'levels' : [2,3], 'cfactor' : [2], 'max_iters' : [1,8], 'nrelax' : [1]}
+
+    # a loose tolerance is satisfied by some configuration
+    config = m.autotune(batches,search_space=search_space,tolerance=1e-2,cache_file=cache_file)
+    self.assertTrue(config is not None)
+    self.assertEqual(m.getFwdMaxLevels(),config['levels'])
+    self.assertEqual(m.getBwdMaxLevels(),config['levels'])
+    self.assertEqual(m.getFwdMaxIters(),config['max_iters'])
+
+    # the relaxation is only changed on the coarse levels
+    self.assertTrue(0 not in m.fwd_app.nrelax_levels)
+    self.assertEqual(m.fwd_app.nrelax_levels[1],config['nrelax'])
+
+    if MPI.COMM_WORLD.Get_rank()==0:
+      with open(cache_file,'r') as f:
+        self.assertEqual(list(json.load(f).values()),[config])
+
+    # the cached decision is reused
+    m.setMaxLevels(1)
+    self.assertEqual(m.autotune(batches,search_space=search_space,cache_file=cache_file),config)
+    self.assertEqual(m.getFwdMaxLevels(),config['levels'])
+
+    # an impossible tolerance leaves the configuration untouched
+    m.setMaxLevels(1)
+    m.setMaxIters(1)
+    m.setNumRelax(2)
+    m.setFwdNumRelax(3,level=1)
+    self.assertTrue(m.autotune(batches,search_space=search_space,tolerance=-1.0,force=True) is None)
+    self.assertEqual(m.getFwdMaxLevels(),1)
+    self.assertEqual(m.getFwdMaxIters(),1)
+    self.assertEqual(m.fwd_app.getNumRelax(),2)
+    self.assertEqual(m.fwd_app.nrelax_levels,{0 : 2, 1 : 3})
+    self.assertEqual(m.bwd_app.nrelax_levels,{0 : 2})
+
+    # the module still computes after level changes
+    y = m(batches[0])
+    y.backward(torch.ones_like(y))
+
   def copyBuffersToRoot(self,m,device):
     comm     = m.getMPIComm()
     my_rank  = m.getMPIComm().Get_rank()
@@ -0,0 +1,86 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import torch
+import unittest
+
+from torchbraid.mgopt import LazyLoss, resolve_losses
+
+class SerialComm:
+  def Get_size(self):
+    return 1
+
+class FakeRequest:
+  def __init__(self,buf,value):
+    self.buf = buf
+    self.value = value
+
+  def Wait(self):
+    self.buf[0] = self.value
+
+class FakeComm:
+  """ a non-root rank of a two rank communicator, rank 0 holds 'value' """
+  def __init__(self,value):
+    self.value = value
+    self.posted = 0
+
+  def Get_size(self):
+    return 2
+
+  def Get_rank(self):
+    return 1
+
+  def Ibcast(self,buf,root):
+    self.posted += 1
+    return FakeRequest(buf,self.value)
+
+class TestLazyLoss(unittest.TestCase):
+  def test_serial(self):
+    loss = LazyLoss(torch.tensor(2.5,requires_grad=True)*2.0,SerialComm())
+    self.assertEqual(float(loss),5.0)
+    self.assertEqual('{:.1f}'.format(loss),'5.0')
+
+  def test_broadcast(self):
+    # the local tensor is ignored off of rank 0
+    comm = FakeComm(3.0)
+    losses = [LazyLoss(torch.tensor(-1.0),comm) for i in range(3)]
+    self.assertEqual(comm.posted,0)
+
+    values = resolve_losses(losses+[4.0])
+    self.assertEqual(values,[3.0,3.0,3.0,4.0])
+    self.assertEqual(comm.posted,3)
+
+    # values are cached
+    self.assertEqual(str(losses[0]),'3.0')
+    self.assertEqual(comm.posted,3)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,121 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import torch
+import torch.nn as nn
+import unittest
+
+from torchbraid.odenet_apps import ForwardODENetApp
+from torchbraid.utils.level_policy import LevelExecutionPolicy
+from torchbraid.utils.braid_telemetry import BraidTelemetry
+
+ODEBlock = ForwardODENetApp.ODEBlock
+PlainBlock = ForwardODENetApp.PlainBlock
+
+class TestLevelExecutionPolicy(unittest.TestCase):
+  def test_autocast(self):
+    torch.manual_seed(7)
+    block = ODEBlock(nn.Conv2d(3,3,3,padding=1))
+    x = torch.randn(2,3,8,8)
+    with torch.no_grad():
+      exact = block(0.1,x)
+
+    policy = LevelExecutionPolicy(autocast_dtype=torch.bfloat16,channels_last=True)
+
+    # the fine level is unchanged
+    self.assertFalse(policy.applies(0))
+    self.assertIs(policy.getLayer(block,0,residual=True),block)
+
+    # the coarse levels are approximate, but keep the dtype and layout of the state
+    with torch.no_grad():
+      y = policy.getLayer(block,1,residual=True)(0.1,x)
+    self.assertEqual(y.dtype,x.dtype)
+    self.assertTrue(y.is_contiguous())
+    self.assertTrue(torch.allclose(y,exact,atol=5e-2))
+
+  def test_state_precision(self):
+    # only the layer is evaluated in bfloat16, not the residual update of the state
+    torch.manual_seed(9)
+    block = ODEBlock(nn.Linear(4,4))
+    x = 1000.0+torch.randn(3,4)
+
+    policy = LevelExecutionPolicy(autocast_dtype=torch.bfloat16)
+    with torch.no_grad():
+      exact = block.layer(x)
+      y = policy.getLayer(block,1,residual=True)(1e-3,x)
+
+    self.assertEqual(y.dtype,torch.float32)
+    self.assertTrue(torch.allclose(y-x,1e-3*exact,rtol=1e-2,atol=1e-3))
+
+  def test_surrogate(self):
+    built = []
+    def surrogate(layer,level):
+      built.append(level)
+      return nn.Identity()
+
+    policy = LevelExecutionPolicy(surrogate=surrogate,min_level=2)
+    block = ODEBlock(nn.Linear(4,4))
+    x = torch.randn(3,4)
+
+    self.assertIs(policy.getLayer(block,1,residual=True),block)
+    for level in [2,2,3]:
+      with torch.no_grad():
+        y = policy.getLayer(block,level,residual=True)(0.5,x)
+      self.assertTrue(torch.allclose(y,1.5*x))
+
+    # the surrogate is built once per level
+    self.assertEqual(built,[2,3])
+
+    # plain blocks have no residual update
+    plain = PlainBlock(nn.Linear(4,4))
+    self.assertTrue(torch.allclose(policy.getLayer(plain,2,residual=False)(0.5,x),x))
+
+    registered = []
+    policy.clear()
+    policy.getLayer(block,2,True,registered.append)
+    self.assertEqual(len(registered),1)
+
+  def test_telemetry_tag(self):
+    telemetry = BraidTelemetry('forward')
+    policy = LevelExecutionPolicy(autocast_dtype=torch.bfloat16)
+    telemetry.setTag('level_policy',repr(policy))
+    telemetry.beginSolve()
+    telemetry.endSolve(1,[1.0],0.0)
+    telemetry.setTag('level_policy',None)
+    telemetry.beginSolve()
+    telemetry.endSolve(1,[1.0],0.0)
+
+    records = telemetry.getRecords()
+    self.assertEqual(records[0]['tags']['level_policy'],repr(policy))
+    self.assertEqual(records[1]['tags'],{})
+
+if __name__ == '__main__':
+  unittest.main()
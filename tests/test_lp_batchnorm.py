@@ -0,0 +1,98 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import torch
+import torch.nn as nn
+import unittest
+
+from torchbraid.utils import DoneFlag, LPBatchNorm1d, LPBatchNorm2d, LPGroupNorm, LPLayerNorm
+
+class TestLPBatchNorm(unittest.TestCase):
+  def compare(self,lp_bn,bn,x):
+    lp_bn.train()
+    bn.train()
+
+    # done: same as torch batch norm
+    self.assertTrue(torch.allclose(lp_bn(x),bn(x),atol=1e-6))
+    self.assertTrue(torch.allclose(lp_bn.mean,bn.running_mean))
+    self.assertTrue(torch.allclose(lp_bn.var,bn.running_var))
+
+    # not done: batch statistics, running stats untouched
+    DoneFlag.update(lp_bn.done_flag,False)
+    mean = lp_bn.mean.clone()
+    var = lp_bn.var.clone()
+    y = lp_bn(2.0*x+1.0)
+    self.assertTrue(torch.allclose(y,bn(2.0*x+1.0),atol=1e-5))
+    self.assertTrue(torch.equal(lp_bn.mean,mean))
+    self.assertTrue(torch.equal(lp_bn.var,var))
+
+    # eval uses the running statistics
+    DoneFlag.update(lp_bn.done_flag,True)
+    lp_bn.eval()
+    bn.eval()
+    bn.running_mean.copy_(mean)
+    bn.running_var.copy_(var)
+    self.assertTrue(torch.allclose(lp_bn(x),bn(x),atol=1e-6))
+
+  def test_batchnorm(self):
+    torch.manual_seed(3)
+    self.compare(LPBatchNorm1d(4),nn.BatchNorm1d(4),torch.randn(8,4,5))
+    self.compare(LPBatchNorm1d(4),nn.BatchNorm1d(4),torch.randn(8,4))
+    self.compare(LPBatchNorm2d(3),nn.BatchNorm2d(3),torch.randn(6,3,4,4))
+
+  def test_grad(self):
+    torch.manual_seed(4)
+    x = torch.randn(6,3,4,4)
+    lp_bn = LPBatchNorm2d(3)
+    DoneFlag.update(lp_bn.done_flag,False)
+    lp_bn(x).pow(2).sum().backward()
+
+    bn = nn.BatchNorm2d(3)
+    bn(x).pow(2).sum().backward()
+    self.assertTrue(torch.allclose(lp_bn.weight.grad,bn.weight.grad,atol=1e-5))
+    self.assertTrue(torch.allclose(lp_bn.bias.grad,bn.bias.grad,atol=1e-5))
+
+  def test_norms(self):
+    torch.manual_seed(5)
+    x = torch.randn(6,4,3,3)
+    done_flag = DoneFlag.allocate()
+
+    for lp_norm,norm in [(LPGroupNorm(2,4),nn.GroupNorm(2,4)),(LPLayerNorm([4,3,3]),nn.LayerNorm([4,3,3]))]:
+      container = nn.Sequential(lp_norm)
+      DoneFlag.module_register(container,done_flag)
+      self.assertTrue(lp_norm.done_flag is done_flag)
+
+      for state in [True,False]:
+        DoneFlag.update(done_flag,state)
+        self.assertTrue(torch.allclose(lp_norm(x),norm(x),atol=1e-6))
+
+if __name__ == '__main__':
+  unittest.main()
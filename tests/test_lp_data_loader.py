@@ -0,0 +1,104 @@
+#@HEADER
+# ************************************************************************
+#
+#                        Torchbraid v. 0.1
+#
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S.
+# Government retains certain rights in this software.
+#
+# Torchbraid is licensed under 3-clause BSD terms of use:
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name National Technology & Engineering Solutions of Sandia,
+# LLC nor the names of the contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+#
+# ************************************************************************
+#@HEADER
+
+import torch
+import unittest
+
+from torch.utils.data import TensorDataset, Subset
+
+from torchbraid.utils.lp_data_loader import lp_data_loader, dataset_targets, EpochSampler
+
+class FakeComm:
+  def __init__(self,rank):
+    self.rank = rank
+  def Get_rank(self):
+    return self.rank
+
+class LabeledDataset(TensorDataset):
+  def __init__(self,n):
+    super().__init__(torch.rand(n,3),torch.arange(n) % 4)
+    self.targets = self.tensors[1]
+    self.loaded = 0
+
+  def __getitem__(self,i):
+    self.loaded += 1
+    return super().__getitem__(i)
+
+class TestLPDataLoader(unittest.TestCase):
+  def test_consistent_batches(self):
+    dataset = LabeledDataset(23)
+
+    root = lp_data_loader(dataset,FakeComm(0),batch_size=5,seed=3)
+    other = lp_data_loader(dataset,FakeComm(1),batch_size=5,seed=3)
+
+    self.assertEqual(len(root),len(other))
+    self.assertEqual(len(other.dataset),len(dataset))
+
+    for epoch in range(2):
+      root.sampler.set_epoch(epoch)
+      other.sampler.set_epoch(epoch)
+
+      loaded = dataset.loaded
+      other_batches = list(other)
+      self.assertEqual(dataset.loaded,loaded) # no samples read on the other ranks
+
+      for (data,target),(size,other_target) in zip(root,other_batches):
+        self.assertEqual(size.dim(),0)
+        self.assertEqual(size.item(),data.shape[0])
+        self.assertTrue(torch.equal(target,other_target))
+
+  def test_epoch_shuffle(self):
+    sampler = EpochSampler(50,seed=1)
+    first = list(sampler)
+    self.assertEqual(sorted(first),list(range(50)))
+    self.assertEqual(first,list(sampler))
+
+    sampler.set_epoch(1)
+    self.assertNotEqual(first,list(sampler))
+
+    self.assertEqual(list(EpochSampler(5,shuffle=False)),list(range(5)))
+
+  def test_targets(self):
+    dataset = LabeledDataset(10)
+    subset = Subset(dataset,[7,2,5])
+    self.assertTrue(torch.equal(dataset_targets(subset),torch.tensor([3,2,1])))
+
+    other = lp_data_loader(subset,FakeComm(2),batch_size=2,shuffle=False,drop_last=True)
+    batches = list(other)
+    self.assertEqual(len(batches),1)
+    self.assertEqual(len(other),1)
+    self.assertTrue(torch.equal(batches[0][1],torch.tensor([3,2])))
+
+    with self.assertRaises(ValueError):
+      dataset_targets(TensorDataset(torch.rand(3)))
+
+if __name__ == '__main__':
+  unittest.main()
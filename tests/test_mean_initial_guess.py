@@ -42,64 +42,26 @@ class TestMeanInitialGuess(unittest.TestCase):
     class_count = 4
     average_weight = 0.1
 
-    ig_storage = MeanInitialGuessStorage(class_count,average_weight) 
+    ig_storage = MeanInitialGuessStorage(class_count,average_weight,0.1) 
 
     self.assertTrue(ig_storage!=None)
     self.assertTrue(ig_storage.class_count!=None)
     self.assertTrue(ig_storage.average_weight!=None)
     self.assertTrue(ig_storage.state_map!=None)
 
-    ig_storage = MeanInitialGuessStorage(class_count,0.0) 
-    ig_storage = MeanInitialGuessStorage(class_count,1.0) 
+    ig_storage = MeanInitialGuessStorage(class_count,0.0,0.1) 
+    ig_storage = MeanInitialGuessStorage(class_count,1.0,0.1) 
 
     with self.assertRaises(AssertionError) as ctx:
-      ig_storage = MeanInitialGuessStorage(-class_count,average_weight) 
+      ig_storage = MeanInitialGuessStorage(-class_count,average_weight,0.1) 
     with self.assertRaises(AssertionError) as ctx:
-      ig_storage = MeanInitialGuessStorage(0,average_weight) 
+      ig_storage = MeanInitialGuessStorage(0,average_weight,0.1) 
     with self.assertRaises(AssertionError) as ctx:
-      ig_storage = MeanInitialGuessStorage(class_count,-0.1) 
+      ig_storage = MeanInitialGuessStorage(class_count,-0.1,0.1) 
     with self.assertRaises(AssertionError) as ctx:
-      ig_storage = MeanInitialGuessStorage(class_count,1.1) 
-
-  def test__initialize(self):
-    class_count = 4
-    average_weight = 0.1
-    batch_size = 10
-
-    sizes = lambda batch_size: [(batch_size,4,9),
-                                (batch_size,3,7),
-                                (batch_size,9,2,2)]
-
-    # FIRST BLOCK OF TESTS: Look at shape of output tensor
-
-    # test the single tensor case
-    ########################################################
-    size = sizes(batch_size)[0]
-
-    classes = torch.randint(0,class_count, (batch_size,))
-    state   = torch.zeros(size)
-
-    ig_storage = MeanInitialGuessStorage(class_count,average_weight) 
-    result = ig_storage._initialize(state,classes,average_weight)
-
-    self.assertTrue(len(result)==1)
-    
-    self.assertTrue(sizes(class_count)[0]==result[0].shape)
-    self.assertTrue(torch.norm(result[0]).item()==0.0)
-
-    # test the multi-tensor case
-    ########################################################
-    classes = torch.randint(0,class_count, (batch_size,))
-    state   = tuple([torch.zeros(s) for s in sizes(batch_size)])
-
-    ig_storage = MeanInitialGuessStorage(class_count,average_weight) 
-    result = ig_storage._initialize(state,classes,average_weight)
-
-    self.assertTrue(len(result)==len(state))
-    
-    for s,nstate,ostate in zip(sizes(class_count),result,state):
-      self.assertTrue(s==nstate.shape)
-      self.assertTrue(torch.norm(nstate).item()==0.0)
+      ig_storage = MeanInitialGuessStorage(class_count,1.1,0.1) 
+    with self.assertRaises(AssertionError) as ctx:
+      ig_storage = MeanInitialGuessStorage(class_count,average_weight,0.0) 
 
   def test__average(self):
     class_count = 2
@@ -115,8 +77,8 @@ class TestMeanInitialGuess(unittest.TestCase):
     classes = [0,1,0,1,1]
     state   = tuple([torch.zeros(s) for s in batch_sizes])
 
-    ig_storage = MeanInitialGuessStorage(class_count,average_weight) 
-    initial = ig_storage._initialize(state,classes,average_weight)
+    ig_storage = MeanInitialGuessStorage(class_count,average_weight,0.1) 
+    initial = tuple([torch.zeros(s) for s in class_sizes])
 
     # put in a nontrivial initial guess
     for i in initial:
@@ -142,8 +104,8 @@ class TestMeanInitialGuess(unittest.TestCase):
     classes = [1,1,1,1,1]
     state   = tuple([torch.zeros(s) for s in batch_sizes])
 
-    ig_storage = MeanInitialGuessStorage(class_count,average_weight) 
-    initial = ig_storage._initialize(state,classes,average_weight)
+    ig_storage = MeanInitialGuessStorage(class_count,average_weight,0.1) 
+    initial = tuple([torch.zeros(s) for s in class_sizes])
 
     # put in a nontrivial initial guess
     for i in initial:
@@ -193,7 +155,7 @@ class TestMeanInitialGuess(unittest.TestCase):
     class_0_val = ((1.+3.)/2.)
     class_1_val = ((2.+4.+5.)/3.)
 
-    ig_storage = MeanInitialGuessStorage(class_count,average_weight) 
+    ig_storage = MeanInitialGuessStorage(class_count,average_weight,0.1) 
 
     # check add state on the initial pass
     ##########################################
@@ -234,9 +196,73 @@ class TestMeanInitialGuess(unittest.TestCase):
     # check the time stamps
     ##########################################
 
+    self.assertEqual(sorted(ig_storage.getTimeIndices()),[1,9])
     stamps = ig_storage.getTimeStamps()
     self.assertEqual(len(stamps),2)
-    self.assertEqual(sorted(stamps),[0.1,0.9])
+    for s,t in zip(sorted(stamps),[0.1,0.9]):
+      self.assertAlmostEqual(s,t)
     
+  def test_add_states(self):
+    class_count = 3
+    average_weight = 0.7
+    batch_size = 6
+
+    times = [0.25,0.5,0.75]
+    classes = torch.tensor([2,0,2,1,0,2])
+
+    states = [(torch.rand(batch_size,3,2),torch.rand(batch_size,4)) for t in times]
+
+    batched = MeanInitialGuessStorage(class_count,average_weight,0.25) 
+    looped  = MeanInitialGuessStorage(class_count,average_weight,0.25) 
+
+    # two passes, so the second averages with the first
+    for i in range(2):
+      batched.addStates(times,states,classes)
+      for t,s in zip(times,states):
+        looped.addState(t,s,classes)
+
+    self.assertEqual(sorted(batched.getTimeStamps()),times)
+    self.assertEqual(sorted(batched.getTimeIndices()),[1,2,3])
+    self.assertEqual(batched.states[0].shape[1:],(class_count,3,2))
+
+    for t in times:
+      for b,l in zip(batched.getState(t,classes),looped.getState(t,classes)):
+        self.assertTrue(torch.allclose(b,l))
+
+    # the result is a copy
+    result = batched.getState(times[0],classes)
+    result[0][:] = 0.0
+    self.assertTrue(torch.norm(batched.getState(times[0],classes)[0]).item()>0.0)
+
+  def test_time_index(self):
+    dt = 0.1
+    average_weight = 0.5
+
+    # the times of the steps, accumulated with round off, and computed directly
+    accumulated = [0.0]
+    for i in range(7):
+      accumulated += [accumulated[-1]+dt]
+    direct = [i*dt for i in range(8)]
+    self.assertNotEqual(accumulated[6],direct[6])
+
+    classes = [0,1,0,2]
+    state = torch.tensor([1.,2.,5.,4.]).view(4,1)
+
+    ig_storage = MeanInitialGuessStorage(3,average_weight,dt) 
+    ig_storage.addStates(accumulated,[(i+1)*state for i in range(8)],classes)
+    ig_storage.addStates(direct,[(i+1)*state for i in range(8)],classes)
+
+    # both passes are averaged into the same rows
+    self.assertEqual(sorted(ig_storage.getTimeIndices()),list(range(8)))
+
+    # class means by hand: (1+5)/2, 2 and 4
+    means = [3.,2.,4.]
+    for i,(a,d) in enumerate(zip(accumulated,direct)):
+      expected = [(1.0-average_weight)*average_weight*(i+1)*m+average_weight*(i+1)*m for m in means]
+      for t in [a,d]:
+        result = ig_storage.getState(t,[0,1,2])[0]
+        for r,e in zip(result.flatten(),expected):
+          self.assertAlmostEqual(r.item(),e,places=6)
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,108 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import os
+import tempfile
+import torch
+import torch.nn as nn
+import unittest
+
+from mpi4py import MPI
+from torchbraid.mgopt import mgopt_solver, checkpoint_filename, get_rng_state, set_rng_state, \
+                             load_model_optim_state
+
+def build_solver(seed):
+  torch.manual_seed(seed)
+  solver = mgopt_solver()
+  solver.ni_steps = [2,4]
+  solver.ni_rfactor = 2
+  solver.preserve_optim = True
+  solver.zero_init_guess = False
+  solver.flat_params = False
+  for k in range(2):
+    level = mgopt_solver.level()
+    level.model = nn.Linear(3,2)
+    level.optimizer = torch.optim.SGD(level.model.parameters(),lr=0.1,momentum=0.9)
+    level.network = ('Factory',{'steps' : 4 // 2**k})
+    level.out_ls_step = [0.5*k]
+
+    # take a step, so that the optimizer has a momentum buffer
+    level.model(torch.ones(4,3)).sum().backward()
+    level.optimizer.step()
+    solver.levels.append(level)
+  return solver
+
+class TestCheckpoint(unittest.TestCase):
+  def test_save_load(self):
+    solver = build_solver(3)
+    other = build_solver(5)
+    cursor = {'phase' : 'mgopt', 'level' : 0, 'epoch' : 2, 'batch' : 7, 'rng_state' : get_rng_state()}
+
+    with tempfile.TemporaryDirectory() as tmp:
+      path = os.path.join(tmp,'ckpt')
+      solver.save_checkpoint(path,cursor,losses=[1.0,0.5])
+      self.assertTrue(os.path.exists(checkpoint_filename(path,MPI.COMM_WORLD.Get_rank())))
+      state = other.load_checkpoint(path)
+
+    self.assertEqual(state['cursor']['batch'],7)
+    self.assertEqual(state['losses'],[1.0,0.5])
+    self.assertEqual(state['levels'][1]['network'],('Factory',{'steps' : 2}))
+    self.assertEqual(state['levels'][1]['out_ls_step'],[0.5])
+
+    for level,level_state in zip(other.levels,state['levels']):
+      load_model_optim_state(level_state,level.model,level.optimizer)
+    for ref,level in zip(solver.levels,other.levels):
+      for p,q in zip(ref.model.parameters(),level.model.parameters()):
+        self.assertTrue(torch.equal(p,q))
+        self.assertTrue(torch.equal(ref.optimizer.state[p]['momentum_buffer'],
+                                    level.optimizer.state[q]['momentum_buffer']))
+
+  def test_batch_checkpoint(self):
+    solver = build_solver(3)
+    self.assertTrue(solver.batch_checkpoint(None,2,10,{}) is None)
+    self.assertTrue(solver.batch_checkpoint('ckpt',0,10,{}) is None)
+
+    written = []
+    solver.save_checkpoint = lambda path,cursor,active=None,losses=None: written.append(cursor['batch'])
+    callback = solver.batch_checkpoint('ckpt',3,9,{'batch' : 0})
+    for batch_idx in range(9):
+      callback(batch_idx)
+    # the last batch is left to the end-of-epoch checkpoint
+    self.assertEqual(written,[3,6])
+
+  def test_rng_state(self):
+    state = get_rng_state()
+    first = torch.randperm(20)
+    set_rng_state(state)
+    self.assertTrue(torch.equal(first,torch.randperm(20)))
+
+if __name__ == '__main__':
+  unittest.main()
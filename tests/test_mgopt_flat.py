@@ -0,0 +1,116 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import torch
+import torch.nn as nn
+import unittest
+
+from torchbraid.mgopt import FlatParameters, flatten_params, flat_view, get_params, write_params_inplace, \
+                             tensor_list_dot, tensor_list_AXPY, tensor_list_deep_copy
+
+class SerialComm:
+  def Get_size(self):
+    return 1
+
+def build_model():
+  torch.manual_seed(7)
+  return nn.Sequential(nn.Linear(4,3),nn.ReLU(),nn.Linear(3,2))
+
+class TestFlatParameters(unittest.TestCase):
+  def test_views(self):
+    model = build_model()
+    ref = [p.detach().clone() for p in model.parameters()]
+
+    flat = flatten_params(model)
+    self.assertTrue(model.mgopt_flat_params is flat)
+    self.assertEqual(flat.data.numel(),sum(r.numel() for r in ref))
+    for p,r in zip(model.parameters(),ref):
+      self.assertTrue(torch.equal(p,r))
+
+    x_h = get_params(model)
+    self.assertTrue(flat_view(x_h) is not None)
+    with torch.no_grad():
+      self.assertTrue(torch.equal(flat_view(x_h),flat.data))
+
+    # gradients replaced by autograd are copied back to the flat buffer
+    model.zero_grad(set_to_none=True)
+    model(torch.ones(5,4)).sum().backward()
+    grads = [p.grad.clone() for p in model.parameters()]
+    g_h = get_params(model,grad=True)
+    with torch.no_grad():
+      self.assertTrue(torch.equal(flat_view(g_h),torch.cat([g.flatten() for g in grads])))
+
+  def test_algebra(self):
+    comm = SerialComm()
+    model = build_model()
+    ref_x = [p.detach().clone() for p in model.parameters()]
+    flatten_params(model)
+
+    with torch.no_grad():
+      x_h = get_params(model)
+      y_h = tensor_list_deep_copy(x_h)
+      self.assertTrue(flat_view(y_h) is not None)
+
+      self.assertTrue(torch.allclose(tensor_list_dot(x_h,y_h,comm),tensor_list_dot(ref_x,ref_x,comm)))
+
+      z_h = tensor_list_AXPY(2.0,x_h,-1.0,y_h)
+      for z,r in zip(z_h,ref_x):
+        self.assertTrue(torch.allclose(z,r))
+
+      tensor_list_AXPY(0.5,y_h,1.0,x_h,inplace=True)
+      for p,r in zip(model.parameters(),ref_x):
+        self.assertTrue(torch.allclose(p,1.5*r))
+
+      write_params_inplace(model,ref_x)
+      for p,r in zip(model.parameters(),ref_x):
+        self.assertTrue(torch.equal(p,r))
+
+    # with autograd active the dot product keeps the tape
+    dot = tensor_list_dot(ref_x,get_params(model),comm)
+    dot.backward()
+    for p,r in zip(model.parameters(),ref_x):
+      self.assertTrue(torch.allclose(p.grad,r))
+
+  def test_save_restore(self):
+    model = build_model()
+    flat = FlatParameters(model)
+    ref = flat.data.clone()
+
+    flat.save()
+    with torch.no_grad():
+      for p in model.parameters():
+        p.add_(1.0)
+    self.assertFalse(torch.equal(flat.data,ref))
+    flat.restore()
+    self.assertTrue(torch.equal(flat.data,ref))
+
+if __name__ == '__main__':
+  unittest.main()
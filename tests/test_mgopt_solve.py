@@ -0,0 +1,249 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+
+import os
+import shutil
+import tempfile
+import torch
+import torch.nn as nn
+import unittest
+import numpy as np
+
+import torchbraid
+
+from torch.utils.data import TensorDataset, DataLoader
+from mpi4py import MPI
+from torchbraid.mgopt import mgopt_solver
+
+class OpenLayer(nn.Module):
+  def __init__(self,width):
+    super(OpenLayer, self).__init__()
+    self.fc = nn.Linear(2,width)
+
+  def forward(self,x):
+    return torch.tanh(self.fc(x))
+
+class CloseLayer(nn.Module):
+  def __init__(self,width):
+    super(CloseLayer, self).__init__()
+    self.fc = nn.Linear(width,1,bias=False)
+
+  def forward(self,x):
+    return self.fc(x)
+
+class StepLayer(nn.Module):
+  def __init__(self,width):
+    super(StepLayer, self).__init__()
+    self.lin = nn.Linear(width,width)
+
+  def forward(self,x):
+    return torch.tanh(self.lin(x))
+
+class ParallelNet(nn.Module):
+  def __init__(self,steps,width=4):
+    super(ParallelNet, self).__init__()
+    self.parallel_nn = torchbraid.LayerParallel(MPI.COMM_WORLD,lambda: StepLayer(width),steps,Tf=1.0,
+                                                max_fwd_levels=2,max_bwd_levels=2,max_iters=20)
+    self.parallel_nn.setPrintLevel(0,True)
+    self.parallel_nn.setPrintLevel(0,False)
+    self.parallel_nn.setFwdCFactor(2)
+    self.parallel_nn.setBwdCFactor(2)
+
+    compose = self.compose = self.parallel_nn.comp_op()
+    self.open_nn = compose(OpenLayer,width)
+    self.close_nn = compose(CloseLayer,width)
+
+  def forward(self,x):
+    x = self.compose(self.open_nn,x)
+    x = self.parallel_nn(x)
+    return self.compose(self.close_nn,x)
+
+def build_loaders():
+  generator = torch.Generator().manual_seed(3)
+  x = 2.0*torch.rand(24,2,generator=generator)-1.0
+  y = torch.sin(3.0*x[:,:1])*x[:,1:]
+  dataset = TensorDataset(x,y)
+  return DataLoader(dataset,batch_size=4,shuffle=True),DataLoader(dataset,batch_size=12,shuffle=False)
+
+class Interrupted(Exception):
+  pass
+
+class InterruptedLoader:
+  """
+  Wraps a data loader and raises Interrupted once stop batches were drawn,
+  mimicking a job killed in the middle of an epoch.
+  """
+  def __init__(self,loader,stop):
+    self.loader = loader
+    self.dataset = loader.dataset
+    self.stop = stop
+    self.count = 0
+
+  def __len__(self):
+    return len(self.loader)
+
+  def __iter__(self):
+    for batch in self.loader:
+      if self.count==self.stop:
+        raise Interrupted()
+      self.count += 1
+      yield batch
+# end InterruptedLoader
+
+def checkpoint_dir():
+  """ A temporary directory shared by all ranks """
+  comm = MPI.COMM_WORLD
+  path = tempfile.mkdtemp() if comm.Get_rank()==0 else None
+  return comm.bcast(path,root=0)
+
+def remove_dir(path):
+  comm = MPI.COMM_WORLD
+  comm.Barrier()
+  if comm.Get_rank()==0:
+    shutil.rmtree(path)
+
+def build_solver(ni_epochs=1,interrupt=None,**kwargs):
+  """
+  A two level MG/Opt hierarchy trained by nested iteration.  If interrupt
+  is set, nested iteration raises Interrupted after that many batches.
+  """
+  # coarse to fine steps, and the networks from fine to coarse
+  procs = MPI.COMM_WORLD.Get_size()
+  ni_steps = np.array([2*procs,4*procs])
+  networks = [('Factory',{'steps' : int(s)}) for s in reversed(ni_steps)]
+
+  torch.manual_seed(11)
+  train_loader,test_loader = build_loaders()
+  ni_loader = train_loader if interrupt is None else InterruptedLoader(train_loader,interrupt)
+  solver = mgopt_solver()
+  solver.initialize_with_nested_iteration(lambda level,**args: ParallelNet(**args),
+                                          ni_steps,ni_loader,test_loader,networks,
+                                          epochs=ni_epochs,mgopt_printlevel=0,
+                                          optims=('pytorch_adam',{'lr' : 0.01}),
+                                          criterions='tb_mgopt_regression',seed=5,**kwargs)
+  return solver,train_loader,test_loader
+
+def mgopt_options(**kwargs):
+  options = dict(epochs=1,mgopt_printlevel=0,mgopt_iter=1,nrelax_pre=1,nrelax_post=1,nrelax_coarse=2,
+                 line_search=('tb_simple_ls',{'ls_params' : {'alphas' : [0.5,1.0]}}))
+  options.update(kwargs)
+  return options
+
+def get_parameters(solver):
+  return [p.detach().clone() for level in solver.levels for p in level.model.parameters()]
+
+class TestMGOptSolve(unittest.TestCase):
+  def test_release_inactive(self):
+    losses = dict()
+    params = dict()
+    for release in [False,True]:
+      solver,train_loader,test_loader = build_solver()
+      torch.manual_seed(13)
+      losses[release] = solver.mgopt_solve(train_loader,test_loader,release_inactive=release,**mgopt_options())
+      params[release] = get_parameters(solver)
+
+      report = solver.resource_report(mgopt_printlevel=0)
+      if MPI.COMM_WORLD.Get_rank()==0:
+        if release:
+          # the coarse level is released after each cycle
+          self.assertEqual(report[1]['states'],0)
+        else:
+          self.assertGreater(report[1]['states'],0)
+
+    # the released levels restart from the initial guess, the converged
+    # layer-parallel solves make that difference negligible
+    self.assertEqual(len(losses[False]),len(losses[True]))
+    for a,b in zip(losses[False],losses[True]):
+      self.assertAlmostEqual(a,b,places=5)
+    for a,b in zip(params[False],params[True]):
+      self.assertTrue(torch.allclose(a,b,atol=1e-5))
+
+  def assertParamsEqual(self,params,ref_params):
+    # the resumed layer-parallel solves start from the initial guess rather
+    # than the stored states, the converged solves make that negligible
+    self.assertEqual(len(params),len(ref_params))
+    for a,b in zip(params,ref_params):
+      self.assertTrue(torch.allclose(a,b,atol=1e-5))
+
+  def test_resume_nested_iteration(self):
+    ref_solver,_,_ = build_solver()
+    ref_params = get_parameters(ref_solver)
+
+    path = checkpoint_dir()
+    prefix = os.path.join(path,'ni')
+
+    # 6 batches per epoch: the coarse level takes 6 batches, the fine level
+    # one for allocating braid and 3 more, and the checkpoint is written after 
+    # the second batch of the fine level
+    with self.assertRaises(Interrupted):
+      build_solver(interrupt=10,checkpoint=prefix,checkpoint_interval=2)
+
+    state = mgopt_solver().load_checkpoint(prefix)
+    self.assertEqual(state['cursor']['phase'],'nested_iteration')
+    self.assertEqual(state['cursor']['level'],1)
+    self.assertEqual(state['cursor']['batch'],2)
+
+    solver,_,_ = build_solver(checkpoint=prefix,checkpoint_interval=2,restart=prefix)
+    self.assertParamsEqual(get_parameters(solver),ref_params)
+
+    remove_dir(path)
+
+  def test_resume_mgopt(self):
+    ref_solver,train_loader,test_loader = build_solver()
+    torch.manual_seed(13)
+    ref_losses = ref_solver.mgopt_solve(train_loader,test_loader,**mgopt_options())
+    ref_params = get_parameters(ref_solver)
+
+    path = checkpoint_dir()
+    prefix = os.path.join(path,'mgopt')
+
+    # interrupted after the third batch, the checkpoint is of the second
+    solver,train_loader,test_loader = build_solver()
+    torch.manual_seed(13)
+    with self.assertRaises(Interrupted):
+      solver.mgopt_solve(InterruptedLoader(train_loader,3),test_loader,
+                         checkpoint=prefix,checkpoint_interval=2,**mgopt_options())
+
+    state = solver.load_checkpoint(prefix)
+    self.assertEqual(state['cursor']['phase'],'mgopt')
+    self.assertEqual(state['cursor']['batch'],2)
+
+    solver,train_loader,test_loader = build_solver()
+    losses = solver.mgopt_solve(train_loader,test_loader,restart=prefix,**mgopt_options())
+    self.assertParamsEqual(get_parameters(solver),ref_params)
+
+    self.assertEqual(len(losses),len(ref_losses))
+    for a,b in zip(losses,ref_losses):
+      self.assertAlmostEqual(a,b,places=5)
+
+    remove_dir(path)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,117 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import torch
+import torch.nn as nn
+import unittest
+
+from torchbraid.utils.spatial import AvgPoolBilinear, InjectionNearest, ChannelProjection, SpatialAdaptor
+
+class TestSpatialPairs(unittest.TestCase):
+  def test_shapes(self):
+    pair = AvgPoolBilinear(factor=2,min_size=4)
+    self.assertEqual(pair.levelShape((5,3,16,16),0),torch.Size((5,3,16,16)))
+    self.assertEqual(pair.levelShape((5,3,16,16),1),torch.Size((5,3,8,8)))
+    self.assertEqual(pair.levelShape((5,3,16,16),2),torch.Size((5,3,4,4)))
+    # stops at the minimum size
+    self.assertEqual(pair.levelShape((5,3,16,16),3),torch.Size((5,3,4,4)))
+    # odd sizes are not coarsened
+    self.assertEqual(pair.levelShape((5,3,9,16),1),torch.Size((5,3,9,16)))
+
+    # 8x8 features stay 8x8 with min_size 8, but 16x16 features coarsen to 8x8
+    pair = InjectionNearest(factor=2,min_size=8)
+    pair.levelShape((1,3,8,8),1)
+    with self.assertRaises(ValueError):
+      pair.levelShape((1,3,16,16),1)
+
+  def test_min_size_levels(self):
+    # the features stop coarsening at the minimum size, deeper levels are not ambiguous
+    torch.manual_seed(4)
+    pair = AvgPoolBilinear(factor=2,min_size=4)
+    self.assertEqual(pair.levelShape((2,3,8,8),3),torch.Size((2,3,4,4)))
+
+    x = torch.randn(2,3,8,8)
+    coarse = [x]
+    for l in range(3):
+      coarse += [pair.coarsen(coarse[-1],l)]
+    self.assertEqual([tuple(c.shape) for c in coarse],[(2,3,8,8),(2,3,4,4),(2,3,4,4),(2,3,4,4)])
+
+    # refining from level 3 to 1 is the identity, then back to the fine shape
+    y = coarse[-1]
+    for l in [2,1]:
+      y = pair.refine(y,l)
+      self.assertTrue(torch.equal(y,coarse[-1]))
+    self.assertEqual(pair.refine(y,0).shape,x.shape)
+
+  def test_coarsen_refine(self):
+    torch.manual_seed(3)
+    x = torch.randn(2,4,8,8)
+    for pair in [AvgPoolBilinear(),InjectionNearest(),ChannelProjection()]:
+      c = pair.coarsen(x,0)
+      self.assertEqual(c.shape,pair.levelShape(x.shape,1))
+      f = pair.refine(c,0)
+      self.assertEqual(f.shape,x.shape)
+
+    # injection of nearest interpolation is the identity, as is averaging duplicated channels
+    for pair in [InjectionNearest(),ChannelProjection()]:
+      c = pair.coarsen(x,0)
+      self.assertTrue(torch.allclose(pair.coarsen(pair.refine(c,0),0),c))
+
+    pair = ChannelProjection(factor=2)
+    c = pair.coarsen(x,0)
+    self.assertTrue(torch.allclose(c[:,1],0.5*(x[:,2]+x[:,3])))
+
+    # unpacks to the pair of callables expected by LayerParallel
+    coarsen,refine = pair
+    self.assertTrue(torch.equal(coarsen(x,0),c))
+
+  def test_adaptor(self):
+    torch.manual_seed(5)
+    pair = ChannelProjection(factor=2)
+    conv = nn.Conv2d(4,4,3,padding=1)
+    layer = SpatialAdaptor(conv,pair,mode='galerkin')
+
+    x = torch.randn(2,4,8,8)
+    self.assertTrue(torch.equal(layer(x),conv(x)))
+
+    c = pair.coarsen(x,0)
+    layer.level_flag.fill_(1)
+    self.assertTrue(torch.allclose(layer(c),pair.coarsen(conv(pair.refine(c,0)),0)))
+
+    # convolutions run directly on the coarse features of a spatial pair
+    pair = AvgPoolBilinear()
+    layer = SpatialAdaptor(conv,pair,mode='direct')
+    layer.level_flag.fill_(1)
+    c = pair.coarsen(x,0)
+    self.assertTrue(torch.equal(layer(c),conv(c)))
+
+if __name__ == '__main__':
+  unittest.main()
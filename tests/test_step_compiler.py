@@ -0,0 +1,137 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import torch
+import torch.nn as nn
+import unittest
+
+from torchbraid.odenet_apps import ForwardODENetApp
+from torchbraid.utils.step_compiler import StepCompiler
+
+class LevelScale(nn.Module):
+  """Scales by the level, checks the compiled step sees the shared level flag."""
+  def __init__(self):
+    super().__init__()
+    self.linear = nn.Linear(4,4)
+    self.level_flag = torch.tensor(0)
+
+  def forward(self,x):
+    return self.level_flag*self.linear(x)
+
+def build(functor,count=3,backend='eager'):
+  layers = ForwardODENetApp.LayersDataStructure([(count,functor)])
+  layers.setCompiler(StepCompiler(backend=backend))
+  return layers,[layers.buildLayer(i,'cpu') for i in range(count)]
+
+# torch.compile and torch.func are only available from PyTorch 2.0
+@unittest.skipUnless(hasattr(torch,'compile'),'torch.compile is not available')
+class TestStepCompiler(unittest.TestCase):
+  def test_shared_graph(self):
+    torch.manual_seed(11)
+    layers,blocks = build(lambda: nn.Linear(4,4))
+    compiler = layers.compiler
+
+    for batch in [5,7]:
+      x = torch.randn(batch,4)
+      with torch.no_grad():
+        for b in blocks:
+          self.assertTrue(isinstance(b,ForwardODENetApp.ODEBlock))
+          self.assertTrue(torch.allclose(layers.evalLayer(b,0,0.25,x),b(0.25,x)))
+
+    # one graph for the functor and level, the batch size can change
+    self.assertEqual(len(compiler.graphs),1)
+    self.assertEqual(len(compiler.failures),0)
+
+    # layers that are not built by the functors are evaluated eagerly
+    other = ForwardODENetApp.ODEBlock(nn.Linear(4,4))
+    with torch.no_grad():
+      self.assertTrue(torch.allclose(layers.evalLayer(other,0,0.25,x),other(0.25,x)))
+    self.assertEqual(len(compiler.graphs),1)
+
+  def test_level_flag(self):
+    torch.manual_seed(12)
+    layers,blocks = build(LevelScale)
+    x = torch.randn(5,4)
+
+    # the compiled step reads the flag shared by the data structure, not a copy
+    for level in [1,2]:
+      layers.updateLayerLevel(level)
+      with torch.no_grad():
+        y = layers.evalLayer(blocks[0],0,0.5,x)
+        self.assertTrue(torch.allclose(y,x+0.5*level*blocks[0].layer.linear(x)))
+
+  def test_grad_graph(self):
+    torch.manual_seed(13)
+    layers,blocks = build(lambda: nn.Linear(4,4),count=2)
+    block = blocks[0]
+    x = torch.randn(5,4,requires_grad=True)
+
+    y = layers.evalLayer(block,0,0.5,x)
+    y.sum().backward()
+
+    x_ref = x.detach().clone().requires_grad_(True)
+    block_ref = ForwardODENetApp.ODEBlock(nn.Linear(4,4))
+    block_ref.load_state_dict(block.state_dict())
+    block_ref(0.5,x_ref).sum().backward()
+
+    self.assertTrue(torch.allclose(x.grad,x_ref.grad))
+    self.assertTrue(torch.allclose(block.layer.weight.grad,block_ref.layer.weight.grad))
+
+    # the steps without gradients have their own graph
+    with torch.no_grad():
+      layers.evalLayer(block,0,0.5,x)
+    self.assertEqual(len(layers.compiler.graphs),2)
+
+  def test_fallback(self):
+    torch.manual_seed(17)
+    layers,blocks = build(lambda: nn.Linear(4,4),count=2,backend='not_a_backend')
+    x = torch.randn(5,4)
+
+    with torch.no_grad():
+      for _ in range(2):
+        self.assertTrue(torch.allclose(layers.evalLayer(blocks[0],1,0.5,x),blocks[0](0.5,x)))
+
+    self.assertEqual(len(layers.compiler.failures),1)
+
+  def test_recompile_limit(self):
+    # the limit is only raised while the compiled steps run
+    config = torch._dynamo.config
+    name = 'recompile_limit' if hasattr(config,'recompile_limit') else 'cache_size_limit'
+    before = getattr(config,name)
+
+    compiler = StepCompiler(backend='eager',max_graphs=before+10)
+    self.assertEqual(getattr(config,name),before)
+    with compiler.limitContext():
+      self.assertEqual(getattr(config,name),before+10)
+    self.assertEqual(getattr(config,name),before)
+
+if __name__ == '__main__':
+  unittest.main()
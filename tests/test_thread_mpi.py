@@ -0,0 +1,230 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import torch
+import torch.nn as nn
+import unittest
+import numpy as np
+
+from torchbraid.utils import MPITensorComm
+from torchbraid.utils.thread_mpi import MPI, run
+from torchbraid.transfer_plan import TransferPlan
+
+class TestThreadMPI(unittest.TestCase):
+  def test_rank_size(self):
+    results = run(3,lambda comm: (comm.Get_rank(),comm.Get_size()))
+    self.assertEqual(results,[(0,3),(1,3),(2,3)])
+
+  def test_point_to_point(self):
+    def main(comm):
+      rank = comm.Get_rank()
+      size = comm.Get_size()
+
+      # ring exchange of tensors
+      send = rank*torch.ones(4)
+      recv = torch.zeros(4)
+      requests = [comm.Irecv(recv,source=(rank-1)%size,tag=7),
+                  comm.Isend(send,dest=(rank+1)%size,tag=7)]
+      MPI.Request.Waitall(requests)
+
+      # objects
+      if rank==0:
+        comm.send({'a' : 1},dest=1,tag=3)
+        obj = None
+      elif rank==1:
+        obj = comm.recv(source=0,tag=3)
+      else:
+        obj = None
+
+      return recv.tolist(),obj
+
+    results = run(3,main)
+    self.assertEqual(results[0][0],4*[2.0])
+    self.assertEqual(results[1][0],4*[0.0])
+    self.assertEqual(results[2][0],4*[1.0])
+    self.assertEqual(results[1][1],{'a' : 1})
+
+  def test_send_first(self):
+    def main(comm):
+      rank = comm.Get_rank()
+      size = comm.Get_size()
+
+      # every send is posted before the receives, the data is not copied until matched
+      send = rank*torch.ones(3)
+      recv = torch.zeros(3)
+      requests = [comm.Isend(send,dest=(rank+1)%size,tag=5),
+                  comm.Irecv(recv,source=(rank-1)%size,tag=5)]
+      MPI.Request.Waitall(requests)
+      send.fill_(-1.0)
+
+      # Test completes the receive once the message arrives
+      buf = np.zeros(2)
+      request = comm.Irecv(buf,source=(rank-1)%size,tag=6)
+      comm.Send(np.full(2,float(rank)),dest=(rank+1)%size,tag=6)
+      while not request.Test():
+        pass
+
+      return recv.tolist(),buf.tolist()
+
+    results = run(3,main)
+    self.assertEqual(results[0],(3*[2.0],2*[2.0]))
+    self.assertEqual(results[1],(3*[0.0],2*[0.0]))
+    self.assertEqual(results[2],(3*[1.0],2*[1.0]))
+
+  def test_collectives(self):
+    def main(comm):
+      rank = comm.Get_rank()
+
+      root = comm.bcast('hello' if rank==1 else None,root=1)
+      gathered = comm.gather(rank,root=0)
+      total = comm.allreduce(rank,op=MPI.SUM)
+      largest = comm.allreduce(rank,op=MPI.MAX)
+
+      buf = (rank+1.0)*torch.ones(3)
+      comm.Allreduce(MPI.IN_PLACE,buf,op=MPI.SUM)
+
+      arr = np.array([float(rank)])
+      out = np.zeros(1)
+      comm.Reduce(arr,[out,None],op=MPI.SUM,root=0)
+
+      comm.Barrier()
+      return root,gathered,total,largest,buf.tolist(),out[0]
+
+    results = run(4,main)
+    for rank,(root,gathered,total,largest,buf,out) in enumerate(results):
+      self.assertEqual(root,'hello')
+      self.assertEqual(gathered,[0,1,2,3] if rank==0 else None)
+      self.assertEqual(total,6)
+      self.assertEqual(largest,3)
+      self.assertEqual(buf,3*[10.0])
+      self.assertEqual(out,6.0 if rank==0 else 0.0)
+
+  def test_split(self):
+    def main(comm):
+      rank = comm.Get_rank()
+      sub = comm.Split(rank % 2,rank)
+      total = sub.allreduce(rank)
+
+      # point to point inside the sub communicator
+      if sub.Get_rank()==0:
+        sub.send(rank,dest=1)
+        first = rank
+      else:
+        first = sub.recv(source=0) if sub.Get_rank()==1 else None
+
+      return sub.Get_rank(),sub.Get_size(),total,first
+
+    results = run(4,main)
+    self.assertEqual(results[0],(0,2,2,0))
+    self.assertEqual(results[1],(0,2,4,1))
+    self.assertEqual(results[2],(1,2,2,0))
+    self.assertEqual(results[3],(1,2,4,1))
+
+  def test_error(self):
+    def main(comm):
+      if comm.Get_rank()==1:
+        raise RuntimeError('failed')
+      # this would wait forever without the abort
+      comm.recv(source=1)
+
+    with self.assertRaises(RuntimeError):
+      run(2,main)
+
+  def test_error_split(self):
+    def main(comm):
+      sub = comm.Split(comm.Get_rank() % 2,comm.Get_rank())
+      if comm.Get_rank()==1:
+        raise RuntimeError('failed')
+      # rank 3 shares only the sub communicator with the failing rank
+      sub.Barrier()
+
+    with self.assertRaises(RuntimeError):
+      run(4,main)
+
+  def test_persistent(self):
+    def main(comm):
+      rank = comm.Get_rank()
+      size = comm.Get_size()
+
+      send = torch.zeros(2)
+      recv = torch.zeros(2)
+      requests = [comm.Recv_init(recv,source=(rank-1)%size,tag=2),
+                  comm.Send_init(send,dest=(rank+1)%size,tag=2)]
+      received = []
+      for i in range(3):
+        send.fill_(10.0*i+rank)
+        for r in requests:
+          r.Start()
+        MPI.Request.Waitall(requests)
+        received += [recv.tolist()]
+      return received
+
+    results = run(3,main)
+    for rank,received in enumerate(results):
+      self.assertEqual(received,[2*[10.0*i+(rank-1)%3] for i in range(3)])
+
+  def test_tensor_comm(self):
+    def main(comm):
+      tcomm = MPITensorComm(comm)
+      rank = tcomm.Get_rank()
+      size = tcomm.Get_size()
+
+      value = torch.tensor([rank+1.0])
+      tcomm.allreduce(value)
+
+      root = torch.full((2,),float(rank))
+      tcomm.bcast(root,root=1)
+
+      # each rank sends its layer to the next one, as in an MG/Opt transfer
+      torch.manual_seed(rank)
+      local = nn.Linear(3,2)
+      remote = nn.Linear(3,2)
+      plan = TransferPlan(tcomm,[((rank+1)%size,[local])],[((rank-1)%size,[remote])])
+      first = plan.execute()
+      with torch.no_grad():
+        for p in local.parameters():
+          p.mul_(2.0)
+      second = plan.execute()
+
+      return value.item(),root.tolist(),[p.detach() for p in local.parameters()],first,second
+
+    results = run(3,main)
+    for rank,(value,root,_,first,second) in enumerate(results):
+      self.assertEqual(value,6.0)
+      self.assertEqual(root,2*[1.0])
+
+      sender = results[(rank-1)%3][2]
+      for f,s,p in zip(first,second,sender):
+        self.assertTrue(torch.equal(2.0*f,p))
+        self.assertTrue(torch.equal(s,p))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,144 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import torch
+import torch.nn as nn
+import unittest
+
+from torchbraid.utils import TensorComm
+from torchbraid.transfer_plan import TransferPlan
+
+class SelfComm(TensorComm):
+  def Get_rank(self):
+    return 0
+
+  def Get_size(self):
+    return 1
+
+  # a single rank transfers locally, there are no messages
+  def isend(self,tensor,dest,tag=0):
+    raise AssertionError('unexpected send')
+
+  def irecv(self,tensor,source,tag=0):
+    raise AssertionError('unexpected receive')
+
+  def bcast(self,tensor,root=0):
+    pass
+
+  def allreduce(self,tensor):
+    pass
+
+  def barrier(self):
+    pass
+
+def build_layers(n):
+  return [nn.Sequential(nn.Linear(3,4),nn.Linear(4,2)) for _ in range(n)]
+
+class TestTransferPlan(unittest.TestCase):
+  def test_execute(self):
+    torch.manual_seed(11)
+    src = build_layers(3)
+    dst = build_layers(3)
+
+    for l in src:
+      l(torch.ones(5,3)).sum().backward()
+
+    plan = TransferPlan(SelfComm(),[(0,src)],[(0,dst)])
+
+    expect_params = [p for l in src for p in l.parameters()]
+    expect_grads = [p.grad for l in src for p in l.parameters()]
+
+    params = plan.execute()
+    self.assertEqual(len(params),len(expect_params))
+    for p,e in zip(params,expect_params):
+      self.assertTrue(torch.equal(p,e))
+
+    grads = plan.execute(params=False,grads=True)
+    for g,e in zip(grads,expect_grads):
+      self.assertTrue(torch.equal(g,e))
+
+    params,grads = plan.execute(params=True,grads=True)
+    for p,e in zip(params,expect_params):
+      self.assertTrue(torch.equal(p,e))
+    for g,e in zip(grads,expect_grads):
+      self.assertTrue(torch.equal(g,e))
+
+    # the buffers are reused, but each result is a copy
+    with torch.no_grad():
+      for l in src:
+        for p in l.parameters():
+          p.add_(1.0)
+    new_params = plan.execute()
+    for p,n,e in zip(params,new_params,expect_params):
+      self.assertTrue(torch.equal(n,e))
+      self.assertTrue(torch.equal(p+1.0,n))
+
+  def test_duplicate(self):
+    # one source layer sent twice, as in the injection interpolation
+    src = build_layers(1)
+    dst = build_layers(2)
+    plan = TransferPlan(SelfComm(),[(0,[src[0],src[0]])],[(0,dst)])
+
+    params = plan.execute()
+    expect = [p for p in src[0].parameters()]
+    self.assertEqual(len(params),2*len(expect))
+    for p,e in zip(params,expect+expect):
+      self.assertTrue(torch.equal(p,e))
+
+    # one send and one receive buffer, each holding two copies of the layer
+    self.assertEqual(plan.nbytes(),2*2*sum(4*p.numel() for p in expect))
+
+  def test_exchange_optimizer_state(self):
+    torch.manual_seed(13)
+    src = build_layers(2)
+    dst = build_layers(2)
+
+    src_params = [p for l in src for p in l.parameters()]
+    opt = torch.optim.Adam(src_params)
+    for l in src:
+      l(torch.ones(5,3)).sum().backward()
+    opt.step()
+
+    # the state of the first parameter is missing, it is sent as zeros
+    del opt.state[src_params[0]]
+
+    plan = TransferPlan(SelfComm(),[(0,src)],[(0,dst)])
+    getter = lambda key: (lambda p: opt.state[p].get(key,None) if p in opt.state else None)
+    exp_avg,exp_avg_sq = plan.exchange([getter('exp_avg'),getter('exp_avg_sq')])
+
+    self.assertEqual(len(plan.receiving_params()),len(src_params))
+    self.assertTrue(torch.equal(exp_avg[0],torch.zeros_like(src_params[0])))
+    for p,a,a_sq in list(zip(src_params,exp_avg,exp_avg_sq))[1:]:
+      self.assertTrue(torch.equal(a,opt.state[p]['exp_avg']))
+      self.assertTrue(torch.equal(a_sq,opt.state[p]['exp_avg_sq']))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,232 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import unittest
+
+import torchbraid
+
+from torchbraid.utils import getDevice
+from torchbraid.mgopt import tb_parallel_injection_restrict_optim_state, \
+                             tb_parallel_injection_interp_optim_state
+from mpi4py import MPI
+
+class ReLUBlock(nn.Module):
+  def __init__(self,dim=3):
+    super(ReLUBlock, self).__init__()
+    self.lin = nn.Linear(dim,dim)
+
+  def forward(self,x):
+    return F.relu(self.lin(x))
+
+class OpenLayer(nn.Module):
+  def __init__(self,dim=3):
+    super(OpenLayer, self).__init__()
+    self.lin = nn.Linear(dim,dim)
+
+  def forward(self,x):
+    return self.lin(x)
+
+class CloseLayer(OpenLayer):
+  pass
+
+class Net(nn.Module):
+  def __init__(self,num_steps,offset):
+    super(Net, self).__init__()
+    self.open_nn = OpenLayer()
+    self.parallel_nn = torchbraid.LayerParallel(MPI.COMM_WORLD,ReLUBlock,num_steps,Tf=1.0,
+                                                max_fwd_levels=1,max_bwd_levels=1,max_iters=1)
+    self.parallel_nn.setPrintLevel(0)
+    self.close_nn = CloseLayer()
+    self.offset = offset
+    self.setValues(0.0)
+
+  @torch.no_grad()
+  def setValues(self,shift):
+    # every layer has distinct values, so a wrong rank mapping is detected
+    ilower,_ = self.parallel_nn.fwd_app.getStepBounds()
+    for i,layer in enumerate(self.parallel_nn.layer_models):
+      for k,p in enumerate(layer.parameters()):
+        p.copy_(self.offset+100.0*(ilower+i)+k+shift+torch.arange(p.numel()).view(p.shape)/100.0)
+
+  def run(self,x):
+    self.zero_grad()
+    y = self.close_nn(self.parallel_nn(self.open_nn(x)))
+    y.backward(torch.ones_like(y))
+
+def pickled_injection(model_src,model_dst,cf,restrict,grad):
+  """
+  The per-layer pickled exchange used before the transfer plans.
+  """
+  comm = MPI.COMM_WORLD
+  app = model_src.parallel_nn.fwd_app
+  src_app = model_src.parallel_nn.fwd_app
+  dst_app = model_dst.parallel_nn.fwd_app
+  src_ilower,_ = src_app.getStepBounds()
+  dst_ilower,dst_iupper = dst_app.getStepBounds()
+
+  requests = []
+  for i,layer in enumerate(model_src.parallel_nn.layer_models):
+    index = src_ilower+i
+    values = [(p.grad if grad else p).detach().cpu().clone() for p in layer.parameters()]
+    if restrict:
+      points = [index//cf] if index % cf==0 else []
+    else:
+      points = [index*cf+d for d in range(cf)]
+    for point in points:
+      requests += [comm.isend(values,dest=app.GetProc(dst_app,point),tag=point)]
+
+  last_point = dst_iupper if dst_iupper==dst_app.num_steps else dst_iupper+1
+  result = []
+  for point in range(dst_ilower,last_point):
+    source = app.GetProc(src_app,point*cf if restrict else point//cf)
+    result += comm.recv(source=source,tag=point)
+
+  for r in requests:
+    r.wait()
+  return result
+
+class TestTransferPlanMPI(unittest.TestCase):
+  def check(self,result,expect,model):
+    # rank 0 also holds the injected open and close layers
+    if MPI.COMM_WORLD.Get_rank()==0:
+      expect = expect+[p.detach().cpu() for p in model.open_nn.parameters()]
+      expect = expect+[p.detach().cpu() for p in model.close_nn.parameters()]
+    self.assertEqual(len(result),len(expect))
+    for r,e in zip(result,expect):
+      self.assertTrue(torch.equal(r.cpu(),e))
+
+  def checkGrads(self,result,expect,model):
+    if MPI.COMM_WORLD.Get_rank()==0:
+      expect = expect+[p.grad.cpu() for p in model.open_nn.parameters()]
+      expect = expect+[p.grad.cpu() for p in model.close_nn.parameters()]
+    self.assertEqual(len(result),len(expect))
+    for r,e in zip(result,expect):
+      self.assertTrue(torch.equal(r.cpu(),e))
+
+  def test_injection(self):
+    my_device,my_host = getDevice(MPI.COMM_WORLD)
+    cf = 2
+    x = torch.rand(4,3,device=my_device)
+
+    fine = Net(4*cf,offset=0.0).to(my_device)
+    coarse = Net(4,offset=0.5).to(my_device)
+    app = fine.parallel_nn.fwd_app
+
+    # run twice, the second time through the cached plans and persistent requests
+    for shift in [0.0,1000.0]:
+      fine.setValues(shift)
+      coarse.setValues(shift)
+      fine.run(x)
+      coarse.run(x)
+
+      interp = app.parallel_injection_interp_params(fine,coarse,cf=cf)
+      self.check(interp,pickled_injection(coarse,fine,cf,False,False),coarse)
+
+      restrict = app.parallel_injection_restrict_params(fine,coarse,cf=cf)
+      self.check(restrict,pickled_injection(fine,coarse,cf,True,False),fine)
+
+      params,grads = app.parallel_injection_restrict_params(fine,coarse,cf=cf,grad='both')
+      self.check(params,pickled_injection(fine,coarse,cf,True,False),fine)
+      self.checkGrads(grads,pickled_injection(fine,coarse,cf,True,True),fine)
+
+      grads = app.parallel_injection_interp_params(fine,coarse,cf=cf,grad=True)
+      self.checkGrads(grads,pickled_injection(coarse,fine,cf,False,True),coarse)
+
+    # one plan for each level pair and direction
+    self.assertEqual(len(app.transfer_plans),2)
+
+class TestOptimStateMPI(unittest.TestCase):
+  def setState(self,model,opt,scale,step):
+    # the state is a function of the parameter values, which identify the layer
+    with torch.no_grad():
+      for p in model.parameters():
+        state = opt.state[p]
+        for k,key in enumerate(['exp_avg','exp_avg_sq','momentum_buffer']):
+          if key in state:
+            state[key].copy_((scale+k)*p)
+        if 'step' in state:
+          state['step'] = torch.tensor(float(step))
+
+  def checkState(self,model,opt,values,scale,step):
+    lp_params = [p for l in model.parallel_nn.layer_models for p in l.parameters()]
+    for p,v in zip(lp_params,values):
+      state = opt.state[p]
+      for k,key in enumerate(['exp_avg','exp_avg_sq','momentum_buffer']):
+        if key in state:
+          self.assertTrue(torch.allclose(state[key].cpu(),(scale+k)*v.cpu()))
+      if step is not None:
+        self.assertEqual(float(state['step']),step)
+
+    # the opening and closing layers are copied on every rank
+    for child in [model.open_nn,model.close_nn]:
+      for p in child.parameters():
+        self.assertTrue('exp_avg' in opt.state[p] or 'momentum_buffer' in opt.state[p])
+
+  def transfer(self,make_optimizer,has_step):
+    comm = MPI.COMM_WORLD
+    cf = 2
+    x = torch.rand(4,3)
+
+    fine = Net(4*cf,offset=0.0)
+    coarse = Net(4,offset=0.5)
+    app = fine.parallel_nn.fwd_app
+    opt_fine = make_optimizer(fine)
+    opt_coarse = make_optimizer(coarse)
+
+    # take a step so the state exists, then give it known values
+    for model,opt in [(fine,opt_fine),(coarse,opt_coarse)]:
+      model.run(x)
+      opt.step()
+      model.setValues(0.0)
+    self.setState(fine,opt_fine,2.0,3+comm.Get_rank())
+    self.setState(coarse,opt_coarse,5.0,1)
+
+    # restriction, the step count is the largest over the ranks
+    tb_parallel_injection_restrict_optim_state(fine,coarse,opt_fine,opt_coarse,cf=cf)
+    restricted = app.parallel_injection_restrict_params(fine,coarse,cf=cf)
+    self.checkState(coarse,opt_coarse,restricted,2.0,2+comm.Get_size() if has_step else None)
+
+    # interpolation
+    self.setState(coarse,opt_coarse,7.0,11)
+    tb_parallel_injection_interp_optim_state(fine,coarse,opt_fine,opt_coarse,cf=cf)
+    interpolated = app.parallel_injection_interp_params(fine,coarse,cf=cf)
+    self.checkState(fine,opt_fine,interpolated,7.0,11 if has_step else None)
+
+  def test_adam(self):
+    self.transfer(lambda m: torch.optim.Adam(m.parameters(),lr=0.01),True)
+
+  def test_sgd_momentum(self):
+    self.transfer(lambda m: torch.optim.SGD(m.parameters(),lr=0.01,momentum=0.9),False)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,153 @@
+#@HEADER
+# ************************************************************************
+# 
+#                        Torchbraid v. 0.1
+# 
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC 
+# (NTESS). Under the terms of Contract DE-NA0003525 with NTESS, the U.S. 
+# Government retains certain rights in this software.
+# 
+# Torchbraid is licensed under 3-clause BSD terms of use:
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# 
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# 
+# 3. Neither the name National Technology & Engineering Solutions of Sandia, 
+# LLC nor the names of the contributors may be used to endorse or promote 
+# products derived from this software without specific prior written permission.
+# 
+# Questions? Contact Eric C. Cyr (eccyr@sandia.gov)
+# 
+# ************************************************************************
+#@HEADER
+
+import os
+import torch
+import tempfile
+import unittest
+
+from torchbraid.utils import WarmStartStorage
+
+class TestWarmStartStorage(unittest.TestCase):
+  def test_init(self):
+    storage = WarmStartStorage(10,3,0.5)
+    self.assertEqual(storage.max_samples,10)
+    self.assertEqual(storage.getStoredCount(),0)
+
+    storage.setIndices([0,1])
+    self.assertTrue(storage.getState(0.5) is None)
+
+    with self.assertRaises(AssertionError) as ctx:
+      WarmStartStorage(0,3,0.5)
+    with self.assertRaises(AssertionError) as ctx:
+      WarmStartStorage(10,0,0.5)
+    with self.assertRaises(AssertionError) as ctx:
+      WarmStartStorage(10,3,0.0)
+
+  def test_add_get_state(self):
+    dt = 0.25
+    times = [dt,2*dt]
+    states = [(i+torch.rand(4,3,2),torch.rand(4,5)) for i in range(len(times))]
+    indices = [7,2,9,4]
+
+    storage = WarmStartStorage(10,2,dt)
+    storage.addStates(times,states,indices)
+    self.assertEqual(storage.getStoredCount(),4)
+
+    # same batch in a different order
+    order = [2,0,3,1]
+    storage.setIndices([indices[i] for i in order])
+    for t,state in zip(times,states):
+      result = storage.getState(t)
+      self.assertEqual(len(result),2)
+      for r,s in zip(result,state):
+        self.assertEqual(r.shape,s.shape)
+        self.assertTrue(torch.equal(r,s[order]))
+
+    # unknown time
+    self.assertTrue(storage.getState(3*dt) is None)
+
+    # samples not stored get the mean of those that are
+    storage.setIndices([7,1,2])
+    result = storage.getState(dt)
+    self.assertTrue(torch.equal(result[0][0],states[0][0][0]))
+    self.assertTrue(torch.equal(result[0][2],states[0][0][1]))
+    self.assertTrue(torch.allclose(result[0][1],0.5*(states[0][0][0]+states[0][0][1])))
+
+    # no sample stored
+    storage.setIndices([0,1])
+    self.assertTrue(storage.getState(dt) is None)
+
+  def test_clear_indices(self):
+    dt = 0.5
+    state = torch.rand(4,3)
+    storage = WarmStartStorage(10,1,dt)
+
+    storage.setIndices([0,1,2,3])
+    storage.addStates([dt],[state])
+    storage.clearIndices()
+
+    # no guess for a batch without indices
+    self.assertTrue(storage.getState(dt) is None)
+
+    # an evaluation batch of a different size
+    storage.setIndices([3,1])
+    result = storage.getState(dt)[0]
+    self.assertEqual(result.shape,(2,3))
+    self.assertTrue(torch.equal(result,state[[3,1]]))
+
+    with self.assertRaises(AssertionError) as ctx:
+      storage.clearIndices()
+      storage.addStates([dt],[state])
+
+  def test_lru(self):
+    dt = 1.0
+    storage = WarmStartStorage(10,1,dt,max_samples=3)
+
+    storage.addStates([dt],[torch.ones(3,2)],[0,1,2])
+    storage.setIndices([0])  # 0 is now the most recently used
+    storage.addStates([dt],[2.0*torch.ones(2,2)],[3,4])
+
+    self.assertEqual(storage.getStoredCount(),3)
+    self.assertEqual(set(storage.slots.keys()),{0,3,4})
+
+    storage.setIndices([1,2])
+    self.assertTrue(storage.getState(dt) is None)
+
+    storage.setIndices([0,3])
+    result = storage.getState(dt)[0]
+    self.assertTrue(torch.equal(result,torch.tensor([[1.,1.],[2.,2.]])))
+
+    with self.assertRaises(AssertionError) as ctx:
+      storage.addStates([dt],[torch.ones(4,2)],[5,6,7,8])
+
+  def test_memmap_half(self):
+    dt = 0.5
+    state = torch.rand(3,4,dtype=torch.float64)
+
+    with tempfile.TemporaryDirectory() as dirname:
+      filename = os.path.join(dirname,'warm_start')
+      storage = WarmStartStorage(5,2,dt,dtype=torch.float16,filename=filename)
+      storage.addStates([dt],[state],[0,1,2])
+      storage.flush()
+
+      self.assertTrue(os.path.exists(filename+'.0'))
+      self.assertEqual(storage.arrays[0].dtype,torch.float16)
+
+      storage.setIndices([0,1,2])
+      result = storage.getState(dt)[0]
+
+      # returned in the type of the state, with float16 precision
+      self.assertEqual(result.dtype,torch.float64)
+      self.assertTrue(torch.allclose(result,state,atol=1e-3))
+
+if __name__ == '__main__':
+  unittest.main()